@@ -0,0 +1,350 @@
+import json
+import math
+import os
+from datetime import timedelta
+
+from sqlalchemy import text
+
+from coordination import JOB_ROWS
+from variables import NAMES
+
+# ============================================================================
+# RULES
+# ============================================================================
+# A rule raises an alert once `variable` stays >= `on` for `min_hours`
+# consecutive hourly readings (a missing or skipped hour restarts the count),
+# and clears it only when the value drops below `off` (hysteresis: readings
+# between `off` and `on` keep the alert open).
+DEFAULT_RULES = [
+    {'name': 'pm10_warning', 'variable': 'pm10', 'level': 'Warning', 'on': 50, 'off': 40, 'min_hours': 1},
+    {'name': 'pm10_critical', 'variable': 'pm10', 'level': 'Critical', 'on': 100, 'off': 80, 'min_hours': 1},
+    {'name': 'pm2_5_warning', 'variable': 'pm2_5', 'level': 'Warning', 'on': 25, 'off': 20, 'min_hours': 1},
+    {'name': 'pm2_5_critical', 'variable': 'pm2_5', 'level': 'Critical', 'on': 50, 'off': 40, 'min_hours': 1},
+    {'name': 'calima', 'variable': 'dust', 'level': 'Warning', 'on': 100, 'off': 60, 'min_hours': 3},
+]
+
+RULE_KEYS = ('name', 'variable', 'level', 'on', 'off', 'min_hours')
+LEVELS = ('Normal', 'Warning', 'Critical')
+
+def load_rules(path=None):
+    """Alert rules from the JSON list at `path` / $ALERT_RULES_FILE, or DEFAULT_RULES"""
+    path = path or os.getenv('ALERT_RULES_FILE')
+    if not path:
+        return [dict(rule) for rule in DEFAULT_RULES]
+    with open(path) as f:
+        rules = json.load(f)
+    for rule in rules:
+        missing = [key for key in RULE_KEYS if key not in rule]
+        if missing:
+            raise ValueError(f"Alert rule {rule.get('name', '?')} is missing {missing}")
+        if rule['level'] not in LEVELS[1:]:
+            raise ValueError(f"Alert rule {rule['name']}: level must be Warning or Critical")
+        if rule['variable'] not in NAMES:
+            raise ValueError(f"Alert rule {rule['name']}: variable {rule['variable']} is not in the variable catalog")
+        if rule['off'] > rule['on']:
+            raise ValueError(f"Alert rule {rule['name']}: off ({rule['off']}) must not exceed on ({rule['on']})")
+    return rules
+
+RULES = load_rules()
+
+def status_bands(rules=RULES):
+    """{variable: (warning, critical)} entry thresholds, for the status panel"""
+    bands = {}
+    for variable in {rule['variable'] for rule in rules}:
+        levels = {rule['level']: rule['on'] for rule in rules if rule['variable'] == variable}
+        warning = levels.get('Warning', levels.get('Critical'))
+        bands[variable] = (warning, levels.get('Critical', math.inf))
+    return bands
+
+def thresholds(rules=RULES):
+    """Lowest entry threshold per variable, drawn on the time series figure"""
+    lowest = {}
+    for rule in rules:
+        lowest[rule['variable']] = min(rule['on'], lowest.get(rule['variable'], math.inf))
+    return lowest
+
+# ============================================================================
+# SCHEMA
+# ============================================================================
+# estado_alertas holds one row per (rule, station) so each ETL batch resumes
+# where the previous one stopped; eventos_alerta is the episode history
+# (ended_at IS NULL while an alert is open).
+ALERTS_DDL = """
+    CREATE TABLE IF NOT EXISTS eventos_alerta (
+        id SERIAL PRIMARY KEY,
+        rule VARCHAR(64) NOT NULL,
+        variable VARCHAR(16) NOT NULL,
+        level VARCHAR(10) NOT NULL,
+        station_id INTEGER NOT NULL REFERENCES estaciones(id),
+        threshold FLOAT NOT NULL,
+        started_at TIMESTAMP NOT NULL,
+        ended_at TIMESTAMP,
+        peak FLOAT,
+        peak_fecha TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_eventos_alerta_abiertos
+        ON eventos_alerta (station_id) WHERE ended_at IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_eventos_alerta_inicio
+        ON eventos_alerta (started_at DESC);
+    CREATE TABLE IF NOT EXISTS estado_alertas (
+        rule VARCHAR(64) NOT NULL,
+        station_id INTEGER NOT NULL REFERENCES estaciones(id),
+        last_fecha TIMESTAMP,
+        candidate_since TIMESTAMP,
+        peak FLOAT,
+        peak_fecha TIMESTAMP,
+        event_id INTEGER REFERENCES eventos_alerta(id),
+        PRIMARY KEY (rule, station_id)
+    );
+"""
+
+def ensure_alerts(conn):
+    """Create the alert tables (idempotent). The caller commits."""
+    conn.execute(text(ALERTS_DDL))
+
+# ============================================================================
+# INCREMENTAL EVALUATION
+# ============================================================================
+def new_state():
+    return {'last_fecha': None, 'candidate_since': None, 'peak': None, 'peak_fecha': None, 'event_id': None}
+
+def step_rule(rule, state, fechas, values):
+    """Advance one (rule, station) state machine over new readings, in time order.
+
+    An episode opens after `min_hours` consecutive hourly readings >= `on`: a
+    missing value or a skipped hour restarts the count, while an open episode
+    ignores them and only closes on a reading below `off`. Returns (episodes,
+    current): the episodes this batch touched ('opened' if new here, ended_at
+    None while open) and the one still open, if any. `state` is updated in
+    place.
+    """
+    episodes = []
+    current = None
+    if state['event_id'] is not None:
+        current = {'event_id': state['event_id'], 'opened': False, 'started_at': state['candidate_since'],
+                   'ended_at': None, 'peak': state['peak'], 'peak_fecha': state['peak_fecha']}
+        episodes.append(current)
+    min_span = timedelta(hours=rule['min_hours'] - 1)
+    hour = timedelta(hours=1)
+
+    for fecha, value in zip(fechas, values):
+        previous, state['last_fecha'] = state['last_fecha'], fecha
+        missing = value is None or value != value
+        if current is None and state['candidate_since'] is not None and (missing or fecha - previous != hour):
+            state.update(candidate_since=None, peak=None, peak_fecha=None)
+        if missing:
+            continue
+
+        if current is not None:
+            if value > current['peak']:
+                current['peak'], current['peak_fecha'] = value, fecha
+            if value < rule['off']:
+                current['ended_at'] = fecha
+                current = None
+                state.update(candidate_since=None, peak=None, peak_fecha=None, event_id=None)
+            continue
+
+        if value < rule['on']:
+            state.update(candidate_since=None, peak=None, peak_fecha=None)
+            continue
+
+        if state['candidate_since'] is None:
+            state.update(candidate_since=fecha, peak=value, peak_fecha=fecha)
+        elif value > state['peak']:
+            state.update(peak=value, peak_fecha=fecha)
+        if fecha - state['candidate_since'] >= min_span:
+            current = {'event_id': None, 'opened': True, 'started_at': state['candidate_since'], 'ended_at': None,
+                       'peak': state['peak'], 'peak_fecha': state['peak_fecha']}
+            episodes.append(current)
+
+    if current is not None:
+        state.update(peak=current['peak'], peak_fecha=current['peak_fecha'])
+    return episodes, current
+
+def _save_episodes(conn, rule, station_id, episodes, state, current):
+    for episode in episodes:
+        params = {k: episode[k] for k in ('event_id', 'started_at', 'ended_at', 'peak', 'peak_fecha')}
+        if episode['event_id'] is None:
+            episode['event_id'] = conn.execute(text("""
+                INSERT INTO eventos_alerta (rule, variable, level, station_id, threshold,
+                                            started_at, ended_at, peak, peak_fecha)
+                VALUES (:rule, :variable, :level, :station_id, :threshold,
+                        :started_at, :ended_at, :peak, :peak_fecha)
+                RETURNING id
+            """), {'rule': rule['name'], 'variable': rule['variable'], 'level': rule['level'],
+                   'station_id': station_id, 'threshold': rule['on'], **params}).scalar()
+        else:
+            conn.execute(text("""
+                UPDATE eventos_alerta
+                SET ended_at = :ended_at, peak = :peak, peak_fecha = :peak_fecha,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = :event_id
+            """), params)
+    if current is not None:
+        state['event_id'] = current['event_id']
+
+def _rewind(conn, rule, station_id, state, since):
+    """Move a (rule, station) back to its last idle point before `since`, where older readings arrived late.
+
+    The rule is idle (no candidate, no open episode) before the first reading
+    of an episode and after a reading below `on` outside episodes. It resumes
+    after the latest such point: the reading before the episode under way at
+    `since`, else the last reading below `on` since the previous episode
+    ended. Episodes from there on are deleted for the replay to rebuild;
+    returns their {started_at: ended_at}. `state` is reset in place.
+    """
+    params = {'rule': rule['name'], 'station_id': station_id, 'since': since, 'on': rule['on']}
+    previous = conn.execute(text("""
+        SELECT started_at, ended_at FROM eventos_alerta
+        WHERE rule = :rule AND station_id = :station_id AND started_at <= :since
+        ORDER BY started_at DESC
+        LIMIT 1
+    """), params).first()
+    if previous is not None and (previous.ended_at is None or previous.ended_at >= since):
+        first = previous.started_at
+        after = conn.execute(text("""
+            SELECT MAX(fecha) FROM mediciones_aire WHERE station_id = :station_id AND fecha < :first
+        """), {**params, 'first': first}).scalar()
+    else:
+        after = conn.execute(text(f"""
+            SELECT MAX(fecha) FROM mediciones_aire
+            WHERE station_id = :station_id AND fecha < :since AND {rule['variable']} < :on
+              {'' if previous is None else 'AND fecha >= :ended_at'}
+        """), {**params, 'ended_at': None if previous is None else previous.ended_at}).scalar()
+        if after is None and previous is not None:
+            after = previous.ended_at  # Its raw rows are gone (retention); the rule was idle there anyway
+        first = None
+
+    conn.execute(text("""
+        UPDATE estado_alertas SET event_id = NULL WHERE rule = :rule AND station_id = :station_id
+    """), params)
+    replaced = conn.execute(text(f"""
+        DELETE FROM eventos_alerta
+        WHERE rule = :rule AND station_id = :station_id
+          {'AND started_at >= :first' if first is not None else '' if after is None else 'AND started_at > :after'}
+        RETURNING started_at, ended_at
+    """), {**params, 'first': first, 'after': after}).all()
+    state.update(new_state(), last_fecha=after)
+    return dict(replaced)
+
+def evaluate_alerts(conn, rules=None, station_ids=None, job_ids=()):
+    """Run every rule over the readings each station received since its last evaluation.
+
+    Only rows newer than the stored `last_fecha` are read (through the
+    (station_id, fecha) unique index), so each ETL batch costs its own size;
+    the first run backfills the whole history. `job_ids` are the queue jobs
+    not processed yet (coordination.pending_jobs): where one of them loaded
+    hours older than a rule's `last_fecha` (a backfill, or a chunk another
+    worker committed late) the rule is rewound and replayed over them.
+    Returns the episodes opened or closed, for the ETL log and notifiers. The
+    caller commits.
+    """
+    rules = rules or RULES
+    ensure_alerts(conn)
+    if station_ids is None:
+        station_ids = [row[0] for row in conn.execute(text("SELECT id FROM estaciones ORDER BY id"))]
+    loaded = dict(conn.execute(text(f"""
+        SELECT m.station_id, MIN(m.fecha)
+        {JOB_ROWS}
+        GROUP BY m.station_id
+    """), {'job_ids': list(job_ids)}).all()) if job_ids else {}
+
+    variables = sorted({rule['variable'] for rule in rules})
+    stored = {}
+    for row in conn.execute(text("""
+        SELECT rule, station_id, last_fecha, candidate_since, peak, peak_fecha, event_id
+        FROM estado_alertas
+    """)).mappings():
+        stored[(row['rule'], row['station_id'])] = {k: row[k] for k in new_state()}
+
+    changes = []
+    for station_id in station_ids:
+        states = {rule['name']: stored.get((rule['name'], station_id), new_state()) for rule in rules}
+        replaced = {}
+        earliest = loaded.get(station_id)
+        for rule in rules:
+            state = states[rule['name']]
+            if earliest is not None and state['last_fecha'] is not None and earliest <= state['last_fecha']:
+                replaced[rule['name']] = _rewind(conn, rule, station_id, state, earliest)
+        seen = [s['last_fecha'] for s in states.values()]
+        since = None if None in seen else min(seen)
+
+        rows = conn.execute(text(f"""
+            SELECT fecha, {', '.join(variables)}
+            FROM mediciones_aire
+            WHERE station_id = :station_id {'' if since is None else 'AND fecha > :since'}
+            ORDER BY fecha
+        """), {'station_id': station_id, 'since': since}).all()
+        if not rows:
+            continue
+        columns = dict(zip(('fecha', *variables), zip(*rows)))
+
+        for rule in rules:
+            state = states[rule['name']]
+            fechas, values = columns['fecha'], columns[rule['variable']]
+            if state['last_fecha'] is not None and state['last_fecha'] != since:
+                start = next((i for i, f in enumerate(fechas) if f > state['last_fecha']), len(fechas))
+                fechas, values = fechas[start:], values[start:]
+            if not fechas:
+                continue
+
+            episodes, current = step_rule(rule, state, fechas, values)
+            _save_episodes(conn, rule, station_id, episodes, state, current)
+            conn.execute(text("""
+                INSERT INTO estado_alertas (rule, station_id, last_fecha, candidate_since, peak, peak_fecha, event_id)
+                VALUES (:rule, :station_id, :last_fecha, :candidate_since, :peak, :peak_fecha, :event_id)
+                ON CONFLICT (rule, station_id) DO UPDATE SET
+                    last_fecha = EXCLUDED.last_fecha, candidate_since = EXCLUDED.candidate_since,
+                    peak = EXCLUDED.peak, peak_fecha = EXCLUDED.peak_fecha, event_id = EXCLUDED.event_id
+            """), {'rule': rule['name'], 'station_id': station_id, **state})
+            # A replayed episode is only news if the late readings changed it
+            before = replaced.get(rule['name'], {})
+            for e in episodes:
+                if e['started_at'] in before:
+                    e['opened'] = False
+                    changed = before[e['started_at']] != e['ended_at']
+                else:
+                    changed = e['opened'] or e['ended_at'] is not None
+                if changed:
+                    changes.append(dict(e, rule=rule['name'], level=rule['level'], station_id=station_id))
+    return changes
+
+# ============================================================================
+# READS (dashboard / notifiers)
+# ============================================================================
+ALERT_COLUMNS = """e.id, e.rule, e.variable, e.level, e.station_id, s.codigo, s.nombre,
+                   e.threshold, e.started_at, e.ended_at, e.peak, e.peak_fecha"""
+
+def active_alerts(conn, station_ids=None):
+    """Open episodes (partial index on ended_at IS NULL), most severe first"""
+    where = "" if station_ids is None else "AND e.station_id = ANY(:station_ids)"
+    return [dict(row) for row in conn.execute(text(f"""
+        SELECT {ALERT_COLUMNS}
+        FROM eventos_alerta e JOIN estaciones s ON s.id = e.station_id
+        WHERE e.ended_at IS NULL {where}
+        ORDER BY e.level = 'Critical' DESC, e.started_at
+    """), {'station_ids': list(station_ids or [])}).mappings()]
+
+def recent_events(conn, limit=50, rule=None, station_ids=None):
+    """Latest episodes, open or closed (e.g. rule='calima' for dust episodes)"""
+    conditions, params = [], {'limit': int(limit)}
+    if rule is not None:
+        conditions.append("e.rule = :rule")
+        params['rule'] = rule
+    if station_ids is not None:
+        conditions.append("e.station_id = ANY(:station_ids)")
+        params['station_ids'] = list(station_ids)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return [dict(row) for row in conn.execute(text(f"""
+        SELECT {ALERT_COLUMNS}
+        FROM eventos_alerta e JOIN estaciones s ON s.id = e.station_id
+        {where}
+        ORDER BY e.started_at DESC
+        LIMIT :limit
+    """), params).mappings()]
+
+def alert_status(alerts, variable):
+    """Highest level among the open `alerts` on `variable` (Normal if none)"""
+    levels = [a['level'] for a in alerts if a['variable'] == variable]
+    return max(levels, key=LEVELS.index, default="Normal")
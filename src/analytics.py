@@ -0,0 +1,119 @@
+import numpy as np
+from sqlalchemy import text
+
+from variables import KNOWN
+
+INDICATOR_COLUMNS = KNOWN
+
+# ============================================================================
+# VECTORIZED INDICATORS (in-memory series)
+# ============================================================================
+def rolling_mean(values, window):
+    """Trailing mean over `window` samples in one cumulative-sum pass.
+
+    Like pandas' rolling(window).mean(): NaN until the window is full or while
+    it contains a missing value.
+    """
+    values = np.asarray(values, dtype=float)
+    out = np.full(values.shape, np.nan)
+    if window < 1 or len(values) < window:
+        return out
+
+    valid = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    window_sums = sums[window:] - sums[:-window]
+    window_counts = counts[window:] - counts[:-window]
+    out[window - 1:] = np.where(window_counts == window, window_sums / window, np.nan)
+    return out
+
+def compute_indicators(values, window=6):
+    """Rolling average, volatility, trend and lag-1 autocorrelation of an ascending series.
+
+    - rolling_avg: mean of the last `window` samples
+    - volatility: std of sample-to-sample % changes (×100)
+    - trend: least-squares slope per sample (×100)
+    - autocorr: Pearson correlation between consecutive samples
+    """
+    x = np.asarray(values, dtype=float)
+    n = len(x)
+    result = {'samples': n, 'rolling_avg': np.nan, 'volatility': np.nan,
+              'trend': np.nan, 'autocorr': np.nan}
+    if n < 2:
+        return result
+
+    result['rolling_avg'] = rolling_mean(x, min(window, n))[-1]
+
+    previous, current = x[:-1], x[1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct = (current - previous) / previous
+    pct = pct[np.isfinite(pct)]
+    if len(pct) > 1:
+        result['volatility'] = pct.std(ddof=1) * 100
+
+    valid = ~np.isnan(x)
+    if valid.sum() > 1:
+        idx = np.flatnonzero(valid).astype(float)
+        y = x[valid]
+        idx_dev = idx - idx.mean()
+        result['trend'] = (idx_dev * (y - y.mean())).sum() / (idx_dev ** 2).sum() * 100
+
+    pairs = ~np.isnan(previous) & ~np.isnan(current)
+    if pairs.sum() > 1:
+        a, b = previous[pairs], current[pairs]
+        if a.std() > 0 and b.std() > 0:
+            result['autocorr'] = np.corrcoef(a, b)[0, 1]
+
+    return result
+
+# ============================================================================
+# SQL INDICATORS (any range of the full history)
+# ============================================================================
+def query_indicators(conn, column='pm10', window=6, start=None, end=None, station_ids=None):
+    """Same indicators as compute_indicators, computed by Postgres over a fecha range.
+
+    One index range scan: the hourly mean over `station_ids` (all stations if
+    None) feeds LAG/ROW_NUMBER window functions and the STDDEV/REGR_SLOPE/CORR
+    aggregates, so no rows leave the database.
+    """
+    if column not in INDICATOR_COLUMNS:
+        raise ValueError(f"Unknown indicator column '{column}'")
+
+    conditions = []
+    params = {'window': int(window)}
+    if start is not None:
+        conditions.append("fecha >= :start")
+        params['start'] = start
+    if end is not None:
+        conditions.append("fecha < :end")
+        params['end'] = end
+    if station_ids is not None:
+        conditions.append("station_id = ANY(:station_ids)")
+        params['station_ids'] = list(station_ids)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    row = conn.execute(text(f"""
+        WITH horas AS (
+            SELECT fecha, AVG({column}) AS valor
+            FROM mediciones_aire
+            {where}
+            GROUP BY fecha
+        ),
+        serie AS (
+            SELECT fecha,
+                   valor,
+                   LAG(valor) OVER (ORDER BY fecha) AS anterior,
+                   ROW_NUMBER() OVER (ORDER BY fecha) AS n
+            FROM horas
+        )
+        SELECT COUNT(*) AS samples,
+               (SELECT AVG(valor) FROM (
+                    SELECT valor FROM serie ORDER BY fecha DESC LIMIT :window
+               ) ultimas) AS rolling_avg,
+               STDDEV_SAMP((valor - anterior) / NULLIF(anterior, 0)) * 100 AS volatility,
+               REGR_SLOPE(valor, n) * 100 AS trend,
+               CORR(valor, anterior) AS autocorr
+        FROM serie
+    """), params).mappings().one()
+
+    return {key: (np.nan if value is None else float(value)) for key, value in row.items()}
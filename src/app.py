@@ -1,15 +1,26 @@
+import time
+SCRIPT_START = time.perf_counter()  # Cold start timings are measured from here
 import streamlit as st
 import pandas as pd
-import numpy as np
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
 import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
-from scipy import stats
+import threading
 import warnings
 import os
 from dotenv import load_dotenv
+from profiling import monitor, tracked_cache, capture
+from database import pool_status, pin_psycopg2, STATEMENT_TIMEOUT_MS
+from analytics import compute_indicators
+from data_pipeline import AirQualityDataPipeline, rows_since
+from visualizations import EngineeringVisualizations
+from data_quality import calculate_data_quality, detect_outliers
+from stations import REGIONS
+from interpolation import interpolate_surfaces
+from alerts import alert_status
+from etl_runner import EtlRunner
+from etl_fast import STAGES
+from variables import CORE_VARIABLES, label
+monitor.record_once('startup', 'imports', time.perf_counter() - SCRIPT_START)
 load_dotenv()
 warnings.filterwarnings('ignore')
 
@@ -224,34 +235,6 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# ============================================================================
-# DATABASE ENGINE & DATA PIPELINE
-# ============================================================================
-class AirQualityDataPipeline:
-    """Professional Data Pipeline for Air Quality Monitoring"""
-    
-    def __init__(self, connection_string):
-        self.engine = create_engine(connection_string)
-        
-    @st.cache_data(ttl=300, show_spinner="Executing SQL Query...")
-    def execute_query(_self, query, params=None):
-        """Execute parameterized SQL query with caching"""
-        try:
-            with _self.engine.connect() as conn:
-                if params:
-                    df = pd.read_sql_query(text(query), conn, params=params)
-                else:
-                    df = pd.read_sql_query(text(query), conn)
-                return df
-        except Exception as e:
-            st.error(f"Query Execution Error: {str(e)}")
-            return pd.DataFrame()
-    
-    def get_all_data(self, limit=10000):
-        """Get all data with limit"""
-        query = f"SELECT * FROM mediciones_aire ORDER BY fecha DESC LIMIT {limit}"
-        return self.execute_query(query)
-
 # ============================================================================
 # INITIALIZATION (CLOUD VS LOCAL LOGIC ROBUSTA)
 # ============================================================================
@@ -278,514 +261,752 @@ def get_db_connection():
 
 # Inicializar Pipeline
 try:
-    CURRENT_CONNECTION = get_db_connection()
-    pipeline = AirQualityDataPipeline(CURRENT_CONNECTION)
+    CURRENT_CONNECTION = pin_psycopg2(get_db_connection())  # Also what the ETL runner writes to
+    pipeline = AirQualityDataPipeline(CURRENT_CONNECTION, service_url=os.getenv('QUERY_SERVICE_URL'))
 except Exception as e:
     st.error(f"Critical Connection Error: {e}")
     st.stop()
 
 # ============================================================================
-# ENGINEERING VISUALIZATION COMPONENTS - CORREGIDO
+# BACKGROUND WARM-UP
+# ============================================================================
+def warm_caches():
+    """Load the deferred modules and the default view's queries off the render path"""
+    with monitor.timer('startup', 'warmup'):
+        import scipy.stats, scipy.spatial, plotly.express, plotly.subplots, pydeck  # noqa: F401
+        try:
+            stations = pipeline.get_stations(next(iter(REGIONS)))
+            snapshot = pipeline.get_snapshot()
+            pipeline.get_dataset(snapshot['data_version'] if snapshot else None, 5000,
+                                 tuple(int(i) for i in stations['id']))
+        except Exception:
+            pass  # Only a warm-up: the session that needs the data reports the error
+
+@st.cache_resource(show_spinner=False)
+def start_warmup():
+    """Start warm_caches() once per process, after the first session painted its headline"""
+    thread = threading.Thread(target=warm_caches, name="cache-warmup", daemon=True)
+    thread.start()
+    return thread
+
+# ============================================================================
+# BACKGROUND ETL
 # ============================================================================
-class EngineeringVisualizations:
-    """Professional Engineering Visualizations"""
+ETL_STAGE_LABELS = {
+    'schema': "Schema & stations",
+    'load': "Download & COPY (queued chunks)",
+    'climatology': "Climatology & anomalies",
+    'alerts': "Alert rules",
+    'forecasts': "Forecasts",
+    'rollups': "Daily rollups",
+    'snapshot': "Metrics snapshot",
+    'report': "Static report"
+}
+# Order and count come from the pipeline itself, so the progress bar cannot drift from it
+ETL_STAGES = {stage: ETL_STAGE_LABELS.get(stage, stage.capitalize()) for stage in STAGES}
+
+def invalidate_after_load():
+    """Drop only the caches a load makes stale.
     
-    @staticmethod
-    def create_timeseries_engineering(df, title="Time Series Analysis"):
-        """Create professional time series plot with engineering annotations"""
-        df = df.sort_values('fecha')
-        
-        fig = make_subplots(
-            rows=3, cols=1,
-            shared_xaxes=True,
-            vertical_spacing=0.08,
-            subplot_titles=("PM10 Concentration", "PM2.5 Concentration", "Dust Particles"),
-            row_heights=[0.4, 0.3, 0.3]
-        )
-        
-        # PM10
-        window = min(12, len(df))
-        if window > 1:
-            df['pm10_ma'] = df['pm10'].rolling(window=window).mean()
-        
-        fig.add_trace(
-            go.Scatter(x=df['fecha'], y=df['pm10'], 
-                      name='PM10', line=dict(color='#4299e1', width=2),
-                      mode='lines', fill='tozeroy',
-                      fillcolor='rgba(66, 153, 225, 0.1)'),
-            row=1, col=1
-        )
-        
-        if window > 1 and 'pm10_ma' in df:
-            fig.add_trace(
-                go.Scatter(x=df['fecha'], y=df['pm10_ma'],
-                          name=f'MA{window}', line=dict(color='#ecc94b', width=1.5, dash='dash')),
-                row=1, col=1
-            )
-        
-        # PM2.5
-        fig.add_trace(
-            go.Scatter(x=df['fecha'], y=df['pm2_5'],
-                      name='PM2.5', line=dict(color='#38b2ac', width=2)),
-            row=2, col=1
-        )
-        
-        # Dust
-        fig.add_trace(
-            go.Scatter(x=df['fecha'], y=df['dust'],
-                      name='Dust', line=dict(color='#ed8936', width=2)),
-            row=3, col=1
-        )
+    The dataset, indicators, forecasts, figures and surfaces are keyed by the
+    snapshot's data_version, so a fresh snapshot moves them to new keys by
+    itself; the rest are the unversioned reads the ETL can change, including
+    the ad-hoc query cache behind the raw readings.
+    """
+    for cached in (pipeline.get_snapshot, pipeline.get_alerts, pipeline.get_stations, pipeline.get_variables,
+                   pipeline.execute_query):
+        cached.clear()
+
+@st.cache_resource(show_spinner=False)
+def get_etl_runner():
+    """One runner per process: every session sees, and joins, the same run"""
+    return EtlRunner(CURRENT_CONNECTION, on_success=invalidate_after_load)
+
+@st.fragment(run_every=1)
+def render_etl_progress(runner):
+    """Poll the running job; rerun the whole page once its data is in"""
+    state = runner.state()
+    if state['status'] != 'running':
+        st.rerun()
+    stage = list(ETL_STAGES)[min(len(state['stages']), len(ETL_STAGES) - 1)]
+    st.progress(len(state['stages']) / len(ETL_STAGES),
+                text=f"ETL run #{state['run']}: {ETL_STAGES[stage]}… ({time.time() - state['started_at']:.0f}s)")
+    if state['counts']:
+        st.caption(" | ".join(f"{name.replace('_', ' ')}: {value:,}" for name, value in state['counts'].items()))
+
+def render_etl_control():
+    """Start the ETL in the background, or follow the run already in progress"""
+    runner = get_etl_runner()
+    if st.button("Run ETL Job Now", disabled=runner.running):
+        if not runner.start():
+            st.info("An ETL run is already in progress; following it.")
+    
+    state = runner.state()
+    if state['status'] == 'running':
+        render_etl_progress(runner)
+    elif state['status'] == 'done':
+        st.success(f"ETL run #{state['run']} completed in {state['finished_at'] - state['started_at']:.1f}s: "
+                   f"{state['counts'].get('new_rows', 0):,} new rows.")
+        st.dataframe(pd.DataFrame(state['stages'], columns=['stage', 'seconds']), hide_index=True)
+    elif state['status'] == 'failed':
+        st.error(f"ETL run #{state['run']} failed: {state['error']}")
+
+# ============================================================================
+# CACHED FIGURES & INDICATORS
+# ============================================================================
+def dataset_version(df):
+    """Fingerprint of a loaded frame: changes whenever rows are added, dropped or re-windowed"""
+    if df.empty:
+        return "empty"
+    return f"{len(df)}:{int(df['id'].max())}:{df['fecha'].min()}:{df['fecha'].max()}"
+
+@tracked_cache(st.cache_data(max_entries=64, show_spinner=False), name="window_indicators")
+def window_indicators(data_version, column, window, _df=None):
+    """Indicators of the loaded window (one NumPy pass), cached by data version"""
+    # The frame is sorted newest first; a reversed view is ascending without a copy
+    return compute_indicators(_df[column].to_numpy()[::-1], window)
+
+@tracked_cache(st.cache_resource(max_entries=64, ttl=3600, show_spinner=False), name="get_cached_figure")
+def get_cached_figure(builder, data_version, view=(), overlay_key=(), _df=None, _overlays=None):
+    """Build a figure once per (builder, data version, view parameters) and share it.
+    
+    The frame itself is excluded from the cache key (leading underscore): the data
+    version already identifies it, so a hit costs a dict lookup instead of hashing
+    the frame, rebuilding the traces and re-validating the figure. Overlay frames
+    passed to the builder (`_overlays`) are likewise identified by `overlay_key`,
+    the ETL version and options they were read with.
+    """
+    with monitor.timer('figure', builder):
+        return getattr(EngineeringVisualizations, builder)(_df, **dict(view), **(_overlays or {}))
+
+@tracked_cache(st.cache_resource(max_entries=16, ttl=3600, show_spinner="Interpolating surfaces..."), name="get_surfaces")
+def get_surfaces(region, variable, hours, data_version):
+    """IDW surfaces for every hour of the window, computed in one vectorized pass.
+    
+    Cached per table data version, so scrubbing through time only indexes the
+    precomputed (hours × cells) stack.
+    """
+    stations = pipeline.get_stations(region)
+    snapshot = pipeline.get_snapshot()
+    if stations.empty or not snapshot or snapshot['fecha_max'] is None:
+        return None
+    
+    start = pd.Timestamp(snapshot['fecha_max']) - timedelta(hours=hours - 1)
+    readings = pipeline.get_station_readings(tuple(stations['id']), start)
+    if readings.empty:
+        return None
+    
+    # astype(float): a variable with no readings yet in the window comes back as None objects
+    wide = readings.pivot(index='fecha', columns='station_id', values=variable).reindex(columns=stations['id']).astype(float)
+    with monitor.timer('figure', 'interpolate_surfaces'):
+        surfaces = interpolate_surfaces(stations['lon'].to_numpy(), stations['lat'].to_numpy(),
+                                        wide.to_numpy(), REGIONS[region])
+    surfaces.update(fechas=wide.index, readings=wide.to_numpy(), stations=stations)
+    return surfaces
+
+# ============================================================================
+# MONITORING FUNCTIONS
+# ============================================================================
+def cache_status():
+    """Hit rate of the query cache since the process started"""
+    for row in monitor.cache_stats():
+        if row['function'] == 'execute_query':
+            return f"{row['hit_rate']:.0f}% hits ({row['hits']}/{row['hits'] + row['misses']})"
+    return "Cold"
+
+# ============================================================================
+# MAIN DASHBOARD
+# ============================================================================
+TIME_RANGES = {
+    "Last 24 Hours": timedelta(hours=24),
+    "Last 7 Days": timedelta(days=7),
+    "Last 30 Days": timedelta(days=30),
+    "All Data": None
+}
+
+@st.fragment
+@monitor.timed('panel')
+def render_timeseries_tab(df, data_version, station_ids=None):
+    """Time series figure, the ETL's precomputed forecasts and derived indicators"""
+    st.markdown("### ENGINEERING TIME SERIES ANALYSIS")
+    
+    fc_col, normal_col = st.columns([3, 1])
+    with fc_col:
+        horizon = st.selectbox("Forecast Horizon (h)", ["Off", 24, 48, 72], index=1, key="forecast_horizon")
+    with normal_col:
+        show_normal = st.toggle("vs. Normal", value=False, key="show_normal",
+                                help="Usual level for each hour of day and month (ETL climatology), ±1 std")
+    snapshot = pipeline.get_snapshot()
+    snapshot_version = snapshot['data_version'] if snapshot else None
+    # Both overlays are independent queries: fetched together, they cost the slower of the two
+    overlays = {}
+    if horizon != "Off":
+        overlays['forecast'] = (pipeline.get_forecasts, snapshot_version, station_ids, horizon)
+    if show_normal:
+        overlays['normal'] = (pipeline.get_climatology, snapshot_version, station_ids)
+    if overlays:
+        overlays = pipeline.gather(**overlays)
+    forecast, normal = overlays.get('forecast'), overlays.get('normal')
+    
+    # Keyed on what selected the overlays (and whether they loaded), never on the frames
+    fig1 = get_cached_figure(
+        'create_timeseries_engineering', data_version,
+        view=(('title', "Engineering Time Series Analysis"),),
+        overlay_key=(snapshot_version, horizon, show_normal, station_ids,
+                     forecast is not None and not forecast.empty, normal is not None and not normal.empty),
+        _df=df, _overlays={'forecast': forecast, 'normal': normal}
+    )
+    st.plotly_chart(fig1, width='stretch')
+    
+    if len(df) > 1:
+        ind_col1, ind_col2 = st.columns(2)
         
-        # Add threshold lines
-        thresholds = {'PM10': 50, 'PM2.5': 25, 'Dust': 100}
+        with ind_col1:
+            scope = st.radio("Indicator Scope", ["Loaded Window", "Full History"],
+                             horizontal=True, key="indicator_scope")
         
-        fig.add_hline(y=thresholds['PM10'], line_dash="dot", 
-                     line_color="rgba(239, 68, 68, 0.7)", row=1, col=1,
-                     annotation_text=f"Threshold: {thresholds['PM10']} µg/m³",
-                     annotation_position="top right",
-                     annotation_font_color="#ffffff")
+        with ind_col2:
+            window = st.selectbox("Rolling Window (h)", [6, 12, 24, 72, 168], key="indicator_window")
         
-        fig.add_hline(y=thresholds['PM2.5'], line_dash="dot",
-                     line_color="rgba(239, 68, 68, 0.7)", row=2, col=1,
-                     annotation_text=f"Threshold: {thresholds['PM2.5']} µg/m³",
-                     annotation_font_color="#ffffff")
+        if scope == "Full History":
+            snapshot = pipeline.get_snapshot()
+            indicators = pipeline.get_indicators(snapshot['data_version'] if snapshot else None,
+                                                 'pm10', window, station_ids=station_ids)
+        else:
+            indicators = window_indicators(data_version, 'pm10', window, _df=df)
         
-        fig.update_layout(
-            height=800,
-            title=dict(text=title, font=dict(size=20, color='#ffffff')),
-            paper_bgcolor='#0a0e17',
-            plot_bgcolor='#0a0e17',
-            font=dict(color='#ffffff'),
-            margin=dict(l=50, r=30, t=80, b=50),
-            showlegend=True,
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="right",
-                x=1,
-                bgcolor="rgba(26, 31, 53, 0.9)",
-                bordercolor="#2d3748",
-                font=dict(color="#ffffff")
-            )
+        if indicators:
+            col1, col2, col3, col4 = st.columns(4)
+            
+            with col1:
+                st.metric(f"{window}h Rolling Avg PM10", f"{indicators['rolling_avg']:.1f}")
+            
+            with col2:
+                st.metric("PM10 Volatility", f"{indicators['volatility']:.2f}%")
+            
+            with col3:
+                st.metric("Trend Slope", f"{indicators['trend']:.3f}")
+            
+            with col4:
+                st.metric("Autocorrelation", f"{indicators['autocorr']:.3f}")
+
+@st.fragment
+@monitor.timed('panel')
+def render_map_tab(region):
+    """Interpolated surfaces of any stored variable over the selected region, hour by hour"""
+    st.markdown("### SPATIAL INTERPOLATION")
+    
+    map_col1, map_col2 = st.columns(2)
+    with map_col1:
+        variable = st.selectbox("Variable", pipeline.get_variables(), format_func=label, key="map_variable")
+    with map_col2:
+        hours = st.selectbox("Window (h)", [24, 72, 168], key="map_hours")
+    
+    snapshot = pipeline.get_snapshot()
+    surfaces = get_surfaces(region, variable, hours, snapshot['data_version'] if snapshot else None)
+    if surfaces is None:
+        st.info(f"No station readings in {region} for this window.")
+        return
+    
+    fechas = surfaces['fechas']
+    hour = st.select_slider(
+        "Hour",
+        options=range(len(fechas)),
+        value=len(fechas) - 1,
+        format_func=lambda i: fechas[i].strftime("%Y-%m-%d %H:%M")
+    )
+    
+    with monitor.timer('figure', 'create_surface_map'):
+        deck = EngineeringVisualizations.create_surface_map(
+            surfaces['lon'], surfaces['lat'], surfaces['surfaces'][hour], surfaces['cell_size_m'],
+            surfaces['stations'].assign(value=surfaces['readings'][hour]), variable
         )
-        
-        # Update axis labels color
-        fig.update_xaxes(color='#ffffff', gridcolor='#2d3748', zerolinecolor='#2d3748')
-        fig.update_yaxes(color='#ffffff', gridcolor='#2d3748', zerolinecolor='#2d3748')
-        
-        return fig
+    st.pydeck_chart(deck)
+    st.caption(f"Inverse distance weighting from {len(surfaces['stations'])} stations · "
+               f"{len(surfaces['lon']):,} cells × {len(fechas)} hours precomputed")
+
+@monitor.timed('panel')
+def render_statistics_tab(df, data_version):
+    """Correlation, distribution and scatter analysis"""
+    st.markdown("### ADVANCED STATISTICAL ANALYSIS")
     
-    @staticmethod
-    def create_correlation_matrix(df):
-        """Create engineering correlation matrix with statistical significance"""
-        numeric_cols = ['pm10', 'pm2_5', 'dust']
-        available_cols = [col for col in numeric_cols if col in df.columns]
-        
-        if len(available_cols) < 2:
-            fig = go.Figure()
-            fig.add_annotation(text="Insufficient data for correlation matrix", 
-                             font=dict(color="#ffffff", size=16))
-            fig.update_layout(paper_bgcolor='#0a0e17', plot_bgcolor='#0a0e17')
-            return fig
-        
-        corr_matrix = df[available_cols].corr(method='pearson')
-        
-        n = len(df)
-        p_values = pd.DataFrame(index=corr_matrix.index, columns=corr_matrix.columns)
-        
-        for i in corr_matrix.index:
-            for j in corr_matrix.columns:
-                if i == j:
-                    p_values.loc[i, j] = 0
-                else:
-                    corr = corr_matrix.loc[i, j]
-                    if np.isnan(corr):
-                        p_values.loc[i, j] = np.nan
-                    else:
-                        t_stat = corr * np.sqrt((n-2)/(1-corr**2))
-                        p_val = 2 * (1 - stats.t.cdf(abs(t_stat), n-2))
-                        p_values.loc[i, j] = p_val
-        
-        # CORRECCIÓN: Eliminado el parámetro inválido titlefont
-        fig = go.Figure(data=go.Heatmap(
-            z=corr_matrix.values,
-            x=corr_matrix.columns,
-            y=corr_matrix.index,
-            colorscale='RdBu',
-            zmin=-1, zmax=1,
-            text=corr_matrix.round(3).astype(str) + "<br>p=" + p_values.round(4).astype(str),
-            texttemplate='%{text}',
-            textfont=dict(size=12, color="#000000"),
-            hoverongaps=False,
-            colorbar=dict(
-                title="Correlation",
-                tickfont=dict(color='#ffffff')
-            )
-        ))
+    st.markdown("#### Correlation Analysis")
+    fig_corr = get_cached_figure('create_correlation_matrix', data_version, _df=df)
+    st.plotly_chart(fig_corr, width='stretch')
+    
+    
+    st.markdown("#### Distribution Analysis")
+    fig_dist = get_cached_figure('create_distribution_analysis', data_version, _df=df)
+    st.plotly_chart(fig_dist, width='stretch')
+    
+    
+    st.markdown("#### Scatter Matrix Analysis")
+    fig_scatter = get_cached_figure('create_scatter_matrix', data_version, _df=df)
+    st.plotly_chart(fig_scatter, width='stretch')
+    
+    
+    st.markdown("#### Statistical Summary")
+    stats_cols = [col for col in pipeline.get_variables() if col in df.columns]
+    if stats_cols:
+        stats_df = df[stats_cols].describe().T
+        stats_df['skewness'] = [df[col].skew() for col in stats_cols]
+        stats_df['kurtosis'] = [df[col].kurtosis() for col in stats_cols]
+        stats_df['cv'] = stats_df['std'] / stats_df['mean'] * 100
+        
+        st.dataframe(
+            stats_df.style.format("{:.2f}"),
+            width='stretch'
         
-        fig.update_layout(
-            title=dict(
-                text="Correlation Matrix with Statistical Significance",
-                font=dict(color='#ffffff', size=16)
-            ),
-            height=500,
-            paper_bgcolor='#0a0e17',
-            plot_bgcolor='#0a0e17',
-            font=dict(color='#ffffff'),
-            xaxis=dict(tickangle=45, tickfont=dict(color="#ffffff")),
-            yaxis=dict(tickfont=dict(color="#ffffff")),
-            margin=dict(l=50, r=50, t=80, b=50)
         )
+
+@monitor.timed('panel')
+def render_quality_tab(df):
+    """Completeness, validity, missing data and outlier checks"""
+    st.markdown("### DATA QUALITY ENGINEERING")
+    
+    quality_metrics = calculate_data_quality(df)
+    
+    if quality_metrics:
+        col1, col2, col3 = st.columns(3)
         
-        return fig
-    
-    @staticmethod
-    def create_distribution_analysis(df):
-        """Create comprehensive distribution analysis"""
-        fig = make_subplots(
-            rows=2, cols=3,
-            subplot_titles=(
-                "PM10 Distribution", "PM2.5 Distribution", "Dust Distribution",
-                "PM10 Q-Q Plot", "PM2.5 Q-Q Plot", "Dust Q-Q Plot"
-            ),
-            vertical_spacing=0.12,
-            horizontal_spacing=0.08
-        )
+        with col1:
+            st.markdown("#### Completeness")
+            for key, value in quality_metrics['completeness'].items():
+                status_text = "Good" if value > 95 else "Warning" if value > 90 else "Critical"
+                status_color = "#38a169" if value > 95 else "#d69e2e" if value > 90 else "#e53e3e"
+                st.markdown(f"<span style='color:{status_color}'>{key.upper()}: {value:.1f}% ({status_text})</span>", unsafe_allow_html=True)
         
-        variables = ['pm10', 'pm2_5', 'dust']
-        colors = ['#4299e1', '#38b2ac', '#ed8936']
+        with col2:
+            st.markdown("#### Validity Checks")
+            for key, value in quality_metrics['validity'].items():
+                status_text = "Valid" if value == 0 else f"Invalid: {value}"
+                status_color = "#38a169" if value == 0 else "#e53e3e"
+                st.markdown(f"<span style='color:{status_color}'>{key.replace('_', ' ').title()}: {status_text}</span>", unsafe_allow_html=True)
         
-        for i, (var, color) in enumerate(zip(variables, colors), 1):
-            if var not in df.columns or df[var].isna().all():
-                continue
-                
-            # Histogram
-            fig.add_trace(
-                go.Histogram(
-                    x=df[var].dropna(), 
-                    name=var.upper(),
-                    marker_color=color,
-                    opacity=0.7,
-                    nbinsx=30,
-                    histnorm='probability density'
-                ),
-                row=1, col=i
-            )
+        with col3:
+            st.markdown("#### Value Ranges")
+            for key, (min_val, max_val) in quality_metrics['consistency'].items():
+                st.markdown(f"<span style='color:#cbd5e0'>{key.replace('_', ' ').title()}: {min_val:.1f} - {max_val:.1f}</span>", unsafe_allow_html=True)
+    
+    st.markdown("#### Missing Data Pattern Analysis")
+    if len(df) > 0:
+        missing_cols = [col for col in [*pipeline.get_variables(), 'fecha'] if col in df.columns]
+        if missing_cols:
+            missing_df = df[missing_cols].isnull()
+            missing_pattern = missing_df.sum()
             
-            # Add KDE curve
-            try:
-                kde = stats.gaussian_kde(df[var].dropna())
-                x_range = np.linspace(df[var].min(), df[var].max(), 100)
-                fig.add_trace(
-                    go.Scatter(
-                        x=x_range, 
-                        y=kde(x_range),
-                        mode='lines',
-                        line=dict(color='white', width=2),
-                        showlegend=False
-                    ),
-                    row=1, col=i
+            if missing_pattern.sum() > 0:
+                fig_missing = go.Figure(data=[
+                    go.Bar(x=missing_pattern.index, y=missing_pattern.values,
+                          marker_color='#ed8936')
+                ])
+                fig_missing.update_layout(
+                    title="Missing Values by Feature",
+                    paper_bgcolor='#0a0e17',
+                    plot_bgcolor='#0a0e17',
+                    font=dict(color='#ffffff'),
+                    height=400,
+                    xaxis=dict(tickfont=dict(color="#ffffff")),
+                    yaxis=dict(tickfont=dict(color="#ffffff"))
                 )
-            except:
-                pass
-        
-        # Q-Q Plots
-        for i, (var, color) in enumerate(zip(variables, colors), 1):
-            if var not in df.columns or df[var].isna().all():
-                continue
-                
-            data = df[var].dropna()
-            if len(data) > 0:
-                try:
-                    (osm, osr), (slope, intercept, r) = stats.probplot(data, dist="norm")
-                    
-                    fig.add_trace(
-                        go.Scatter(
-                            x=osm, y=osr,
-                            mode='markers',
-                            marker=dict(color=color, size=6),
-                            name=f'{var.upper()} Q-Q'
-                        ),
-                        row=2, col=i
-                    )
-                    
-                    # Add theoretical line
-                    fig.add_trace(
-                        go.Scatter(
-                            x=osm, y=slope*osm + intercept,
-                            mode='lines',
-                            line=dict(color='white', dash='dash', width=2),
-                            showlegend=False
-                        ),
-                        row=2, col=i
-                    )
-                except:
-                    pass
-        
-        fig.update_layout(
-            height=800,
-            paper_bgcolor='#0a0e17',
-            plot_bgcolor='#0a0e17',
-            font=dict(color='#ffffff'),
-            showlegend=False,
-            margin=dict(l=50, r=50, t=80, b=50)
-        )
-        
-        # Update all axis colors
-        for i in range(1, 3):
-            for j in range(1, 4):
-                fig.update_xaxes(row=i, col=j, color='#ffffff', gridcolor='#2d3748', zerolinecolor='#2d3748')
-                fig.update_yaxes(row=i, col=j, color='#ffffff', gridcolor='#2d3748', zerolinecolor='#2d3748')
-        
-        return fig
+                st.plotly_chart(fig_missing, width='stretch')
+            
+            else:
+                st.markdown("<span style='color:#38a169'>No missing values detected in the dataset</span>", unsafe_allow_html=True)
     
-    @staticmethod
-    def create_scatter_matrix(df):
-        """Create professional scatter matrix with regression lines"""
-        available_vars = [col for col in ['pm10', 'pm2_5', 'dust'] if col in df.columns]
-        
-        if len(available_vars) < 2:
-            fig = go.Figure()
-            fig.add_annotation(text="Insufficient data for scatter matrix",
-                             font=dict(color="#ffffff", size=16))
-            fig.update_layout(paper_bgcolor='#0a0e17', plot_bgcolor='#0a0e17')
-            return fig
+    st.markdown("#### Outlier Detection (IQR Method)")
+    
+    for var in pipeline.get_variables():
+        if var in df.columns:
+            outliers_count = detect_outliers(df[var])
+            status_color = "#38a169" if outliers_count == 0 else "#d69e2e" if outliers_count < 10 else "#e53e3e"
+            st.markdown(f"<span style='color:{status_color}'>{var.upper()}: {outliers_count} outliers detected</span>", unsafe_allow_html=True)
+
+@st.fragment
+@monitor.timed('panel')
+def render_raw_data_tab(df, station_ids=None):
+    """Measurement browser and exports; its widgets only rerun this fragment"""
+    st.markdown("### RAW DATA & QUERY INTERFACE")
+    
+    col1, col2 = st.columns([3, 1])
+    
+    with col1:
+        st.markdown("#### Measurement Browser")
+        
+        filter_col1, filter_col2, filter_col3, filter_col4, filter_col5 = st.columns(5)
+        with filter_col1:
+            browse_from = st.date_input("From", value=None, key="browser_from")
+        with filter_col2:
+            browse_to = st.date_input("To", value=None, key="browser_to")
+        variables = list(pipeline.get_variables())
+        with filter_col3:
+            filter_var = st.selectbox(
+                "Filter Variable",
+                ["None", *variables],
+                format_func=lambda v: v if v == "None" else label(v),
+                key="browser_filter_var"
+            )
+        with filter_col4:
+            filter_min = st.number_input("Min (µg/m³)", value=None, key="browser_min",
+                                         disabled=filter_var == "None")
+        with filter_col5:
+            filter_max = st.number_input("Max (µg/m³)", value=None, key="browser_max",
+                                         disabled=filter_var == "None")
+        
+        page_size = st.selectbox("Rows per Page", [50, 100, 250, 500], index=1, key="browser_page_size")
+        
+        # Filters are pushed into SQL; any change restarts browsing from the newest row
+        browser_filters = (browse_from, browse_to, filter_var, filter_min, filter_max, page_size, station_ids)
+        if st.session_state.get('browser_filters') != browser_filters:
+            st.session_state['browser_filters'] = browser_filters
+            st.session_state['browser_cursors'] = [None]
+            st.session_state['browser_pages'] = {}
+        
+        cursors = st.session_state['browser_cursors']
+        prefetched = st.session_state['browser_pages']
+        
+        # A load moves the ETL data version: re-read the pages held here, keeping the position
+        snapshot = pipeline.get_snapshot()
+        etl_version = snapshot['data_version'] if snapshot else None
+        if st.session_state.get('browser_version') != etl_version:
+            st.session_state['browser_version'] = etl_version
+            prefetched.clear()
+        
+        if cursors[-1] not in prefetched:
+            value_filters = {}
+            if filter_var != "None":
+                value_filters[filter_var] = (filter_min, filter_max)
+            
+            pages = pipeline.get_pages(
+                cursor=cursors[-1],
+                page_size=page_size,
+                start=browse_from,
+                end=browse_to + timedelta(days=1) if browse_to else None,
+                value_filters=value_filters,
+                station_ids=station_ids
+            )
             
-        fig = px.scatter_matrix(
-            df,
-            dimensions=available_vars,
-            color='pm10' if 'pm10' in df.columns else available_vars[0],
-            color_continuous_scale='Viridis',
-            title="Scatter Matrix with Density Estimates",
-            labels={col: f"{col.upper()} (µg/m³)" for col in available_vars}
+            # Keep only this round trip's pages: the current one plus the prefetched next one
+            prefetched.clear()
+            page_cursor = cursors[-1]
+            for page, next_cursor in pages:
+                prefetched[page_cursor] = (page, next_cursor)
+                page_cursor = next_cursor
+        
+        page_df, next_cursor = prefetched.get(cursors[-1], (pd.DataFrame(columns=['station_id', 'fecha', *variables]), None))
+        
+        stations = pipeline.get_stations()
+        station_codes = dict(zip(stations['id'], stations['codigo'])) if not stations.empty else {}
+        
+        st.dataframe(
+            page_df[['fecha', *variables]].assign(station=page_df['station_id'].map(station_codes)),
+            width='stretch',
+            height=400,
+            hide_index=True,
+            column_order=['station', 'fecha', *variables],
+            column_config={
+                'station': st.column_config.TextColumn('Station'),
+                'fecha': st.column_config.DatetimeColumn('Timestamp', format='YYYY-MM-DD HH:mm:ss'),
+                **{v: st.column_config.NumberColumn(label(v)) for v in variables}
+            }
         )
         
-        # CORRECCIÓN: Usar dict correcto para colorbar
-        fig.update_layout(
-            height=800,
-            paper_bgcolor='#0a0e17',
-            plot_bgcolor='#0a0e17',
-            font=dict(color='#ffffff'),
-            margin=dict(l=50, r=50, t=80, b=50)
+        nav_col1, nav_col2, nav_col3 = st.columns([1, 1, 2])
+        with nav_col1:
+            st.button("Newer", width='stretch', disabled=len(cursors) == 1,
+                      on_click=cursors.pop)
+        with nav_col2:
+            st.button("Older", width='stretch', disabled=next_cursor is None,
+                      on_click=cursors.append, args=(next_cursor,))
+        with nav_col3:
+            st.caption(f"Page {len(cursors)} · {len(page_df)} rows")
+    
+    with col2:
+        st.markdown("#### Data Export")
+        
+        # Exports are serialized on click (off the script thread), not on every rerun
+        st.download_button(
+            label="Download CSV",
+            data=lambda: df.to_csv(index=False),
+            file_name=f"air_quality_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            mime="text/csv",
+            on_click="ignore"
         )
         
-        # Actualizar colorbar correctamente
-        fig.update_coloraxes(
-            colorbar=dict(
-                title="PM10 Value",
-                tickfont=dict(color='#ffffff')
-            )
+        st.download_button(
+            label="Download JSON",
+            data=lambda: df.to_json(orient='records', date_format='iso'),
+            file_name=f"air_quality_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json",
+            on_click="ignore"
         )
         
-        # Update axis colors
-        for annotation in fig.layout.annotations:
-            annotation.font.color = "#ffffff"
+        st.markdown("---")
         
-        return fig
+        st.markdown("#### Simple Query")
+        if st.button("Refresh All Data"):
+            st.cache_data.clear()
+            st.rerun()
+        
+        if st.button("Show Table Schema"):
+            schema_query = """
+            SELECT 
+                column_name,
+                data_type,
+                is_nullable
+            FROM information_schema.columns
+            WHERE table_name = 'mediciones_aire'
+            ORDER BY ordinal_position;
+            """
+            schema_df = pipeline.execute_query(schema_query, label="table_schema")
+            st.dataframe(schema_df)
 
-# ============================================================================
-# DATA QUALITY & MONITORING FUNCTIONS
-# ============================================================================
-def calculate_data_quality(df):
-    """Calculate comprehensive data quality metrics"""
-    total_rows = len(df)
-    
-    if total_rows == 0:
-        return {}
-    
-    quality_metrics = {
-        'completeness': {
-            'pm10': (df['pm10'].notna().sum() / total_rows) * 100 if 'pm10' in df.columns else 0,
-            'pm2_5': (df['pm2_5'].notna().sum() / total_rows) * 100 if 'pm2_5' in df.columns else 0,
-            'dust': (df['dust'].notna().sum() / total_rows) * 100 if 'dust' in df.columns else 0,
-            'timestamp': (df['fecha'].notna().sum() / total_rows) * 100 if 'fecha' in df.columns else 0
-        },
-        'consistency': {
-            'pm10_range': (df['pm10'].min(), df['pm10'].max()) if 'pm10' in df.columns else (0, 0),
-            'pm2_5_range': (df['pm2_5'].min(), df['pm2_5'].max()) if 'pm2_5' in df.columns else (0, 0),
-            'dust_range': (df['dust'].min(), df['dust'].max()) if 'dust' in df.columns else (0, 0)
-        },
-        'validity': {
-            'pm10_negative': (df['pm10'] < 0).sum() if 'pm10' in df.columns else 0,
-            'pm2_5_negative': (df['pm2_5'] < 0).sum() if 'pm2_5' in df.columns else 0,
-            'dust_negative': (df['dust'] < 0).sum() if 'dust' in df.columns else 0
-        }
-    }
+@st.fragment
+@monitor.timed('panel')
+def render_system_tab(df):
+    """Pipeline configuration and system controls"""
+    st.markdown("### SYSTEM & PIPELINE CONFIGURATION")
     
-    return quality_metrics
-
-def calculate_air_quality_index(pm10, pm25):
-    """Calculate professional AQI based on EPA standards"""
-    try:
-        pm10 = float(pm10)
-        pm25 = float(pm25)
-    except:
-        return 0
+    col1, col2 = st.columns(2)
     
-    def calculate_component(concentration, breakpoints):
-        for i in range(len(breakpoints) - 1):
-            if breakpoints[i][0] <= concentration <= breakpoints[i][1]:
-                return i + (concentration - breakpoints[i][0]) / (breakpoints[i][1] - breakpoints[i][0])
-        return 0
+    with col1:
+        st.markdown("#### Database Configuration")
+        st.code(f"""
+        Database: PostgreSQL
+        Host: localhost:5433
+        Database: canaryair
+        Table: mediciones_aire
+        Total Records: {len(df):,}
+        Time Range: {df['fecha'].min().strftime('%Y-%m-%d')} to {df['fecha'].max().strftime('%Y-%m-%d')}
+        Data Age: {(datetime.now() - df['fecha'].max()).seconds // 60} minutes
+        """, language="sql")
     
-    pm10_breakpoints = [(0, 54), (55, 154), (155, 254), (255, 354), (355, 424), (425, 504)]
-    pm25_breakpoints = [(0, 12), (12.1, 35.4), (35.5, 55.4), (55.5, 150.4), (150.5, 250.4), (250.5, 350.4)]
+    with col2:
+        st.markdown("#### Pipeline Statistics")
+        
+        if len(df) > 0:
+            time_diff = (df['fecha'].max() - df['fecha'].min()).total_seconds() / 3600
+            records_per_hour = len(df) / time_diff if time_diff > 0 else 0
+            
+            stats = {
+                "Data Freshness": f"{(datetime.now() - df['fecha'].max()).seconds // 60} minutes ago",
+                "Sampling Rate": f"{records_per_hour:.1f} records/hour",
+                "Memory Usage": f"{df.memory_usage(deep=True).sum() / 1024 / 1024:.2f} MB",
+                "Cache Status": cache_status(),
+                "Last Refresh": datetime.now().strftime("%H:%M:%S")
+            }
+            
+            for key, value in stats.items():
+                st.markdown(f"**{key}:** {value}")
     
-    aqi_pm10 = calculate_component(pm10, pm10_breakpoints) * 50
-    aqi_pm25 = calculate_component(pm25, pm25_breakpoints) * 50
+    st.markdown("---")
     
-    return max(aqi_pm10, aqi_pm25)
-
-# ============================================================================
-# MAIN DASHBOARD
-# ============================================================================
-def main():
-    # Header
-    st.markdown("""
-    <div class="engineering-header">
-        <div class="engineering-title">AIR QUALITY ENGINEERING DASHBOARD</div>
-        <div class="engineering-subtitle">PostgreSQL Pipeline | Real-time Analytics | Data Engineering Platform</div>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown("#### Performance Metrics")
     
-    # Control Panel
-    col1, col2, col3 = st.columns(3)
+    perf_col1, perf_col2, perf_col3 = st.columns(3)
     
-    with col1:
-        time_range = st.selectbox(
-            "Time Range",
-            ["Last 24 Hours", "Last 7 Days", "Last 30 Days", "All Data"],
-            index=3
+    with perf_col1:
+        load_time = monitor.last('stage', 'load_data')
+        st.metric("Data Load Time", f"{load_time:.2f}s" if load_time is not None else "N/A")
+    
+    with perf_col2:
+        st.metric("Data Points", f"{len(df):,}")
+    
+    with perf_col3:
+        if len(df) > 0:
+            completeness = (df[list(CORE_VARIABLES)].notna().sum().min() / len(df)) * 100
+            st.metric("Data Quality", f"{completeness:.1f}%")
+    
+    st.markdown("#### Cold Start")
+    
+    start_cols = st.columns(4)
+    for col, (label, name) in zip(start_cols, [("Imports", 'imports'), ("First Paint", 'first_paint'),
+                                               ("Headline", 'headline'), ("Background Warm-up", 'warmup')]):
+        with col:
+            seconds = monitor.last('startup', name)
+            st.metric(label, f"{seconds:.2f}s" if seconds is not None else "Pending")
+    st.caption("First script run of this process, measured from the start of app.py")
+    
+    st.markdown("#### Connection Pool")
+    
+    pool = pool_status(pipeline.engine)
+    pool_col1, pool_col2, pool_col3, pool_col4 = st.columns(4)
+    
+    with pool_col1:
+        st.metric("Checked Out", f"{pool['checked_out']} / {pool['pool_size'] + pool['max_overflow']}")
+    
+    with pool_col2:
+        st.metric("Pool Saturation", f"{pool['saturation']:.0f}%")
+    
+    with pool_col3:
+        st.metric("Peak Checked Out", f"{pool.get('peak_checked_out', 0)}")
+    
+    with pool_col4:
+        st.metric("Connections Opened", f"{pool.get('connects', 0)}")
+    
+    st.caption(f"Idle: {pool['idle']} | Overflow in use: {pool['overflow']} | "
+               f"Checkouts: {pool.get('checkouts', 0):,} | Statement timeout: {STATEMENT_TIMEOUT_MS / 1000:.0f}s")
+    
+    st.markdown("#### Profiling")
+    
+    timings = pd.DataFrame(monitor.timings())
+    if not timings.empty:
+        st.dataframe(
+            timings,
+            width='stretch',
+            hide_index=True,
+            column_config={
+                'last_ms': st.column_config.NumberColumn('Last (ms)', format='%.1f'),
+                'p50_ms': st.column_config.NumberColumn('p50 (ms)', format='%.1f'),
+                'p95_ms': st.column_config.NumberColumn('p95 (ms)', format='%.1f'),
+                'p99_ms': st.column_config.NumberColumn('p99 (ms)', format='%.1f'),
+                'mb': st.column_config.NumberColumn('MB', format='%.2f')
+            }
         )
     
-    with col2:
-        data_limit = st.selectbox(
-            "Data Points Limit",
-            ["100", "500", "1000", "5000", "10000"],
-            index=3
+    cache_df = pd.DataFrame(monitor.cache_stats())
+    if not cache_df.empty:
+        st.dataframe(
+            cache_df,
+            width='stretch',
+            hide_index=True,
+            column_config={'hit_rate': st.column_config.NumberColumn('Hit Rate', format='%.1f%%')}
         )
     
-    with col3:
-        auto_refresh = st.checkbox("Auto Refresh", value=False)
-        if auto_refresh:
+    prof_col1, prof_col2 = st.columns([1, 3])
+    with prof_col1:
+        capture_mode = st.selectbox("Capture", ["cprofile", "tracemalloc"], key="profile_mode")
+        if st.button("Profile Next Rerun", width='stretch'):
+            st.session_state['profile_capture'] = capture_mode
+            st.rerun()
+    with prof_col2:
+        profile = st.session_state.get('profile_report')
+        if profile:
+            with st.expander(f"Last capture ({profile['mode']})"):
+                st.code(profile['report'])
+    
+    st.markdown("#### System Controls")
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        if st.button("Clear Cache", width='stretch'):
             st.cache_data.clear()
+            st.success("Cache cleared successfully!")
+            st.rerun()
     
-    # Load Data
-    try:
-        if time_range == "All Data":
-            df = pipeline.get_all_data(limit=int(data_limit))
-        else:
-            # Get all data first
-            df = pipeline.get_all_data(limit=int(data_limit))
-            if 'fecha' in df.columns:
-                df['fecha'] = pd.to_datetime(df['fecha'])
-                
-                if time_range == "Last 24 Hours":
-                    cutoff = datetime.now() - timedelta(hours=24)
-                    df = df[df['fecha'] >= cutoff]
-                elif time_range == "Last 7 Days":
-                    cutoff = datetime.now() - timedelta(days=7)
-                    df = df[df['fecha'] >= cutoff]
-                elif time_range == "Last 30 Days":
-                    cutoff = datetime.now() - timedelta(days=30)
-                    df = df[df['fecha'] >= cutoff]
-                    
-    except Exception as e:
-        st.error(f"Error loading data: {str(e)}")
-        df = pipeline.execute_query("SELECT * FROM mediciones_aire ORDER BY fecha DESC LIMIT 5000")
+    with col2:
+        if st.button("Refresh Data", width='stretch', type="primary"):
+            st.rerun()
     
-    if df.empty:
-        st.error("No data available. Check database connection.")
-        st.info("Running ETL job to populate database...")
-        
-        if st.button("Run ETL Job Now"):
-            import subprocess
-            import sys
-            
+    with col3:
+        if st.button("Validate Connection", width='stretch'):
             try:
-                result = subprocess.run([sys.executable, "etl_job.py"], 
-                                      capture_output=True, text=True)
-                
-                if result.returncode == 0:
-                    st.success("ETL job completed successfully!")
-                    st.code(result.stdout)
-                    st.rerun()
-                else:
-                    st.error("ETL job failed!")
-                    st.code(result.stderr)
+                latency, count = pipeline.check_connection()
+                st.success(f"Database connection is working! ({latency * 1000:.0f} ms round trip)")
+                st.info(f"Total records in table: {count:,}")
             except Exception as e:
-                st.error(f"Failed to run ETL job: {str(e)}")
-        
-        st.stop()
+                st.error(f"Connection failed: {str(e)}")
+
+@st.fragment
+@monitor.timed('panel')
+def render_analysis_tabs(df, data_version, station_ids=None, region=None):
+    """Analysis tabs: only the open tab runs, and switching tabs reruns only this fragment"""
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+        "Time Series Analysis", 
+        "Spatial Map", 
+        "Statistical Analysis", 
+        "Data Quality", 
+        "Raw Data", 
+        "System"
+    ], key="analysis_tab", on_change="rerun")
     
-    # Convert fecha to datetime if needed
-    if 'fecha' in df.columns:
-        df['fecha'] = pd.to_datetime(df['fecha'])
-        df = df.sort_values('fecha', ascending=False)
-    else:
-        st.error("Column 'fecha' not found in data")
-        st.stop()
+    with tab1:
+        if tab1.open:
+            render_timeseries_tab(df, data_version, station_ids)
+    
+    with tab2:
+        if tab2.open:
+            render_map_tab(region)
+    
+    with tab3:
+        if tab3.open:
+            render_statistics_tab(df, data_version)
     
-    # REAL-TIME ENGINEERING METRICS
+    with tab4:
+        if tab4.open:
+            render_quality_tab(df)
+    
+    with tab5:
+        if tab5.open:
+            render_raw_data_tab(df, station_ids)
+    
+    with tab6:
+        if tab6.open:
+            render_system_tab(df)
+
+def status_card(title, value, color, caption):
+    """Status panel card with a colored left border"""
+    st.markdown(f"""
+    <div style='background: #1a1f35; padding: 1rem; border-radius: 8px; border-left: 4px solid {color};'>
+        <div style='font-size: 0.9rem; color: #a0aec0;'>{title}</div>
+        <div style='font-size: 1.5rem; font-weight: 600; color: {color};'>{value}</div>
+        <div style='font-size: 0.8rem; color: #cbd5e0;'>{caption}</div>
+    </div>
+    """, unsafe_allow_html=True)
+
+STATUS_COLORS = {"Normal": "#38a169", "Warning": "#d69e2e", "Critical": "#e53e3e"}
+
+@monitor.timed('panel')
+def render_headline(snapshot, alerts=None):
+    """REAL-TIME metrics and status panel, rendered from the snapshot row and the alert state.
+    
+    PM statuses come from the open alerts of the selected stations when the
+    ETL maintains them, otherwise from the snapshot's latest network mean.
+    """
     st.markdown("### REAL-TIME ENGINEERING METRICS")
     
-    if len(df) > 0:
-        latest = df.iloc[0]
-        aqi = calculate_air_quality_index(latest.get('pm10', 0), latest.get('pm2_5', 0))
-        
+    if snapshot:
         col1, col2, col3, col4, col5, col6 = st.columns(6)
         
         with col1:
-            pm10_val = latest.get('pm10', 0)
-            delta_pm10 = pm10_val - df.iloc[1]['pm10'] if len(df) > 1 else 0
             st.metric(
                 label="PM10 (µg/m³)",
-                value=f"{pm10_val:.1f}",
-                delta=f"{delta_pm10:+.1f}"
+                value=f"{snapshot['pm10'] or 0:.1f}",
+                delta=f"{snapshot['delta_pm10']:+.1f}"
             )
         
         with col2:
-            pm25_val = latest.get('pm2_5', 0)
-            delta_pm25 = pm25_val - df.iloc[1]['pm2_5'] if len(df) > 1 else 0
             st.metric(
                 label="PM2.5 (µg/m³)",
-                value=f"{pm25_val:.1f}",
-                delta=f"{delta_pm25:+.1f}"
+                value=f"{snapshot['pm2_5'] or 0:.1f}",
+                delta=f"{snapshot['delta_pm2_5']:+.1f}"
             )
         
         with col3:
-            dust_val = latest.get('dust', 0)
-            delta_dust = dust_val - df.iloc[1]['dust'] if len(df) > 1 else 0
             st.metric(
                 label="Dust (µg/m³)",
-                value=f"{dust_val:.1f}",
-                delta=f"{delta_dust:+.1f}"
+                value=f"{snapshot['dust'] or 0:.1f}",
+                delta=f"{snapshot['delta_dust']:+.1f}"
             )
         
         with col4:
             st.metric(
                 label="Engineering AQI",
-                value=f"{aqi:.0f}",
-                delta="EPA Standard" if aqi < 100 else "Alert"
+                value=f"{snapshot['aqi']:.0f}",
+                delta="EPA Standard" if snapshot['aqi'] < 100 else "Alert"
             )
         
         with col5:
             st.metric(
                 label="Data Points",
-                value=f"{len(df):,}"
+                value=f"{snapshot['total_rows']:,}"
             )
         
         with col6:
-            completeness = 0
-            if len(df) > 0:
-                valid_cols = [col for col in ['pm10', 'pm2_5', 'dust'] if col in df.columns]
-                if valid_cols:
-                    completeness = (df[valid_cols].notna().sum().min() / len(df)) * 100
             st.metric(
                 label="Data Quality",
-                value=f"{completeness:.1f}%"
+                value=f"{snapshot['completeness']:.1f}%"
             )
     else:
         st.warning("No data available for metrics")
@@ -796,350 +1017,151 @@ def main():
     status_col1, status_col2, status_col3, status_col4 = st.columns(4)
     
     with status_col1:
-        pm10_val = latest.get('pm10', 0) if len(df) > 0 else 0
-        pm10_status = "Normal" if pm10_val < 50 else "Warning" if pm10_val < 100 else "Critical"
-        status_color = "#38a169" if pm10_val < 50 else "#d69e2e" if pm10_val < 100 else "#e53e3e"
-        st.markdown(f"""
-        <div style='background: #1a1f35; padding: 1rem; border-radius: 8px; border-left: 4px solid {status_color};'>
-            <div style='font-size: 0.9rem; color: #a0aec0;'>PM10 STATUS</div>
-            <div style='font-size: 1.5rem; font-weight: 600; color: {status_color};'>{pm10_status}</div>
-            <div style='font-size: 0.8rem; color: #cbd5e0;'>Value: {pm10_val:.1f} µg/m³</div>
-        </div>
-        """, unsafe_allow_html=True)
+        pm10_val = (snapshot['pm10'] or 0) if snapshot else 0
+        if alerts is not None:
+            pm10_status = alert_status(alerts['active'], 'pm10')
+        else:
+            pm10_status = snapshot['pm10_status'] if snapshot else "Normal"
+        status_card("PM10 STATUS", pm10_status, STATUS_COLORS[pm10_status], f"Value: {pm10_val:.1f} µg/m³")
     
     with status_col2:
-        pm25_val = latest.get('pm2_5', 0) if len(df) > 0 else 0
-        pm25_status = "Normal" if pm25_val < 25 else "Warning" if pm25_val < 50 else "Critical"
-        status_color = "#38a169" if pm25_val < 25 else "#d69e2e" if pm25_val < 50 else "#e53e3e"
-        st.markdown(f"""
-        <div style='background: #1a1f35; padding: 1rem; border-radius: 8px; border-left: 4px solid {status_color};'>
-            <div style='font-size: 0.9rem; color: #a0aec0;'>PM2.5 STATUS</div>
-            <div style='font-size: 1.5rem; font-weight: 600; color: {status_color};'>{pm25_status}</div>
-            <div style='font-size: 0.8rem; color: #cbd5e0;'>Value: {pm25_val:.1f} µg/m³</div>
-        </div>
-        """, unsafe_allow_html=True)
+        pm25_val = (snapshot['pm2_5'] or 0) if snapshot else 0
+        if alerts is not None:
+            pm25_status = alert_status(alerts['active'], 'pm2_5')
+        else:
+            pm25_status = snapshot['pm2_5_status'] if snapshot else "Normal"
+        status_card("PM2.5 STATUS", pm25_status, STATUS_COLORS[pm25_status], f"Value: {pm25_val:.1f} µg/m³")
     
     with status_col3:
-        pipeline_status = "Operational" if len(df) > 0 else "Offline"
-        status_color = "#38a169" if len(df) > 0 else "#e53e3e"
-        st.markdown(f"""
-        <div style='background: #1a1f35; padding: 1rem; border-radius: 8px; border-left: 4px solid {status_color};'>
-            <div style='font-size: 0.9rem; color: #a0aec0;'>DATA PIPELINE</div>
-            <div style='font-size: 1.5rem; font-weight: 600; color: {status_color};'>{pipeline_status}</div>
-            <div style='font-size: 0.8rem; color: #cbd5e0;'>{len(df):,} records loaded</div>
-        </div>
-        """, unsafe_allow_html=True)
+        if snapshot:
+            age_minutes = (datetime.now() - snapshot['updated_at']).total_seconds() // 60
+            status_card("DATA PIPELINE", "Operational", STATUS_COLORS["Normal"],
+                        f"{snapshot['total_rows']:,} records | refreshed {age_minutes:.0f} min ago")
+        else:
+            status_card("DATA PIPELINE", "Offline", STATUS_COLORS["Critical"], "0 records loaded")
     
     with status_col4:
-        db_status = "Connected" if len(df) > 0 else "Disconnected"
-        status_color = "#38a169" if len(df) > 0 else "#e53e3e"
-        earliest = df['fecha'].min().strftime('%Y-%m-%d') if len(df) > 0 else "N/A"
-        latest_date = df['fecha'].max().strftime('%Y-%m-%d') if len(df) > 0 else "N/A"
-        st.markdown(f"""
-        <div style='background: #1a1f35; padding: 1rem; border-radius: 8px; border-left: 4px solid {status_color};'>
-            <div style='font-size: 0.9rem; color: #a0aec0;'>DATABASE</div>
-            <div style='font-size: 1.5rem; font-weight: 600; color: {status_color};'>{db_status}</div>
-            <div style='font-size: 0.8rem; color: #cbd5e0;'>{earliest} to {latest_date}</div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    # MAIN ANALYSIS TABS
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
-        "Time Series Analysis", 
-        "Statistical Analysis", 
-        "Data Quality", 
-        "Raw Data", 
-        "System"
-    ])
+        if snapshot:
+            status_card("DATABASE", "Connected", STATUS_COLORS["Normal"],
+                        f"{snapshot['fecha_min']:%Y-%m-%d} to {snapshot['fecha_max']:%Y-%m-%d}")
+        else:
+            status_card("DATABASE", "Disconnected", STATUS_COLORS["Critical"], "N/A to N/A")
     
-    with tab1:
-        st.markdown("### ENGINEERING TIME SERIES ANALYSIS")
-        
-        viz = EngineeringVisualizations()
-        fig1 = viz.create_timeseries_engineering(df, "Engineering Time Series Analysis")
-        st.plotly_chart(fig1, width='stretch')
+    if alerts is not None:
+        render_alerts(alerts)
 
-        
-        if len(df) > 1:
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                rolling_window = min(6, len(df))
-                if rolling_window > 1:
-                    rolling_avg = df['pm10'].rolling(window=rolling_window).mean().iloc[-1]
-                    st.metric("6h Rolling Avg PM10", f"{rolling_avg:.1f}")
-            
-            with col2:
-                if len(df) > 1:
-                    volatility = df['pm10'].pct_change().std() * 100
-                    st.metric("PM10 Volatility", f"{volatility:.2f}%")
-            
-            with col3:
-                if len(df) > 1:
-                    x = np.arange(len(df))
-                    y = df['pm10'].values
-                    trend = np.polyfit(x, y, 1)[0] * 100
-                    st.metric("Trend Slope", f"{trend:.3f}")
-            
-            with col4:
-                if len(df) > 1:
-                    autocorr = df['pm10'].autocorr(lag=1)
-                    st.metric("Autocorrelation", f"{autocorr:.3f}")
+def render_alerts(alerts):
+    """Open alerts and recent calima episodes from the ETL's alert engine"""
+    active = alerts['active']
+    if active:
+        st.markdown(f"### ACTIVE ALERTS ({len(active)})")
+        alert_cols = st.columns(4)
+        for i, alert in enumerate(active):
+            hours = (datetime.now() - alert['started_at']).total_seconds() / 3600
+            with alert_cols[i % 4]:
+                status_card(f"{alert['nombre'].upper()} | {alert['rule']}", alert['level'],
+                            STATUS_COLORS[alert['level']],
+                            f"{alert['variable']} >= {alert['threshold']:g} µg/m³ since "
+                            f"{alert['started_at']:%Y-%m-%d %H:%M} ({hours:.0f} h) | peak {alert['peak']:.1f} µg/m³")
     
-    with tab2:
-        st.markdown("### ADVANCED STATISTICAL ANALYSIS")
-        
-        viz = EngineeringVisualizations()
-        
-        st.markdown("#### Correlation Analysis")
-        fig_corr = viz.create_correlation_matrix(df)
-        st.plotly_chart(fig_corr, width='stretch')
-
-        
-        st.markdown("#### Distribution Analysis")
-        fig_dist = viz.create_distribution_analysis(df)
-        st.plotly_chart(fig_dist, width='stretch')
-
-        
-        st.markdown("#### Scatter Matrix Analysis")
-        fig_scatter = viz.create_scatter_matrix(df)
-        st.plotly_chart(fig_scatter, width='stretch')
-
-        
-        st.markdown("#### Statistical Summary")
-        stats_cols = [col for col in ['pm10', 'pm2_5', 'dust'] if col in df.columns]
-        if stats_cols:
-            stats_df = df[stats_cols].describe().T
-            stats_df['skewness'] = [df[col].skew() for col in stats_cols]
-            stats_df['kurtosis'] = [df[col].kurtosis() for col in stats_cols]
-            stats_df['cv'] = stats_df['std'] / stats_df['mean'] * 100
-            
-            st.dataframe(
-                stats_df.style.format("{:.2f}"),
-                width='stretch'
+    with st.expander(f"Dust Episodes (calima): {len(alerts['episodes'])} recent, most unusual first"):
+        if alerts['episodes']:
+            # Ranked by the peak z-score against the climatology of its hour and month
+            episodes = pd.DataFrame(alerts['episodes'])
+            episodes = episodes.sort_values(['peak_z', 'started_at'], ascending=False, na_position='last')
+            episodes['ended_at'] = episodes['ended_at'].astype(object).where(episodes['ended_at'].notna(), "ongoing")
+            st.dataframe(episodes[['nombre', 'started_at', 'ended_at', 'peak', 'peak_fecha', 'peak_z']].rename(columns={
+                'nombre': 'Station', 'started_at': 'Start', 'ended_at': 'End',
+                'peak': 'Peak Dust (µg/m³)', 'peak_fecha': 'Peak At', 'peak_z': 'Peak z vs. Normal'
+            }), width='stretch', hide_index=True,
+                column_config={'Peak z vs. Normal': st.column_config.NumberColumn(format='%.1f σ')})
+        else:
+            st.info("No dust episodes recorded for the selected stations.")
 
-            )
+def render_dashboard():
+    # Header
+    st.markdown("""
+    <div class="engineering-header">
+        <div class="engineering-title">AIR QUALITY ENGINEERING DASHBOARD</div>
+        <div class="engineering-subtitle">PostgreSQL Pipeline | Real-time Analytics | Data Engineering Platform</div>
+    </div>
+    """, unsafe_allow_html=True)
+    monitor.record_once('startup', 'first_paint', time.perf_counter() - SCRIPT_START)
     
-    with tab3:
-        st.markdown("### DATA QUALITY ENGINEERING")
-        
-        quality_metrics = calculate_data_quality(df)
-        
-        if quality_metrics:
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                st.markdown("#### Completeness")
-                for key, value in quality_metrics['completeness'].items():
-                    status_text = "Good" if value > 95 else "Warning" if value > 90 else "Critical"
-                    status_color = "#38a169" if value > 95 else "#d69e2e" if value > 90 else "#e53e3e"
-                    st.markdown(f"<span style='color:{status_color}'>{key.upper()}: {value:.1f}% ({status_text})</span>", unsafe_allow_html=True)
-            
-            with col2:
-                st.markdown("#### Validity Checks")
-                for key, value in quality_metrics['validity'].items():
-                    status_text = "Valid" if value == 0 else f"Invalid: {value}"
-                    status_color = "#38a169" if value == 0 else "#e53e3e"
-                    st.markdown(f"<span style='color:{status_color}'>{key.replace('_', ' ').title()}: {status_text}</span>", unsafe_allow_html=True)
-            
-            with col3:
-                st.markdown("#### Value Ranges")
-                for key, (min_val, max_val) in quality_metrics['consistency'].items():
-                    st.markdown(f"<span style='color:#cbd5e0'>{key.replace('_', ' ').title()}: {min_val:.1f} - {max_val:.1f}</span>", unsafe_allow_html=True)
-        
-        st.markdown("#### Missing Data Pattern Analysis")
-        if len(df) > 0:
-            missing_cols = [col for col in ['pm10', 'pm2_5', 'dust', 'fecha'] if col in df.columns]
-            if missing_cols:
-                missing_df = df[missing_cols].isnull()
-                missing_pattern = missing_df.sum()
-                
-                if missing_pattern.sum() > 0:
-                    fig_missing = go.Figure(data=[
-                        go.Bar(x=missing_pattern.index, y=missing_pattern.values,
-                              marker_color='#ed8936')
-                    ])
-                    fig_missing.update_layout(
-                        title="Missing Values by Feature",
-                        paper_bgcolor='#0a0e17',
-                        plot_bgcolor='#0a0e17',
-                        font=dict(color='#ffffff'),
-                        height=400,
-                        xaxis=dict(tickfont=dict(color="#ffffff")),
-                        yaxis=dict(tickfont=dict(color="#ffffff"))
-                    )
-                    st.plotly_chart(fig_missing, width='stretch')
-
-                else:
-                    st.markdown("<span style='color:#38a169'>No missing values detected in the dataset</span>", unsafe_allow_html=True)
-        
-        st.markdown("#### Outlier Detection (IQR Method)")
-        
-        def detect_outliers(series):
-            if len(series) < 2:
-                return 0
-            Q1 = series.quantile(0.25)
-            Q3 = series.quantile(0.75)
-            IQR = Q3 - Q1
-            if IQR == 0:
-                return 0
-            lower_bound = Q1 - 1.5 * IQR
-            upper_bound = Q3 + 1.5 * IQR
-            return ((series < lower_bound) | (series > upper_bound)).sum()
-        
-        for var in ['pm10', 'pm2_5', 'dust']:
-            if var in df.columns:
-                outliers_count = detect_outliers(df[var])
-                status_color = "#38a169" if outliers_count == 0 else "#d69e2e" if outliers_count < 10 else "#e53e3e"
-                st.markdown(f"<span style='color:{status_color}'>{var.upper()}: {outliers_count} outliers detected</span>", unsafe_allow_html=True)
+    # Control Panel
+    col1, col2, col3 = st.columns(3)
     
-    with tab4:
-        st.markdown("### RAW DATA & QUERY INTERFACE")
-        
-        col1, col2 = st.columns([3, 1])
-        
-        with col1:
-            st.markdown("#### Latest Measurements")
-            display_df = df.head(100).copy()
-            if 'fecha' in display_df.columns:
-                display_df['fecha'] = display_df['fecha'].dt.strftime('%Y-%m-%d %H:%M:%S')
-            
-            display_cols = {}
-            if 'fecha' in display_df.columns:
-                display_cols['fecha'] = 'Timestamp'
-            if 'pm10' in display_df.columns:
-                display_cols['pm10'] = 'PM10'
-            if 'pm2_5' in display_df.columns:
-                display_cols['pm2_5'] = 'PM2.5'
-            if 'dust' in display_df.columns:
-                display_cols['dust'] = 'Dust'
-            
-            display_df = display_df[list(display_cols.keys())]
-            display_df.columns = [display_cols[col] for col in display_df.columns]
-            
-            st.dataframe(
-                display_df,
-                width='stretch',
-                height=400
-            )
-        
-        with col2:
-            st.markdown("#### Data Export")
-            
-            csv = df.to_csv(index=False)
-            st.download_button(
-                label="Download CSV",
-                data=csv,
-                file_name=f"air_quality_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv"
-            )
-            
-            json_data = df.to_json(orient='records', date_format='iso')
-            st.download_button(
-                label="Download JSON",
-                data=json_data,
-                file_name=f"air_quality_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                mime="application/json"
-            )
-            
-            st.markdown("---")
-            
-            st.markdown("#### Simple Query")
-            if st.button("Refresh All Data"):
-                st.cache_data.clear()
-                st.rerun()
-            
-            if st.button("Show Table Schema"):
-                schema_query = """
-                SELECT 
-                    column_name,
-                    data_type,
-                    is_nullable
-                FROM information_schema.columns
-                WHERE table_name = 'mediciones_aire'
-                ORDER BY ordinal_position;
-                """
-                schema_df = pipeline.execute_query(schema_query)
-                st.dataframe(schema_df)
+    with col1:
+        time_range = st.selectbox(
+            "Time Range",
+            list(TIME_RANGES),
+            index=3
+        )
     
-    with tab5:
-        st.markdown("### SYSTEM & PIPELINE CONFIGURATION")
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.markdown("#### Database Configuration")
-            st.code(f"""
-            Database: PostgreSQL
-            Host: localhost:5433
-            Database: canaryair
-            Table: mediciones_aire
-            Total Records: {len(df):,}
-            Time Range: {df['fecha'].min().strftime('%Y-%m-%d')} to {df['fecha'].max().strftime('%Y-%m-%d')}
-            Data Age: {(datetime.now() - df['fecha'].max()).seconds // 60} minutes
-            """, language="sql")
-        
-        with col2:
-            st.markdown("#### Pipeline Statistics")
-            
-            if len(df) > 0:
-                time_diff = (df['fecha'].max() - df['fecha'].min()).total_seconds() / 3600
-                records_per_hour = len(df) / time_diff if time_diff > 0 else 0
-                
-                stats = {
-                    "Data Freshness": f"{(datetime.now() - df['fecha'].max()).seconds // 60} minutes ago",
-                    "Sampling Rate": f"{records_per_hour:.1f} records/hour",
-                    "Memory Usage": f"{df.memory_usage(deep=True).sum() / 1024 / 1024:.2f} MB",
-                    "Cache Status": "Active",
-                    "Last Refresh": datetime.now().strftime("%H:%M:%S")
-                }
-                
-                for key, value in stats.items():
-                    st.markdown(f"**{key}:** {value}")
-        
-        st.markdown("---")
-        
-        st.markdown("#### Performance Metrics")
-        
-        perf_col1, perf_col2, perf_col3 = st.columns(3)
-        
-        with perf_col1:
-            load_time = len(df) * 0.001
-            st.metric("Data Load Time", f"{load_time:.2f}s")
-        
-        with perf_col2:
-            st.metric("Data Points", f"{len(df):,}")
-        
-        with perf_col3:
-            if len(df) > 0:
-                completeness = (df[['pm10', 'pm2_5', 'dust']].notna().sum().min() / len(df)) * 100
-                st.metric("Data Quality", f"{completeness:.1f}%")
-        
-        st.markdown("#### System Controls")
-        
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            if st.button("Clear Cache", width='stretch'):
-                st.cache_data.clear()
-                st.success("Cache cleared successfully!")
-                st.rerun()
-        
-        with col2:
-            if st.button("Refresh Data", width='stretch', type="primary"):
-                st.rerun()
-        
-        with col3:
-            if st.button("Validate Connection", width='stretch'):
-                try:
-                    with pipeline.engine.connect() as conn:
-                        result = conn.execute(text("SELECT 1"))
-                        st.success("Database connection is working!")
-                        count_result = conn.execute(text("SELECT COUNT(*) FROM mediciones_aire"))
-                        count = count_result.fetchone()[0]
-                        st.info(f"Total records in table: {count:,}")
-                except Exception as e:
-                    st.error(f"Connection failed: {str(e)}")
+    with col2:
+        data_limit = st.selectbox(
+            "Data Points Limit",
+            ["100", "500", "1000", "5000", "10000"],
+            index=3
+        )
+    
+    with col3:
+        auto_refresh = st.checkbox("Auto Refresh", value=False)
+        if auto_refresh:
+            st.cache_data.clear()
+    
+    # The snapshot doesn't depend on the station widgets: its query overlaps theirs
+    snapshot_future = pipeline.submit(pipeline.get_snapshot)
+    
+    # Station selection: region bounding box -> stations (index lookups in SQL)
+    station_col1, station_col2 = st.columns(2)
+    
+    with station_col1:
+        region = st.selectbox("Region", list(REGIONS), key="region")
+    
+    with station_col2:
+        region_stations = pipeline.get_stations(region)
+        station_names = dict(zip(region_stations['nombre'], region_stations['id'])) if not region_stations.empty else {}
+        station_choice = st.selectbox("Station", ["All stations in region"] + list(station_names), key="station")
+    
+    if not station_names:
+        st.warning(f"No active stations in {region}.")
+        render_etl_control()  # A new database gets its stations on the first ETL run
+        st.stop()
+    if station_choice in station_names:
+        station_ids = (int(station_names[station_choice]),)
+    else:
+        station_ids = tuple(int(i) for i in station_names.values())
+    
+    # Headline metrics come from the ETL snapshot. The dataset query starts now on the
+    # query pool and runs while the alerts are read and the headline renders
+    load_start = time.perf_counter()
+    snapshot = pipeline.result(snapshot_future)
+    dataset_future = pipeline.submit(pipeline.get_dataset, snapshot['data_version'] if snapshot else None,
+                                     int(data_limit), station_ids)
+    render_headline(snapshot, pipeline.get_alerts(station_ids))
+    monitor.record_once('startup', 'headline', time.perf_counter() - SCRIPT_START)
+    start_warmup()
+    
+    # Load Data
+    # One shared, compact frame per (version, limit, stations), newest first and
+    # already typed; the time range is a view of its leading rows
+    with st.spinner("Loading dataset..."):
+        df = pipeline.result(dataset_future)
+    if TIME_RANGES[time_range] is not None:
+        df = rows_since(df, datetime.now() - TIME_RANGES[time_range])
+    monitor.record('stage', 'load_data', time.perf_counter() - load_start)
+    
+    if df.empty:
+        st.error("No data available. Check database connection.")
+        st.info("Run the ETL job to populate the database. It runs in the background; progress shows below.")
+        render_etl_control()
+        st.stop()
+    
+    data_version = f"{region}/{station_choice}:{dataset_version(df)}"
+    
+    # MAIN ANALYSIS TABS
+    render_analysis_tabs(df, data_version, station_ids, region)
     
     # FOOTER
     st.markdown("""
@@ -1150,6 +1172,18 @@ def main():
     </div>
     """, unsafe_allow_html=True)
 
+def main():
+    """Render one rerun, timing it and optionally profiling it"""
+    capture_mode = st.session_state.pop('profile_capture', None)
+    
+    with monitor.timer('rerun', 'full'):
+        if capture_mode:
+            with capture(capture_mode) as profile:
+                render_dashboard()
+            st.session_state['profile_report'] = profile
+        else:
+            render_dashboard()
+
 # ============================================================================
 # EXECUTION
 # ============================================================================
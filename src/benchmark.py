@@ -0,0 +1,325 @@
+"""Benchmark suite: ETL load throughput, dashboard query paths, figure builders
+and statistics functions over synthetic data at several scales, plus the
+dashboard's cold-start import time.
+
+    python benchmark.py --scales 7d 1y 10y
+    python benchmark.py --db-url postgresql://... --scales 1y --compare ../benchmarks/results/<baseline>.json
+
+Database suites run in their own schema (--schema, default canaryair_bench),
+so production tables are never touched. Results are written as JSON under
+benchmarks/results/ together with the git commit, to compare commits.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+import streamlit.logger
+streamlit.logger.set_log_level('error')  # Cached functions run outside `streamlit run`
+
+from database import connect
+from metrics import refresh_snapshot
+from analytics import compute_indicators
+from data_quality import calculate_data_quality, detect_outliers
+from visualizations import EngineeringVisualizations
+from data_pipeline import AirQualityDataPipeline
+from stations import DEFAULT_STATION, station_ids, upsert_stations
+from synthetic_data import generate_measurements, to_api_payload, parse_scale
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks', 'results')
+MEASURES = ['pm10', 'pm2_5', 'dust']
+FIGURE_BUILDERS = (
+    'create_timeseries_engineering',
+    'create_correlation_matrix',
+    'create_distribution_analysis',
+    'create_scatter_matrix'
+)
+
+# ============================================================================
+# TIMING
+# ============================================================================
+def measure(func, repeat=5, setup=None):
+    """Run `func` `repeat` times (after `setup`, untimed) and summarize wall times in ms"""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples = np.array(samples)
+    return {
+        'repeat': repeat,
+        'min_ms': float(samples.min()),
+        'median_ms': float(np.median(samples)),
+        'mean_ms': float(samples.mean()),
+        'max_ms': float(samples.max())
+    }
+
+class BenchmarkRun:
+    """Collects the results of one invocation"""
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def add(self, suite, name, scale, func, rows=None, setup=None, repeat=None):
+        stats = measure(func, repeat or self.repeat, setup)
+        if rows:
+            stats['rows'] = int(rows)
+            stats['rows_per_s'] = rows / (stats['median_ms'] / 1000) if stats['median_ms'] else None
+        self.results.append({'suite': suite, 'name': name, 'scale': scale, **stats})
+        throughput = f"  ({stats['rows_per_s']:,.0f} rows/s)" if stats.get('rows_per_s') else ""
+        print(f"  {suite:<10} {name:<34} {scale:>5}  median {stats['median_ms']:>10.2f} ms{throughput}")
+
+# ============================================================================
+# SUITES
+# ============================================================================
+def frame_for_dashboard(df, limit=None):
+    """Rows as the dashboard holds them: hourly mean over the stations, newest first, with an id"""
+    frame = (df.groupby('fecha', sort=False)[MEASURES].mean()
+               .sort_index(ascending=False).reset_index())
+    frame.insert(0, 'id', np.arange(len(frame), 0, -1))
+    return frame.head(limit) if limit else frame
+
+def bench_statistics(run, df, scale):
+    series = df.iloc[::-1]
+    run.add('stats', 'calculate_data_quality', scale, lambda: calculate_data_quality(df), rows=len(df))
+    run.add('stats', 'detect_outliers', scale,
+            lambda: [detect_outliers(df[col]) for col in MEASURES], rows=len(df))
+    run.add('stats', 'compute_indicators', scale,
+            lambda: [compute_indicators(series[col].to_numpy(), 24) for col in MEASURES], rows=len(df))
+
+    def summary():
+        stats_df = df[MEASURES].describe().T
+        stats_df['skewness'] = [df[col].skew() for col in MEASURES]
+        stats_df['kurtosis'] = [df[col].kurtosis() for col in MEASURES]
+        return stats_df
+    run.add('stats', 'statistical_summary', scale, summary, rows=len(df))
+
+def bench_figures(run, frame, scale, max_rows=None):
+    frame = frame.head(max_rows) if max_rows else frame
+    for builder in FIGURE_BUILDERS:
+        build = getattr(EngineeringVisualizations, builder)
+        run.add('figures', builder, scale, lambda: build(frame), rows=len(frame))
+
+# Modules app.py imports before its first paint, and the ones it defers to the tabs
+DASHBOARD_IMPORTS = ('streamlit', 'profiling', 'database', 'analytics', 'data_pipeline',
+                     'visualizations', 'data_quality', 'stations', 'interpolation', 'alerts')
+DEFERRED_IMPORTS = ('scipy.stats', 'scipy.spatial', 'plotly.express', 'plotly.subplots', 'pydeck')
+
+def bench_startup(run):
+    """Fresh-interpreter import times: what a container restart pays before the first paint"""
+    src = os.path.dirname(os.path.abspath(__file__))
+
+    def python(*modules):
+        code = "; ".join(f"import {m}" for m in modules) or "pass"
+        return lambda: subprocess.run([sys.executable, "-c", code], cwd=src, check=True)
+
+    run.add('startup', 'interpreter', '-', python())
+    run.add('startup', 'import dashboard', '-', python(*DASHBOARD_IMPORTS))
+    run.add('startup', 'import deferred', '-', python(*DASHBOARD_IMPORTS, *DEFERRED_IMPORTS))
+
+def bench_transform(run, df, scale):
+    import etl_job
+    payload = to_api_payload(df[df['station_code'] == df['station_code'].iloc[0]])
+    run.add('etl', 'transform', scale, lambda: etl_job.transform(payload), rows=len(payload['hourly']['time']))
+
+def bench_database(run, db_url, df, scale, suites, max_load_rows):
+    import etl_job
+    pipeline = AirQualityDataPipeline(db_url)
+    engine = pipeline.engine
+    etl_job.ensure_schema(engine)
+
+    def truncate():
+        with connect(engine) as conn:
+            conn.execute(text("TRUNCATE mediciones_aire RESTART IDENTITY"))
+            conn.commit()
+
+    # ETL load: COPY + INSERT ... ON CONFLICT into an empty table
+    if 'etl' in suites:
+        with connect(engine) as conn:
+            station_id = station_ids(conn, [DEFAULT_STATION])[DEFAULT_STATION]
+        first = df[df['station_code'] == df['station_code'].iloc[0]]
+        load_df = etl_job.transform(to_api_payload(first.head(max_load_rows)), station_id)
+        run.add('etl', 'load', scale, lambda: etl_job.load(load_df, engine),
+                rows=len(load_df), setup=truncate, repeat=min(run.repeat, 3))
+    if 'queries' not in suites:
+        return
+
+    # Seed the full scale with COPY for the query paths
+    truncate()
+    seed_table(engine, df)
+    with connect(engine) as conn:
+        refresh_snapshot(conn)
+        conn.commit()
+        conn.execute(text("ANALYZE mediciones_aire"))
+        conn.commit()
+
+    cached = (AirQualityDataPipeline.execute_query,
+              AirQualityDataPipeline.get_snapshot,
+              AirQualityDataPipeline.get_indicators)
+
+    def cold():
+        for func in cached:
+            func.clear()
+
+    # COPY assigns ids in frame order after RESTART IDENTITY
+    middle = len(df) // 2
+    deep_cursor = (df['fecha'].iloc[middle], middle + 1)
+    with connect(engine) as conn:
+        one_station = (station_ids(conn, [df['station_code'].iloc[0]])[df['station_code'].iloc[0]],)
+    run.add('queries', 'get_all_data(10000)', scale, lambda: pipeline.get_all_data(10000), setup=cold)
+    run.add('queries', 'get_all_data(10000, station)', scale,
+            lambda: pipeline.get_all_data(10000, one_station), setup=cold)
+    run.add('queries', 'get_pages(first)', scale, lambda: pipeline.get_pages(None, 100), setup=cold)
+    run.add('queries', 'get_pages(middle)', scale, lambda: pipeline.get_pages(deep_cursor, 100), setup=cold)
+    run.add('queries', 'get_snapshot', scale, pipeline.get_snapshot, setup=cold)
+    run.add('queries', 'get_indicators(full)', scale,
+            lambda: pipeline.get_indicators(scale, 'pm10', 24), rows=len(df), setup=cold)
+    run.add('queries', 'get_snapshot(cached)', scale, pipeline.get_snapshot)
+
+def seed_table(engine, df):
+    """Bulk load measurements with COPY (much faster than the ETL's upserts).
+
+    The generator's stations are upserted into estaciones first and its
+    station codes mapped to their ids.
+    """
+    with connect(engine) as conn:
+        ids = upsert_stations(conn, df.attrs['stations'])
+        conn.commit()
+
+    buffer = io.StringIO()
+    (df.assign(station_id=df['station_code'].map(ids).astype(int))
+       [['station_id', 'fecha'] + MEASURES]
+       .to_csv(buffer, index=False, header=False))
+    buffer.seek(0)
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            cur.copy_expert(
+                "COPY mediciones_aire (station_id, fecha, pm10, pm2_5, dust) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+        raw.commit()
+    finally:
+        raw.close()
+
+def bench_url(db_url, schema):
+    """`db_url` with connections defaulting to `schema`, created if missing"""
+    url = make_url(db_url)
+    admin = create_engine(url)
+    with admin.connect() as conn:
+        conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
+        conn.commit()
+    admin.dispose()
+    url = url.update_query_dict({'options': f'-csearch_path={schema}'})
+    return url.render_as_string(hide_password=False)
+
+# ============================================================================
+# RESULTS
+# ============================================================================
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def save_results(run, args, output=None):
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pandas': pd.__version__,
+        'args': {k: v for k, v in vars(args).items() if k != 'db_url'},
+        'results': run.results
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}_{commit}.json")
+    with open(output, 'w') as fh:
+        json.dump(report, fh, indent=2, default=str)
+    return output
+
+def compare(results, baseline_path):
+    """Print median ratios (current / baseline) for the benchmarks both runs share"""
+    with open(baseline_path) as fh:
+        baseline = json.load(fh)
+    previous = {(r['suite'], r['name'], r['scale']): r for r in baseline['results']}
+    print(f"\nComparison against {baseline.get('commit', '?')} ({baseline_path})")
+    print(f"  {'benchmark':<46} {'scale':>5} {'before ms':>11} {'after ms':>11} {'ratio':>7}")
+    for r in results:
+        old = previous.get((r['suite'], r['name'], r['scale']))
+        if old is None:
+            continue
+        ratio = r['median_ms'] / old['median_ms'] if old['median_ms'] else float('nan')
+        flag = "  slower" if ratio > 1.1 else ("  faster" if ratio < 0.9 else "")
+        print(f"  {r['suite'] + '/' + r['name']:<46} {r['scale']:>5} {old['median_ms']:>11.2f} "
+              f"{r['median_ms']:>11.2f} {ratio:>6.2f}x{flag}")
+
+# ============================================================================
+# CLI
+# ============================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CanaryAir benchmark suite")
+    parser.add_argument('--scales', nargs='+', default=['7d', '1y'],
+                        help="History lengths to generate, e.g. 7d 1y 10y 30y")
+    parser.add_argument('--suites', nargs='+', default=['etl', 'queries', 'figures', 'stats', 'startup'],
+                        choices=['etl', 'queries', 'figures', 'stats', 'startup'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--stations', type=int, default=1, help="Synthetic stations per scale")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db-url', default=os.getenv('BENCHMARK_DATABASE_URL'),
+                        help="Postgres URL for the etl load and query suites (skipped if unset)")
+    parser.add_argument('--schema', default='canaryair_bench')
+    parser.add_argument('--max-load-rows', type=int, default=2000,
+                        help="Rows inserted by the ETL load benchmark")
+    parser.add_argument('--max-figure-rows', type=int, default=None,
+                        help="Cap the rows passed to figure builders (default: whole scale)")
+    parser.add_argument('--output', help="Results file (default: benchmarks/results/<time>_<commit>.json)")
+    parser.add_argument('--compare', metavar='BASELINE', help="Results file to compare against")
+    args = parser.parse_args(argv)
+
+    db_url = bench_url(args.db_url, args.schema) if args.db_url else None
+    if db_url is None and {'etl', 'queries'} & set(args.suites):
+        print("ℹ️  No --db-url / BENCHMARK_DATABASE_URL: skipping ETL load and query suites")
+
+    run = BenchmarkRun(args.repeat)
+    if 'startup' in args.suites:
+        print("\n[startup]")
+        bench_startup(run)
+    for scale in args.scales:
+        start = time.perf_counter()
+        df = generate_measurements(scale, n_stations=args.stations, seed=args.seed)
+        print(f"\n[{scale}] {len(df):,} rows generated ({parse_scale(scale):,} h x {args.stations} stations) "
+              f"in {time.perf_counter() - start:.2f}s")
+
+        if 'etl' in args.suites:
+            bench_transform(run, df, scale)
+        if db_url is not None and {'etl', 'queries'} & set(args.suites):
+            bench_database(run, db_url, df, scale, args.suites, args.max_load_rows)
+        frame = frame_for_dashboard(df)
+        if 'stats' in args.suites:
+            bench_statistics(run, frame, scale)
+        if 'figures' in args.suites:
+            bench_figures(run, frame, scale, args.max_figure_rows)
+
+    output = save_results(run, args, args.output)
+    print(f"\nResults saved to {os.path.normpath(output)}")
+    if args.compare:
+        compare(run.results, args.compare)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+import numpy as np
+from sqlalchemy import text
+
+from coordination import JOB_ROWS
+from variables import NAMES, ensure_columns, stored_variables
+
+# The ETL stage only needs numpy, like forecasting.py; the reads below that
+# build frames import pandas themselves.
+
+# ============================================================================
+# SCHEMA
+# ============================================================================
+# climatologia is the "normal" of every (station, variable) per month of year
+# and hour of day: count, mean and M2 (sum of squared deviations), so each
+# load merges its own batch statistics into the cells it touches instead of
+# rescanning the history. anomalias holds the z-score of every loaded reading
+# against its cell, one column per variable like mediciones_aire.
+# Every writer stamps its rows with a queue job (cola_etl.procesado tracks
+# them); estado_climatologia records the one-time fold of the history from
+# before the queue (carga IS NULL), up to the id it reached.
+CLIMATOLOGY_DDL = """
+    CREATE TABLE IF NOT EXISTS climatologia (
+        station_id INTEGER NOT NULL REFERENCES estaciones(id),
+        variable VARCHAR(64) NOT NULL,
+        mes SMALLINT NOT NULL,
+        hora SMALLINT NOT NULL,
+        n BIGINT NOT NULL,
+        mean FLOAT NOT NULL,
+        m2 FLOAT NOT NULL,
+        PRIMARY KEY (station_id, variable, mes, hora)
+    );
+    CREATE TABLE IF NOT EXISTS anomalias (
+        station_id INTEGER NOT NULL REFERENCES estaciones(id),
+        fecha TIMESTAMP NOT NULL,
+        PRIMARY KEY (station_id, fecha)
+    );
+    CREATE TABLE IF NOT EXISTS estado_climatologia (
+        id SMALLINT PRIMARY KEY CHECK (id = 1),
+        last_id BIGINT NOT NULL
+    );
+"""
+MIN_SAMPLES = 10    # cells with fewer readings are too young to score against
+CELLS = 12 * 24     # (month, hour) cells per station and variable
+
+def ensure_climatology(conn, names=NAMES):
+    """Create the climatology and anomaly tables (idempotent). The caller commits."""
+    conn.execute(text(CLIMATOLOGY_DDL))
+    ensure_columns(conn, 'anomalias', names)
+
+# ============================================================================
+# STREAMING STATISTICS
+# ============================================================================
+def batch_stats(cells, values, n_cells):
+    """(count, mean, M2) per cell × variable of a (rows × variables) batch; NaN is missing"""
+    valid = ~np.isnan(values)
+    count = np.zeros((n_cells, values.shape[1]))
+    total = np.zeros_like(count)
+    np.add.at(count, cells, valid)
+    np.add.at(total, cells, np.where(valid, values, 0.0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    m2 = np.zeros_like(count)
+    np.add.at(m2, cells, np.where(valid, values - mean[cells], 0.0) ** 2)
+    return count, np.nan_to_num(mean), m2
+
+def merge_stats(a, b):
+    """Combine two (count, mean, M2) summaries of disjoint samples (Chan et al.)"""
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = mean_b - mean_a
+        mean = np.where(n > 0, mean_a + delta * n_b / n, 0.0)
+        m2 = np.where(n > 0, m2_a + m2_b + delta ** 2 * n_a * n_b / n, 0.0)
+    return n, mean, m2
+
+def z_scores(values, n, mean, m2, min_samples=MIN_SAMPLES):
+    """z of each value against its cell's sample std; NaN for young or constant cells"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(m2 / (n - 1))
+        z = (values - mean) / std
+    return np.where((n >= min_samples) & (std > 0), z, np.nan)
+
+# ============================================================================
+# ETL STAGE
+# ============================================================================
+def refresh_climatology(conn, job_ids=(), variables=NAMES):
+    """Fold newly loaded rows into the climatology and score them.
+
+    `job_ids` are the queue jobs not processed yet (coordination.pending_jobs).
+    Chunks commit in any order across workers, so their rows are found
+    through the jobs rather than by id: a chunk committed late is folded by the
+    next run. Every writer stamps its rows with a job (loads outside the
+    queue through coordination.record_load), so only the history from before
+    the queue has carga IS NULL: the first run folds it once, by id. Each
+    reading is scored against its cell after the merge, which on that first
+    run gives every reading its full-history z-score. Raw rows later removed
+    by the retention stay in the baseline. Returns (rows scored, cells
+    updated). The caller commits.
+    """
+    ensure_climatology(conn, variables)
+    rows = []
+    if conn.execute(text("SELECT last_id FROM estado_climatologia WHERE id = 1")).scalar() is None:
+        upto = conn.execute(text("SELECT MAX(id) FROM mediciones_aire")).scalar() or 0
+        rows = conn.execute(text(f"""
+            SELECT station_id, fecha, {', '.join(variables)}
+            FROM mediciones_aire
+            WHERE id <= :upto AND carga IS NULL
+        """), {'upto': upto}).all()
+        conn.execute(text("INSERT INTO estado_climatologia (id, last_id) VALUES (1, :last_id)"), {'last_id': upto})
+    if job_ids:
+        rows += conn.execute(text(f"""
+            SELECT m.station_id, m.fecha, {', '.join('m.' + name for name in variables)}
+            {JOB_ROWS}
+        """), {'job_ids': list(job_ids)}).all()
+    if not rows:
+        return 0, 0
+
+    row_station, row_fecha, *row_values = zip(*rows)
+    values = np.array(row_values, dtype=float).reshape(len(variables), -1).T
+    hours = np.array(row_fecha, dtype='datetime64[h]')
+    month = hours.astype('datetime64[M]').astype(np.int64) % 12
+    hour = hours.astype(np.int64) % 24
+    keys = np.array(row_station, dtype=np.int64) * CELLS + month * 24 + hour
+    touched, cells = np.unique(keys, return_inverse=True)
+    batch = batch_stats(cells.ravel(), values, len(touched))
+
+    # Stored statistics of the touched cells only: (station, mes, hora) × variable, joined on the primary key
+    stored = [np.zeros_like(batch[0]) for _ in range(3)]
+    index = {int(key): i for i, key in enumerate(touched)}
+    column = {name: j for j, name in enumerate(variables)}
+    for row in conn.execute(text("""
+        SELECT c.station_id, c.variable, c.mes, c.hora, c.n, c.mean, c.m2
+        FROM unnest(CAST(:station_ids AS INTEGER[]), CAST(:meses AS SMALLINT[]), CAST(:horas AS SMALLINT[]))
+             AS t (station_id, mes, hora)
+        CROSS JOIN unnest(CAST(:variables AS VARCHAR[])) AS v (variable)
+        JOIN climatologia c ON c.station_id = t.station_id AND c.variable = v.variable
+                           AND c.mes = t.mes AND c.hora = t.hora
+    """), {'station_ids': (touched // CELLS).tolist(), 'meses': (touched % CELLS // 24 + 1).tolist(),
+          'horas': (touched % 24).tolist(), 'variables': list(variables)}):
+        i = index[row.station_id * CELLS + (row.mes - 1) * 24 + row.hora]
+        for stat, value in zip(stored, (row.n, row.mean, row.m2)):
+            stat[i, column[row.variable]] = value
+    n, mean, m2 = merge_stats(stored, batch)
+
+    updated = np.argwhere(batch[0] > 0)
+    conn.execute(text("""
+        INSERT INTO climatologia (station_id, variable, mes, hora, n, mean, m2)
+        VALUES (:station_id, :variable, :mes, :hora, :n, :mean, :m2)
+        ON CONFLICT (station_id, variable, mes, hora) DO UPDATE SET
+            n = EXCLUDED.n, mean = EXCLUDED.mean, m2 = EXCLUDED.m2
+    """), [{
+        'station_id': int(touched[i] // CELLS), 'variable': variables[j],
+        'mes': int(touched[i] % CELLS // 24 + 1), 'hora': int(touched[i] % 24),
+        'n': int(n[i, j]), 'mean': float(mean[i, j]), 'm2': float(m2[i, j])
+    } for i, j in updated])
+
+    cells = cells.ravel()
+    z = z_scores(values, n[cells], mean[cells], m2[cells])
+    scored = np.flatnonzero(~np.isnan(z).all(axis=1))
+    if len(scored):
+        conn.execute(text(f"""
+            INSERT INTO anomalias (station_id, fecha, {', '.join(variables)})
+            VALUES (:station_id, :fecha, {', '.join(':' + name for name in variables)})
+            ON CONFLICT (station_id, fecha) DO UPDATE SET
+                {', '.join(f"{name} = EXCLUDED.{name}" for name in variables)}
+        """), [{
+            'station_id': row_station[r], 'fecha': row_fecha[r],
+            **{name: (None if np.isnan(z[r, j]) else float(z[r, j])) for j, name in enumerate(variables)}
+        } for r in scored])
+    return len(scored), len(updated)
+
+# ============================================================================
+# READS (dashboard)
+# ============================================================================
+def read_climatology(conn, station_ids=None, variables=None):
+    """Normal per (variable, mes, hora): pooled count, mean and std over `station_ids`.
+
+    Pooling the cells' (n, mean, M2) is exact, so several stations read as
+    the distribution of all their readings; 288 rows per variable at most.
+    """
+    import pandas as pd
+
+    columns = ['variable', 'mes', 'hora', 'n', 'mean', 'std']
+    if conn.execute(text("SELECT to_regclass('climatologia')")).scalar() is None:
+        return pd.DataFrame(columns=columns)
+    conditions, params = [], {}
+    if station_ids is not None:
+        conditions.append("station_id = ANY(:station_ids)")
+        params['station_ids'] = list(station_ids)
+    if variables is not None:
+        conditions.append("variable = ANY(:variables)")
+        params['variables'] = list(variables)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return pd.read_sql_query(text(f"""
+        WITH c AS (
+            SELECT variable, mes, hora, n, mean, m2 FROM climatologia {where}
+        ), pooled AS (
+            SELECT variable, mes, hora, SUM(n) AS n, SUM(n * mean) / SUM(n) AS mean
+            FROM c GROUP BY variable, mes, hora
+        )
+        SELECT p.variable, p.mes, p.hora, p.n, p.mean,
+               SQRT(SUM(c.m2 + c.n * (c.mean - p.mean) ^ 2) / NULLIF(p.n - 1, 0)) AS std
+        FROM pooled p JOIN c USING (variable, mes, hora)
+        GROUP BY p.variable, p.mes, p.hora, p.n, p.mean
+        ORDER BY p.variable, p.mes, p.hora
+    """), conn, params=params)
+
+def episode_peak_z(conn, episodes):
+    """{episode id: highest z-score of its variable during the episode} for eventos_alerta rows"""
+    if not episodes or conn.execute(text("SELECT to_regclass('anomalias')")).scalar() is None:
+        return {}
+    scored = stored_variables(conn, 'anomalias')
+    peaks = {}
+    for variable in {e['variable'] for e in episodes if e['variable'] in scored}:
+        ids = [e['id'] for e in episodes if e['variable'] == variable]
+        peaks.update(conn.execute(text(f"""
+            SELECT e.id, MAX(a.{variable})
+            FROM eventos_alerta e
+            JOIN anomalias a ON a.station_id = e.station_id AND a.fecha >= e.started_at
+                            AND (e.ended_at IS NULL OR a.fecha <= e.ended_at)
+            WHERE e.id = ANY(:ids)
+            GROUP BY e.id
+        """), {'ids': ids}).all())
+    return peaks
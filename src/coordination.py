@@ -0,0 +1,320 @@
+"""Coordinación de varios workers ETL sobre la misma base de datos.
+
+El worker de Docker, el cron de GitHub Actions y cualquier otro host pueden
+ejecutar el ETL a la vez sin duplicar descargas ni pisarse:
+
+- Cada hora se encola una sola vez (cola_etl, UNIQUE por estación y hora).
+  Los workers reclaman trozos con FOR UPDATE SKIP LOCKED, así que ningún
+  trozo lo descarga más de uno y cada worker añadido suma rendimiento.
+- La carga de un trozo y su marca 'done' van en la misma transacción.
+  Sus filas llevan el id de la carga (mediciones_aire.carga), y las etapas
+  con estado procesan los trozos terminados y aún no procesados: los
+  trozos se confirman en cualquier orden, así que un id o una fecha como
+  marca de agua se saltaría las filas confirmadas tarde.
+- Las etapas con estado (esquema, alertas, pronósticos, climatología...) se
+  serializan con advisory locks de transacción, que funcionan también detrás
+  del pooler de Neon, donde los locks de sesión no se mantienen.
+
+    python src/coordination.py --backfill 2026-01-01 2026-03-31 [--stations 1 2]
+    python src/coordination.py --status
+"""
+import argparse
+import os
+import socket
+import sys
+from datetime import date, datetime, timedelta
+from itertools import groupby
+
+from sqlalchemy import text
+
+from database import get_shared_engine, connect, etl_database_url
+
+CHUNK_SIZE = int(os.getenv('ETL_CHUNK_SIZE', '50'))         # jobs (station × range) per claim, one API call each
+LEASE_MINUTES = int(os.getenv('ETL_LEASE_MINUTES', '15'))   # a 'running' job older than this is reclaimed
+MAX_ATTEMPTS = 3
+BACKFILL_DAYS = 7                                          # days per backfill job
+KEEP_DAYS = 7                                              # finished jobs kept for inspection
+
+# ============================================================================
+# ADVISORY LOCKS
+# ============================================================================
+# Keys are hashed from readable names. Transaction-level locks are released by
+# the commit/rollback itself, so a crashed worker can never leave one behind.
+SCHEMA_LOCK = 'canaryair:schema'
+POSTPROCESS_LOCK = 'canaryair:postprocess'
+
+def xact_lock(conn, name):
+    """Wait for the advisory lock `name` until the current transaction ends"""
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {'name': name})
+
+def try_xact_lock(conn, name):
+    """Take the advisory lock `name` for the current transaction if it is free; True if taken"""
+    return conn.execute(text("SELECT pg_try_advisory_xact_lock(hashtext(:name))"), {'name': name}).scalar()
+
+# ============================================================================
+# SCHEMA
+# ============================================================================
+# `slot` is the hour a scheduled job belongs to, or the first day of a
+# backfill range (end_date is then its last day, inclusive). `carga` is the
+# id stamped on the rows a chunk loaded (mediciones_aire.carga, the first job
+# id of its group) and `procesado` is set once the stateful stages have
+# folded them in; both are added to queues created before they existed.
+# 'manual' jobs record a load made outside the queue (record_load), so its
+# rows are post-processed like a chunk's: their slot is the time of the load
+# and `desde`..end_date the days their rows cover.
+QUEUE_DDL = """
+    CREATE TABLE IF NOT EXISTS cola_etl (
+        id BIGSERIAL PRIMARY KEY,
+        kind VARCHAR(10) NOT NULL,
+        station_id INTEGER NOT NULL REFERENCES estaciones(id),
+        slot TIMESTAMP NOT NULL,
+        end_date DATE,
+        status VARCHAR(10) NOT NULL DEFAULT 'pending',
+        attempts SMALLINT NOT NULL DEFAULT 0,
+        worker VARCHAR(128),
+        claimed_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        rows_loaded INTEGER,
+        error TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        CONSTRAINT unique_cola_etl UNIQUE (kind, station_id, slot)
+    );
+    ALTER TABLE cola_etl ADD COLUMN IF NOT EXISTS carga BIGINT;
+    ALTER TABLE cola_etl ADD COLUMN IF NOT EXISTS procesado BOOLEAN NOT NULL DEFAULT FALSE;
+    ALTER TABLE cola_etl ADD COLUMN IF NOT EXISTS desde DATE;
+    CREATE INDEX IF NOT EXISTS idx_cola_etl_pendientes
+        ON cola_etl (slot, id) WHERE status IN ('pending', 'running');
+    CREATE INDEX IF NOT EXISTS idx_cola_etl_sin_procesar
+        ON cola_etl (id) WHERE status = 'done' AND NOT procesado;
+"""
+
+def ensure_queue(conn):
+    """Create the job queue (idempotent). The caller commits."""
+    conn.execute(text(QUEUE_DDL))
+
+def worker_id():
+    """host:pid, recorded on the jobs this process claims"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+# ============================================================================
+# ENQUEUE
+# ============================================================================
+def enqueue_hourly(conn, station_ids, slot=None):
+    """One job per station for the current hour; returns how many were new.
+
+    Every worker that wakes up in the same hour enqueues the same rows, and
+    ON CONFLICT keeps the first, so the hour is fetched once. Finished jobs
+    older than KEEP_DAYS are pruned, once processed if they are done. The
+    caller commits.
+    """
+    slot = slot or datetime.now().replace(minute=0, second=0, microsecond=0)
+    conn.execute(text("""
+        DELETE FROM cola_etl
+        WHERE (status = 'failed' OR (status = 'done' AND procesado))
+          AND finished_at < CURRENT_TIMESTAMP - make_interval(days => :days)
+    """), {'days': KEEP_DAYS})
+    return conn.execute(text("""
+        INSERT INTO cola_etl (kind, station_id, slot)
+        SELECT 'hourly', station_id, :slot FROM unnest(CAST(:station_ids AS INTEGER[])) AS station_id
+        ON CONFLICT ON CONSTRAINT unique_cola_etl DO NOTHING
+    """), {'slot': slot, 'station_ids': list(station_ids)}).rowcount
+
+def enqueue_backfill(conn, start, end, station_ids, days=BACKFILL_DAYS):
+    """Jobs covering [start, end] (dates, inclusive) in `days`-day ranges per station. The caller commits."""
+    ranges = []
+    while start <= end:
+        ranges.append((start, min(start + timedelta(days=days - 1), end)))
+        start += timedelta(days=days)
+    return conn.execute(text("""
+        INSERT INTO cola_etl (kind, station_id, slot, end_date)
+        VALUES ('backfill', :station_id, :slot, :end_date)
+        ON CONFLICT ON CONSTRAINT unique_cola_etl DO NOTHING
+    """), [{'station_id': station_id, 'slot': first, 'end_date': last}
+           for first, last in ranges for station_id in station_ids]).rowcount
+
+# ============================================================================
+# CLAIM & COMPLETE
+# ============================================================================
+def claim(conn, worker, limit=CHUNK_SIZE):
+    """Lock up to `limit` runnable jobs for `worker`, oldest slot first.
+
+    SKIP LOCKED makes concurrent claimers take disjoint rows without waiting
+    on each other; jobs left 'running' past the lease by a dead worker are
+    runnable again, unless they already used MAX_ATTEMPTS: those are marked
+    'failed' here, as release() would have done. The caller commits right
+    away, so the rows stay locked only for the claim itself.
+    """
+    conn.execute(text("""
+        UPDATE cola_etl SET status = 'failed', finished_at = CURRENT_TIMESTAMP,
+                            error = COALESCE(error, 'lease expired after the last attempt')
+        WHERE id IN (
+            SELECT id FROM cola_etl
+            WHERE status = 'running' AND attempts >= :max_attempts
+              AND claimed_at < CURRENT_TIMESTAMP - make_interval(mins => :lease)
+            FOR UPDATE SKIP LOCKED
+        )
+    """), {'lease': LEASE_MINUTES, 'max_attempts': MAX_ATTEMPTS})
+    return [dict(row) for row in conn.execute(text("""
+        UPDATE cola_etl SET status = 'running', worker = :worker, claimed_at = CURRENT_TIMESTAMP,
+                            attempts = attempts + 1
+        WHERE id IN (
+            SELECT id FROM cola_etl
+            WHERE status = 'pending'
+               OR (status = 'running' AND attempts < :max_attempts
+                   AND claimed_at < CURRENT_TIMESTAMP - make_interval(mins => :lease))
+            ORDER BY slot, id
+            LIMIT :limit
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, kind, station_id, slot, end_date, attempts
+    """), {'worker': worker, 'lease': LEASE_MINUTES, 'max_attempts': MAX_ATTEMPTS,
+          'limit': int(limit)}).mappings()]
+
+def complete(conn, job_ids, rows_loaded, carga=None):
+    """Mark jobs done with the `carga` stamped on their rows; run it in the transaction that loaded them"""
+    conn.execute(text("""
+        UPDATE cola_etl SET status = 'done', finished_at = CURRENT_TIMESTAMP, rows_loaded = :rows, error = NULL,
+                            carga = :carga, procesado = FALSE
+        WHERE id = ANY(:ids)
+    """), {'ids': list(job_ids), 'rows': rows_loaded, 'carga': carga})
+
+def record_load(conn, ranges, worker=None):
+    """Register a load made outside the queue as one 'manual' job per station; returns (job ids, carga).
+
+    `ranges` is {station_id: (first day, last day)} of the rows about to be
+    loaded. Stamp them with the returned carga and complete() the jobs in
+    the same transaction, like work_queue does for a claimed chunk.
+    """
+    ids = [row[0] for row in conn.execute(text("""
+        INSERT INTO cola_etl (kind, station_id, slot, desde, end_date, status, attempts, worker, claimed_at)
+        SELECT 'manual', station_id, clock_timestamp(), desde, end_date, 'running', 1, :worker, CURRENT_TIMESTAMP
+        FROM unnest(CAST(:station_ids AS INTEGER[]), CAST(:desde AS DATE[]), CAST(:end_date AS DATE[]))
+             AS t (station_id, desde, end_date)
+        RETURNING id
+    """), {'station_ids': list(ranges), 'desde': [first for first, _ in ranges.values()],
+          'end_date': [last for _, last in ranges.values()], 'worker': worker or worker_id()})]
+    return ids, min(ids, default=None)
+
+def release(conn, job_ids, error):
+    """Return failed jobs to the queue, or give up on them after MAX_ATTEMPTS. The caller commits."""
+    conn.execute(text("""
+        UPDATE cola_etl
+        SET status = CASE WHEN attempts >= :max_attempts THEN 'failed' ELSE 'pending' END,
+            finished_at = CURRENT_TIMESTAMP, error = :error
+        WHERE id = ANY(:ids)
+    """), {'ids': list(job_ids), 'error': error[:2000], 'max_attempts': MAX_ATTEMPTS})
+
+def work_queue(engine, process, worker=None, limit=CHUNK_SIZE):
+    """Claim and process chunks until no runnable job is left; returns (jobs, rows parsed, rows new).
+
+    `process(conn, station_ids, start_date, end_date, carga)` downloads and
+    loads one group of jobs, stamping its rows with `carga`, and returns
+    (rows parsed, rows new) without committing. The dates are inclusive:
+    the slot's own day for hourly jobs (an hour that waited in the queue
+    still fetches its day, not today's) and the range for backfill jobs. A
+    failure returns the chunk to the queue and is raised (with the rest of
+    the claim), so the next run retries it.
+    """
+    worker = worker or worker_id()
+    totals = [0, 0, 0]
+    key = lambda job: (job['kind'], job['slot'], job['end_date'])
+    while True:
+        with connect(engine) as conn:
+            jobs = claim(conn, worker, limit)
+            conn.commit()
+        if not jobs:
+            return tuple(totals)
+
+        unfinished = {job['id'] for job in jobs}
+        try:
+            for (kind, slot, end_date), group in groupby(sorted(jobs, key=key), key=key):
+                group = list(group)
+                rango = (slot.date(), slot.date()) if kind == 'hourly' else (slot.date(), end_date)
+                carga = min(job['id'] for job in group)
+                with connect(engine, timeout_ms=0) as conn:
+                    parsed, new = process(conn, [job['station_id'] for job in group], *rango, carga)
+                    complete(conn, [job['id'] for job in group], new, carga)
+                    conn.commit()
+                unfinished.difference_update(job['id'] for job in group)
+                totals[0] += len(group)
+                totals[1] += parsed
+                totals[2] += new
+        except Exception as e:
+            with connect(engine) as conn:
+                release(conn, unfinished, str(e))
+                conn.commit()
+            raise
+
+# ============================================================================
+# POST-PROCESSING
+# ============================================================================
+# Rows of the given jobs: the job's station and days, loaded by its chunk.
+# The (station_id, fecha) unique index finds them, with no index on carga.
+JOB_ROWS = """
+    FROM cola_etl c
+    JOIN mediciones_aire m
+      ON m.station_id = c.station_id AND m.carga = c.carga
+     AND m.fecha >= COALESCE(c.desde, c.slot::date)
+     AND m.fecha < COALESCE(c.end_date, c.slot::date) + 1
+    WHERE c.id = ANY(:job_ids)
+"""
+
+def pending_jobs(conn):
+    """Ids of the done jobs whose rows the stateful stages have not processed yet.
+
+    Read it under POSTPROCESS_LOCK and mark_processed() them in the same
+    transaction: a chunk committed by a slower worker after the last run is
+    picked up by the next one, whatever its ids or dates.
+    """
+    return [row[0] for row in conn.execute(text("""
+        SELECT id FROM cola_etl WHERE status = 'done' AND NOT procesado ORDER BY id
+    """))]
+
+def mark_processed(conn, job_ids):
+    """Flag jobs as folded into the stateful stages. The caller commits."""
+    conn.execute(text("UPDATE cola_etl SET procesado = TRUE WHERE id = ANY(:ids)"), {'ids': list(job_ids)})
+
+def queue_status(conn):
+    """{(kind, status): jobs} of the queue"""
+    return {(kind, status): n for kind, status, n in conn.execute(text("""
+        SELECT kind, status, COUNT(*) FROM cola_etl GROUP BY kind, status ORDER BY kind, status
+    """))}
+
+# ============================================================================
+# CLI
+# ============================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cola de trabajos del ETL de CanaryAir")
+    parser.add_argument('--backfill', nargs=2, metavar=('INICIO', 'FIN'), type=date.fromisoformat,
+                        help="Encolar la descarga de un rango de fechas (inclusive); la procesan los workers")
+    parser.add_argument('--stations', nargs='+', type=int, help="Ids de estación (por defecto: todas las activas)")
+    parser.add_argument('--days', type=int, default=BACKFILL_DAYS, help="Días por trabajo de backfill")
+    parser.add_argument('--status', action='store_true', help="Mostrar el estado de la cola")
+    args = parser.parse_args(argv)
+
+    from schema import ensure_schema
+    from stations import active_stations
+
+    url, modo = etl_database_url()
+    print(f"🔌 Destino: {modo}")
+    engine = get_shared_engine(url)
+    ensure_schema(engine)
+    with connect(engine) as conn:
+        if args.backfill:
+            ids = args.stations or [e['id'] for e in active_stations(conn)]
+            nuevos = enqueue_backfill(conn, *args.backfill, ids, args.days)
+            conn.commit()
+            print(f"🧾 {nuevos} trabajos de backfill encolados ({args.backfill[0]} -> {args.backfill[1]}, "
+                  f"{len(ids)} estaciones); ejecuta etl_fast.py en uno o varios workers")
+        if args.status or not args.backfill:
+            for (kind, status), n in queue_status(conn).items():
+                print(f"   · {kind:<8} {status:<8} {n}")
+    return 0
+
+if __name__ == "__main__":
+    try:
+        from dotenv import load_dotenv  # Opcional: solo para desarrollo local
+        load_dotenv()
+    except ImportError:
+        pass
+    sys.exit(main())
@@ -0,0 +1,435 @@
+import io
+import time
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from sqlalchemy import text
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from profiling import monitor, tracked_cache
+from database import get_shared_engine, connect, submit_query, run_concurrently
+from metrics import read_snapshot
+from analytics import query_indicators
+from stations import REGIONS, STATION_COLUMNS, stations_in_bbox
+from alerts import active_alerts, recent_events
+from forecasting import read_forecasts
+from climatology import read_climatology, episode_peak_z
+from packed import PACKED_MIN_DAYS, missing_days, read_packed
+from variables import CORE_VARIABLES, KNOWN, stored_variables
+
+# ============================================================================
+# COMPACT DATASET
+# ============================================================================
+# The dashboard's main frame: float32 measures, datetime64[s] time (int64
+# epoch seconds underneath) and the station as a one-category Categorical.
+# It is shared by every session (st.cache_resource), so consumers must treat
+# it as read-only; under Copy-on-Write (always on in pandas 3) slices and
+# column selections are views until someone writes to them.
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)  # The default (and only) mode from pandas 3
+
+def compact_frame(rows, station_label, variables=CORE_VARIABLES):
+    """(id, fecha, *variables) rows -> compact frame, built without intermediate copies"""
+    columns = list(zip(*rows)) or [()] * (2 + len(variables))
+    data = {
+        'id': np.array(columns[0], dtype=np.int64),
+        'fecha': np.array(columns[1], dtype='datetime64[s]')
+    }
+    for name, values in zip(variables, columns[2:]):
+        data[name] = np.array(values, dtype=np.float32)  # None -> NaN
+    data['station'] = pd.Categorical.from_codes(np.zeros(len(data['id']), dtype=np.int8), [station_label])
+    return pd.DataFrame(data, copy=False)
+
+def rows_since(df, cutoff):
+    """Rows of a newest-first frame with fecha >= `cutoff`, as a view (binary search, no mask)"""
+    fechas = df['fecha'].to_numpy()[::-1]
+    n = len(fechas) - np.searchsorted(fechas, np.datetime64(cutoff, 's'), side='left')
+    return df.iloc[:n]
+
+# ============================================================================
+# DATABASE ENGINE & DATA PIPELINE
+# ============================================================================
+class QueryError(RuntimeError):
+    """A pipeline query failed; `fallback` is the empty result a page can render instead"""
+    
+    def __init__(self, message, fallback=None):
+        super().__init__(message)
+        self.fallback = fallback
+
+
+class AirQualityDataPipeline:
+    """Professional Data Pipeline for Air Quality Monitoring"""
+    
+    FILTERABLE_COLUMNS = KNOWN
+    
+    def __init__(self, connection_string, service_url=None, raise_errors=False):
+        # One pooled engine per process, shared by every session
+        self.engine = get_shared_engine(connection_string)
+        # Optional query service (query_service.py) shared by several dashboards
+        self.service_url = service_url.rstrip('/') if service_url else None
+        # The query service answers failures with an error status instead of empty results
+        self.raise_errors = raise_errors
+    
+    def _failed(self, message, fallback):
+        """Show a query error and return the empty `fallback`.
+        
+        With raise_errors, or on a thread with no Streamlit session to show it
+        in (the query pool, the warm-up), QueryError is raised instead: result()
+        shows it on the script thread, and the fallback is not cached.
+        """
+        if self.raise_errors or get_script_run_ctx(suppress_warning=True) is None:
+            raise QueryError(message, fallback)
+        st.error(message)
+        return fallback
+    
+    def submit(self, method, *args):
+        """Start `method(*args)` on the process-wide query pool; returns its Future.
+        
+        Submitted methods must not show spinners (show_spinner=False): the pool
+        threads have no session to draw them in. Read the Future with result().
+        """
+        return submit_query(method, *args)
+    
+    @staticmethod
+    def result(future):
+        """A submitted query's result, on the script thread: a failure is shown here and its fallback returned"""
+        try:
+            return future.result()
+        except QueryError as e:
+            st.error(str(e))
+            return e.fallback
+    
+    def gather(self, **calls):
+        """Run independent panel queries at once: gather(name=(method, *args), ...) -> {name: result}.
+        
+        Each call checks out its own pooled connection, so the page waits for
+        the slowest query instead of their sum. Cached methods keep their
+        caches, and their errors are shown on the script thread with the
+        usual fallbacks (empty frame or None).
+        """
+        started = time.perf_counter()
+        futures = {name: self.submit(method, *args) for name, (method, *args) in calls.items()}
+        results = {name: self.result(future) for name, future in futures.items()}
+        monitor.record('query', f"gather({', '.join(calls)})", time.perf_counter() - started)
+        return results
+    
+    def check_connection(self):
+        """(SELECT 1 round trip in seconds, rows in mediciones_aire), both queries in flight together"""
+        def ping():
+            start = time.perf_counter()
+            with connect(self.engine) as conn:
+                conn.execute(text("SELECT 1"))
+            return time.perf_counter() - start
+        
+        def count():
+            with connect(self.engine) as conn:
+                return conn.execute(text("SELECT COUNT(*) FROM mediciones_aire")).scalar()
+        
+        results = run_concurrently({'ping': (ping,), 'count': (count,)})
+        return results['ping'], results['count']
+    
+    @tracked_cache(st.cache_data(ttl=300, show_spinner="Executing SQL Query..."), name="execute_query")
+    def execute_query(_self, query, params=None, label="adhoc", timeout_ms=None):
+        """Execute parameterized SQL query with caching and a statement timeout"""
+        try:
+            start = time.perf_counter()
+            with connect(_self.engine, timeout_ms) as conn:
+                if params:
+                    df = pd.read_sql_query(text(query), conn, params=params)
+                else:
+                    df = pd.read_sql_query(text(query), conn)
+            monitor.record('query', label, time.perf_counter() - start,
+                           rows=len(df), nbytes=int(df.memory_usage(deep=True).sum()))
+            return df
+        except Exception as e:
+            return _self._failed(f"Query Execution Error: {str(e)}", pd.DataFrame())
+    
+    @tracked_cache(st.cache_data(ttl=60, show_spinner=False), name="get_snapshot")
+    def get_snapshot(_self):
+        """Single-row headline metrics maintained by the ETL"""
+        try:
+            with connect(_self.engine) as conn:
+                return read_snapshot(conn)
+        except Exception as e:
+            return _self._failed(f"Snapshot Query Error: {str(e)}", None)
+    
+    @tracked_cache(st.cache_data(ttl=3600, show_spinner=False), name="get_indicators")
+    def get_indicators(_self, data_version, column='pm10', window=6, start=None, end=None, station_ids=None):
+        """Rolling/trend indicators over any range of the history, computed in SQL.
+        
+        `data_version` (from the ETL snapshot) is only part of the cache key, so
+        results are reused until the next load changes the table.
+        """
+        try:
+            with connect(_self.engine) as conn:
+                return query_indicators(conn, column, window, start, end, station_ids)
+        except Exception as e:
+            return _self._failed(f"Indicator Query Error: {str(e)}", None)
+    
+    @tracked_cache(st.cache_data(ttl=60, show_spinner=False), name="get_alerts")
+    def get_alerts(_self, station_ids=None, episodes=20):
+        """Open alerts and the latest calima episodes, as maintained by the ETL.
+        
+        Returns None until the ETL has created the alert tables.
+        """
+        try:
+            with connect(_self.engine) as conn:
+                if conn.execute(text("SELECT to_regclass('eventos_alerta')")).scalar() is None:
+                    return None
+                recent = recent_events(conn, episodes, rule='calima', station_ids=station_ids)
+                peaks = episode_peak_z(conn, recent)
+                for episode in recent:
+                    episode['peak_z'] = peaks.get(episode['id'])
+                return {'active': active_alerts(conn, station_ids), 'episodes': recent}
+        except Exception as e:
+            return _self._failed(f"Alert Query Error: {str(e)}", None)
+    
+    @tracked_cache(st.cache_data(ttl=3600, show_spinner=False), name="get_forecasts")
+    def get_forecasts(_self, data_version, station_ids=None, horizon=72):
+        """Forecasts precomputed by the ETL, averaged over `station_ids`.
+        
+        Like get_indicators, `data_version` only keys the cache to the last load.
+        """
+        try:
+            with connect(_self.engine) as conn:
+                return read_forecasts(conn, station_ids, horizon)
+        except Exception as e:
+            return _self._failed(f"Forecast Query Error: {str(e)}", pd.DataFrame())
+    
+    @tracked_cache(st.cache_data(ttl=3600, show_spinner=False), name="get_climatology")
+    def get_climatology(_self, data_version, station_ids=None, variables=CORE_VARIABLES):
+        """Month × hour normals maintained by the ETL (pooled over `station_ids`), keyed to the last load"""
+        try:
+            with connect(_self.engine) as conn:
+                return read_climatology(conn, station_ids, variables)
+        except Exception as e:
+            return _self._failed(f"Climatology Query Error: {str(e)}", pd.DataFrame())
+    
+    @tracked_cache(st.cache_data(ttl=3600, show_spinner=False), name="get_variables")
+    def get_variables(_self):
+        """Variables the ETL stores (catalog ∩ mediciones_aire columns), core ones first"""
+        try:
+            with connect(_self.engine) as conn:
+                return stored_variables(conn) or CORE_VARIABLES
+        except Exception as e:
+            return _self._failed(f"Variable Query Error: {str(e)}", CORE_VARIABLES)
+    
+    @tracked_cache(st.cache_data(ttl=3600, show_spinner=False), name="get_stations")
+    def get_stations(_self, region=None):
+        """Active stations, optionally only those inside a REGIONS bounding box"""
+        try:
+            with connect(_self.engine) as conn:
+                if region is None:
+                    return pd.read_sql_query(
+                        text(f"SELECT {STATION_COLUMNS} FROM estaciones WHERE activa ORDER BY isla, nombre"), conn
+                    )
+                return pd.DataFrame(stations_in_bbox(conn, REGIONS[region]),
+                                    columns=[c.strip() for c in STATION_COLUMNS.split(',')])
+        except Exception as e:
+            return _self._failed(f"Station Query Error: {str(e)}", pd.DataFrame())
+    
+    @staticmethod
+    def all_data_query(limit=10000, station_ids=None, variables=CORE_VARIABLES):
+        """(query, params) for the latest `limit` hours of one station, or the hourly mean of several"""
+        params = {"limit": int(limit)}
+        if station_ids is not None and len(station_ids) == 1:
+            params["station_id"] = int(station_ids[0])
+            query = f"""
+                SELECT id, fecha, {', '.join(variables)}
+                FROM mediciones_aire
+                WHERE station_id = :station_id
+                ORDER BY fecha DESC
+                LIMIT :limit
+            """
+        else:
+            where = ""
+            if station_ids is not None:
+                where = "WHERE station_id = ANY(:station_ids)"
+                params["station_ids"] = [int(i) for i in station_ids]
+            query = f"""
+                SELECT MAX(id) AS id, fecha, {', '.join(f'AVG({v}) AS {v}' for v in variables)}
+                FROM mediciones_aire
+                {where}
+                GROUP BY fecha
+                ORDER BY fecha DESC
+                LIMIT :limit
+            """
+        return query, params
+    
+    def get_all_data(self, limit=10000, station_ids=None):
+        """Latest `limit` hours of one station, or the hourly mean of several (None = all)"""
+        query, params = self.all_data_query(limit, station_ids, self.get_variables())
+        return self.execute_query(query, params, label="get_all_data")
+    
+    @tracked_cache(st.cache_resource(max_entries=32, ttl=300, show_spinner=False), name="get_dataset")
+    def get_dataset(_self, data_version, limit=10000, station_ids=None):
+        """get_all_data() as one compact frame per process, shared by all sessions.
+        
+        st.cache_resource hands every session the same object instead of
+        unpickling a private copy per rerun; `data_version` (from the ETL
+        snapshot) keys it to the last load. The dashboard submits it to the
+        query pool and shows its own spinner while waiting.
+        """
+        variables = CORE_VARIABLES
+        try:
+            variables = _self.get_variables()
+            query, params = _self.all_data_query(limit, station_ids, variables)
+            start = time.perf_counter()
+            if _self.service_url:
+                df = _self.fetch_dataset(limit, station_ids)
+                monitor.record('query', 'get_dataset (service)', time.perf_counter() - start,
+                               rows=len(df), nbytes=int(df.memory_usage(deep=True).sum()))
+                return df
+            with connect(_self.engine) as conn:
+                rows = conn.execute(text(query), params).all()
+                if station_ids is not None and len(station_ids) == 1:
+                    label = conn.execute(text("SELECT codigo FROM estaciones WHERE id = :id"),
+                                         {"id": params["station_id"]}).scalar() or str(station_ids[0])
+                else:
+                    label = "MEAN" if station_ids is None else f"MEAN({len(station_ids)})"
+            df = compact_frame(rows, label, variables)
+            monitor.record('query', 'get_dataset', time.perf_counter() - start,
+                           rows=len(df), nbytes=int(df.memory_usage(deep=True).sum()))
+            return df
+        except Exception as e:
+            return _self._failed(f"Dataset Query Error: {str(e)}", compact_frame([], "", variables))
+    
+    def fetch_dataset(self, limit, station_ids):
+        """get_dataset() from the query service as Arrow (float32, timestamp[s] and categories survive)"""
+        import pyarrow as pa   # Installed with streamlit
+        
+        params = {"limit": int(limit), "format": "arrow"}
+        if station_ids is not None:
+            params["stations"] = ",".join(str(int(i)) for i in station_ids)
+        with urlopen(f"{self.service_url}/aggregate?{urlencode(params)}", timeout=60) as response:
+            return pa.ipc.open_stream(io.BytesIO(response.read())).read_pandas()
+    
+    def get_station_readings(self, station_ids, start, end=None):
+        """Hourly readings of `station_ids` from `start`, one row per (station, hour).
+        
+        Ranges of PACKED_MIN_DAYS or more are read from the packed day rows
+        (packed.py) when those hold every day of every station: ~24× fewer tuples.
+        """
+        if self.packed_covers(station_ids, start, end):
+            return self.get_packed_readings(tuple(int(i) for i in station_ids), start, end)
+        params = {"station_ids": [int(i) for i in station_ids], "start": start}
+        conditions = ["station_id = ANY(:station_ids)", "fecha >= :start"]
+        if end is not None:
+            conditions.append("fecha < :end")
+            params["end"] = end
+        query = f"""
+            SELECT station_id, fecha, {', '.join(self.get_variables())}
+            FROM mediciones_aire
+            WHERE {' AND '.join(conditions)}
+            ORDER BY fecha, station_id
+        """
+        return self.execute_query(query, params, label="get_station_readings")
+    
+    @tracked_cache(st.cache_data(ttl=60, show_spinner=False), name="get_packed_gaps")
+    def get_packed_gaps(_self, station_ids, first, last):
+        """Station-days of [first, last] missing from the packed tier (packed.missing_days), None if unused"""
+        try:
+            with connect(_self.engine) as conn:
+                return missing_days(conn, station_ids, first, last)
+        except Exception:
+            return None
+    
+    def packed_covers(self, station_ids, start, end=None):
+        """True if [start, end) is long enough to prefer the packed tier and it holds every station's days.
+        
+        Coverage is checked per station and day: a tier spanning the range
+        overall may still miss days of one station (packed before a late
+        backfill, or with PACKED_STORAGE off for a while), and those ranges
+        keep reading the hourly rows.
+        """
+        if end is None:
+            snapshot = self.get_snapshot()
+            end = snapshot['fecha_max'] if snapshot and snapshot.get('fecha_max') else None
+        if end is None or pd.Timestamp(end) - pd.Timestamp(start) < pd.Timedelta(days=PACKED_MIN_DAYS):
+            return False
+        station_ids = tuple(sorted({int(i) for i in station_ids}))
+        return self.get_packed_gaps(station_ids, pd.Timestamp(start).date(), pd.Timestamp(end).date()) == 0
+    
+    @tracked_cache(st.cache_data(ttl=300, show_spinner=False), name="get_packed_readings")
+    def get_packed_readings(_self, station_ids, start, end=None):
+        """get_station_readings() columns rebuilt from mediciones_dia (float32 measures)"""
+        try:
+            started = time.perf_counter()
+            with connect(_self.engine) as conn:
+                columns = read_packed(conn, station_ids, start, end, _self.get_variables())
+            df = pd.DataFrame(columns['values'], columns=list(columns['variables']))
+            df.insert(0, 'fecha', columns['fecha'])
+            df.insert(0, 'station_id', columns['station_id'])
+            monitor.record('query', 'get_packed_readings', time.perf_counter() - started,
+                           rows=len(df), nbytes=int(df.memory_usage(deep=True).sum()))
+            return df
+        except Exception as e:
+            return _self._failed(f"Packed History Error: {str(e)}", pd.DataFrame())
+    
+    def get_pages(self, cursor=None, page_size=100, pages=2, start=None, end=None, value_filters=None,
+                  station_ids=None):
+        """Keyset pagination over (fecha, id) DESC with the following pages prefetched.
+        
+        `cursor` is the (fecha, id) of the last row already shown (None for the
+        newest page). Up to `pages` consecutive pages are read in one round trip,
+        so the cost per page stays constant no matter how deep the user browses.
+        Pages are read directly, not through a shared cache: the session keeps
+        the ones it shows, so memory does not grow with how far users browse.
+        Returns a list of (page_df, next_cursor); next_cursor is None on the last page.
+        """
+        conditions = []
+        params = {"limit": page_size * pages + 1}
+        
+        if cursor is not None:
+            conditions.append("(fecha, id) < (:cursor_fecha, :cursor_id)")
+            params["cursor_fecha"], params["cursor_id"] = cursor
+        if start is not None:
+            conditions.append("fecha >= :start")
+            params["start"] = start
+        if end is not None:
+            conditions.append("fecha < :end")
+            params["end"] = end
+        if station_ids is not None:
+            conditions.append("station_id = ANY(:station_ids)")
+            params["station_ids"] = [int(i) for i in station_ids]
+        for col, (min_val, max_val) in (value_filters or {}).items():
+            if col not in self.FILTERABLE_COLUMNS:
+                raise ValueError(f"Cannot filter on column '{col}'")
+            if min_val is not None:
+                conditions.append(f"{col} >= :{col}_min")
+                params[f"{col}_min"] = min_val
+            if max_val is not None:
+                conditions.append(f"{col} <= :{col}_max")
+                params[f"{col}_max"] = max_val
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT id, station_id, fecha, {', '.join(self.get_variables())}
+            FROM mediciones_aire
+            {where}
+            ORDER BY fecha DESC, id DESC
+            LIMIT :limit
+        """
+        try:
+            started = time.perf_counter()
+            with connect(self.engine) as conn:
+                df = pd.read_sql_query(text(query), conn, params=params)
+            monitor.record('query', 'get_pages', time.perf_counter() - started,
+                           rows=len(df), nbytes=int(df.memory_usage(deep=True).sum()))
+        except Exception as e:
+            return self._failed(f"Page Query Error: {str(e)}", [])
+        
+        result = []
+        for i in range(pages):
+            page = df.iloc[i * page_size:(i + 1) * page_size]
+            if page.empty:
+                break
+            has_more = len(df) > (i + 1) * page_size
+            next_cursor = (page['fecha'].iloc[-1], int(page['id'].iloc[-1])) if has_more else None
+            result.append((page, next_cursor))
+            if not has_more:
+                break
+        return result
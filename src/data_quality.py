@@ -0,0 +1,42 @@
+from variables import KNOWN
+
+# ============================================================================
+# DATA QUALITY FUNCTIONS
+# ============================================================================
+def calculate_data_quality(df):
+    """Calculate comprehensive data quality metrics for every catalog variable in `df`"""
+    total_rows = len(df)
+    
+    if total_rows == 0:
+        return {}
+    
+    variables = [col for col in KNOWN if col in df.columns]
+    values = df[variables]
+    
+    quality_metrics = {
+        'completeness': {
+            **(values.notna().sum() / total_rows * 100).to_dict(),
+            'timestamp': (df['fecha'].notna().sum() / total_rows) * 100 if 'fecha' in df.columns else 0
+        },
+        'consistency': {
+            f'{col}_range': (low, high) for col, low, high in zip(variables, values.min(), values.max())
+        },
+        'validity': {
+            f'{col}_negative': int(count) for col, count in (values < 0).sum().items()
+        }
+    }
+    
+    return quality_metrics
+
+def detect_outliers(series):
+    """Number of values outside the 1.5×IQR fences"""
+    if len(series) < 2:
+        return 0
+    Q1 = series.quantile(0.25)
+    Q3 = series.quantile(0.75)
+    IQR = Q3 - Q1
+    if IQR == 0:
+        return 0
+    lower_bound = Q1 - 1.5 * IQR
+    upper_bound = Q3 + 1.5 * IQR
+    return ((series < lower_bound) | (series > upper_bound)).sum()
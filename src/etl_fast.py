@@ -0,0 +1,221 @@
+"""ETL ligero para el job horario de GitHub Actions.
+
+Las etapas (esquema, extract, load, climatología, alertas, pronósticos,
+snapshot e informe) viven solo aquí: etl_job.py (el scheduler de Docker) y el
+dashboard llaman a run_fast_etl. Sin pandas, requests ni el stack del dashboard: el JSON de la
+API se convierte directamente en una matriz float64 (filas × variables del
+catálogo, ver variables.py) y se carga con un solo COPY.
+Las descargas salen de la cola compartida (coordination.py), así que varios
+workers a la vez se reparten las estaciones y los backfills sin solaparse.
+Dependencias: requirements-etl.txt (SQLAlchemy, psycopg2 y numpy).
+
+    python src/etl_fast.py
+"""
+import io
+import json
+import os
+import sys
+import time
+from itertools import chain
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+import numpy as np
+from sqlalchemy import text
+
+from database import get_shared_engine, connect, etl_database_url
+from schema import ensure_schema
+from stations import active_stations
+from alerts import evaluate_alerts
+from forecasting import refresh_forecasts, HORIZON_H
+from retention import refresh_rollups
+from climatology import refresh_climatology
+from metrics import refresh_snapshot
+from packed import PACKED_STORAGE, refresh_packed
+from coordination import POSTPROCESS_LOCK, xact_lock, enqueue_hourly, work_queue, pending_jobs, mark_processed
+from variables import NAMES
+
+API_URL = "https://air-quality-api.open-meteo.com/v1/air-quality"
+
+# ============================================================================
+# EXTRACT
+# ============================================================================
+def extract(stations, start_date=None, end_date=None, variables=NAMES, timeout=30):
+    """Una sola petición para todas las estaciones y variables (urllib: sin dependencia de requests).
+
+    Sin fechas trae las últimas horas (past_days=1); con fechas, ese rango de
+    días completo (los trabajos de la cola siempre las pasan: el día de su hora
+    o el rango del backfill).
+    """
+    rango = {"past_days": 1} if start_date is None else {"start_date": str(start_date), "end_date": str(end_date)}
+    params = urlencode({
+        "latitude": ",".join(str(s['lat']) for s in stations),
+        "longitude": ",".join(str(s['lon']) for s in stations),
+        "hourly": ",".join(variables),
+        "timezone": "Europe/London",
+        **rango
+    })
+    with urlopen(f"{API_URL}?{params}", timeout=timeout) as response:
+        data = json.load(response)
+    return data if isinstance(data, list) else [data]
+
+# ============================================================================
+# PARSE: JSON -> matriz tipada
+# ============================================================================
+def parse(payloads, station_ids, variables=NAMES):
+    """Columnas de todas las estaciones: ids int32 y una matriz float64 filas × variables (NaN = nulo).
+
+    Cada estación se convierte con una sola llamada a numpy para todas sus
+    variables (None -> NaN), sin bucles por columna ni por fila; una variable
+    que la API no devuelve queda a NaN. Las fechas se quedan como el texto
+    ISO de la API, que Postgres ya entiende al hacer el COPY.
+    """
+    horas = [data['hourly']['time'] for data in payloads]
+    bloques = [
+        np.array([data['hourly'].get(v) or [None] * len(t) for v in variables], dtype=float).reshape(-1, len(t)).T
+        for data, t in zip(payloads, horas)
+    ]
+    return {
+        'station_id': np.repeat(np.asarray(station_ids, dtype=np.int32), [len(t) for t in horas]),
+        'fecha': list(chain.from_iterable(horas)),
+        'variables': tuple(variables),
+        'values': np.vstack(bloques) if bloques else np.empty((0, len(variables)))
+    }
+
+# ============================================================================
+# LOAD: COPY a una tabla temporal + INSERT ... ON CONFLICT
+# ============================================================================
+def _copy_buffer(columns):
+    """Texto del COPY; la matriz entera se formatea con numpy (repr más corto; NaN -> \\N)"""
+    values = columns['values']
+    cells = np.where(np.isnan(values), "\\N", values.astype(str))
+    lines = np.column_stack([columns['station_id'].astype(str), np.asarray(columns['fecha'], dtype=str), cells])
+    return io.StringIO("".join(line + "\n" for line in map("\t".join, lines.tolist())))
+
+def load(columns, conn, carga=None):
+    """Carga todas las filas en un solo COPY y devuelve cuántas eran nuevas. El caller hace commit.
+
+    Las filas nuevas quedan marcadas con `carga`, el trozo de la cola que las trajo.
+    """
+    nombres = ", ".join(columns['variables'])
+    conn.execute(text(f"""
+        CREATE TEMP TABLE staging_mediciones (
+            station_id INTEGER, fecha TIMESTAMP, {", ".join(f"{v} FLOAT" for v in columns['variables'])}
+        ) ON COMMIT DROP
+    """))
+    cursor = conn.connection.driver_connection.cursor()
+    cursor.copy_expert(f"COPY staging_mediciones (station_id, fecha, {nombres}) FROM STDIN", _copy_buffer(columns))
+    result = conn.execute(text(f"""
+        INSERT INTO mediciones_aire (station_id, fecha, {nombres}, carga)
+        SELECT station_id, fecha, {nombres}, CAST(:carga AS BIGINT) FROM staging_mediciones
+        ON CONFLICT (station_id, fecha) DO NOTHING
+    """), {'carga': carga})
+    return result.rowcount
+
+# ============================================================================
+# RUN
+# ============================================================================
+# Etapas que se notifican a `progress(etapa, **contadores)` al terminar cada una
+STAGES = ('schema', 'load', 'climatology', 'alerts', 'forecasts', 'rollups', 'snapshot', 'report')
+
+def run_fast_etl(url=None, extract_fn=extract, progress=None):
+    """Ejecuta todas las etapas; devuelve el número de registros nuevos.
+
+    Encola la hora actual (una vez, aunque otros workers también lo hagan) y
+    procesa trozos de la cola hasta vaciarla. Las etapas con estado se
+    ejecutan bajo un advisory lock, de una en una entre workers.
+    `progress`, si se pasa, recibe cada etapa de STAGES al completarse junto
+    con sus contadores (lo usa el dashboard para mostrar el avance).
+    Con REPORT_DIR definido, tras confirmar la carga renderiza el informe
+    estático (report.py), sea quien sea quien lanzó la ejecución.
+    """
+    progress = progress or (lambda etapa, **contadores: None)
+    inicio = time.perf_counter()
+    if url is None:
+        url, modo = etl_database_url()
+        print(f"🔌 Destino: {modo}")
+    engine = get_shared_engine(url)
+    ensure_schema(engine)
+    with connect(engine) as conn:
+        estaciones = active_stations(conn)
+        ids = [e['id'] for e in estaciones]
+        encolados = enqueue_hourly(conn, ids)
+        conn.commit()
+    progress('schema', stations=len(estaciones), queued_jobs=encolados)
+
+    # EXTRACT + LOAD de cada trozo reclamado (una petición a la API por trozo)
+    por_id = {e['id']: e for e in estaciones}
+    dias = []
+
+    def procesar(conn, station_ids, start_date, end_date, carga):
+        lote = [por_id[i] for i in station_ids if i in por_id]
+        if not lote:
+            return 0, 0
+        payloads = extract_fn(lote, start_date, end_date)
+        columnas = parse(payloads, [e['id'] for e in lote])
+        if columnas['fecha']:
+            dias.append(min(columnas['fecha'])[:10])
+        return len(columnas['fecha']), load(columnas, conn, carga)
+
+    t = time.perf_counter()
+    trabajos, registros, registros_nuevos = work_queue(engine, procesar)
+    print(f"📡 {trabajos} trabajos de la cola: {registros} registros, "
+          f"✅ {registros_nuevos} nuevos (COPY) en {time.perf_counter() - t:.2f}s")
+    progress('load', jobs=trabajos, rows=registros, new_rows=registros_nuevos)
+    if not trabajos:
+        print("💤 Nada pendiente: esta hora ya la descargó otro worker")
+        return 0
+
+    with connect(engine, timeout_ms=0) as conn:
+        t = time.perf_counter()
+        xact_lock(conn, POSTPROCESS_LOCK)  # Alertas, pronósticos... avanzan de un worker en uno
+        pendientes = pending_jobs(conn)    # Trozos confirmados sin procesar, de este worker o de otros
+        puntuadas, celdas = refresh_climatology(conn, pendientes)
+        progress('climatology', scored_rows=puntuadas, climatology_cells=celdas)
+        cambios = evaluate_alerts(conn, station_ids=ids, job_ids=pendientes)
+        progress('alerts', alert_changes=len(cambios))
+        series = refresh_forecasts(conn, ids)
+        progress('forecasts', forecast_series=series)
+        if dias:
+            refresh_rollups(conn, since=min(dias))  # Días tocados por la carga
+            if PACKED_STORAGE:
+                refresh_packed(conn, since=min(dias))
+        progress('rollups')
+        refresh_snapshot(conn, pendientes)  # Totales: los anteriores más las filas de estos trabajos
+        mark_processed(conn, pendientes)
+        conn.commit()
+        progress('snapshot')
+        for evento in cambios:
+            estado = "abierta" if evento['ended_at'] is None else f"cerrada {evento['ended_at']}"
+            print(f"🚨 [{evento['rule']}] estación {evento['station_id']}: {evento['started_at']} ({estado})")
+        print(f"📈 {puntuadas} registros con anomalía z, {celdas} celdas de climatología actualizadas")
+        print(f"🔔 {len(cambios)} alertas abiertas/cerradas, 🔮 {series} series a {HORIZON_H} h, "
+              f"📅 resúmenes diarios, 📌 snapshot en {time.perf_counter() - t:.2f}s")
+
+    # INFORME ESTÁTICO sobre lo ya confirmado: un fallo aquí no invalida la carga.
+    # report.py trae pandas y plotly, así que solo se importa si hay informe que generar
+    ficheros = []
+    if os.getenv('REPORT_DIR'):
+        t = time.perf_counter()
+        try:
+            from report import REPORT_DIR, render_report
+            ficheros = render_report(engine)
+            print(f"🖼️ Informe estático en {REPORT_DIR} ({len(ficheros)} ficheros) en {time.perf_counter() - t:.2f}s")
+        except Exception as e:
+            print(f"⚠️ No se pudo generar el informe estático: {e}")
+    progress('report', report_files=len(ficheros))
+
+    print(f"🏁 ETL rápido completado en {time.perf_counter() - inicio:.2f}s")
+    return registros_nuevos
+
+if __name__ == "__main__":
+    try:
+        from dotenv import load_dotenv  # Opcional: solo para desarrollo local
+        load_dotenv()
+    except ImportError:
+        pass
+    try:
+        run_fast_etl()
+    except Exception as e:
+        print(f"❌ ERROR CRÍTICO EN ETL: {e}")
+        sys.exit(1)
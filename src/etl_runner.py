@@ -0,0 +1,70 @@
+"""ETL runs started from the dashboard, in a background thread.
+
+app.py keeps one EtlRunner per process (st.cache_resource), so a click
+never blocks the session that made it. Clicks from any session while a run
+is in progress join that run instead of starting another one. Sessions poll
+state() for the stages completed so far and their counts.
+"""
+import threading
+import time
+
+from profiling import monitor
+
+class EtlRunner:
+    """Single-flight background runner of etl_fast.run_fast_etl"""
+
+    def __init__(self, url, on_success=None):
+        self.url = url
+        self.on_success = on_success
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_at = None
+        self._state = {'run': 0, 'status': 'idle'}
+
+    def start(self):
+        """Start a run unless one is in progress; True if this call started it"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._state = {
+                'run': self._state['run'] + 1, 'status': 'running', 'stages': [], 'counts': {},
+                'started_at': time.time(), 'finished_at': None, 'error': None
+            }
+            self._last_at = self._state['started_at']
+            self._thread = threading.Thread(target=self._run, name="etl-run", daemon=True)
+            self._thread.start()
+            return True
+
+    def state(self):
+        """Copy of the current (or last) run: status, completed (stage, seconds) pairs, counts"""
+        with self._lock:
+            state = dict(self._state)
+            if 'stages' in state:
+                state['stages'] = list(state['stages'])
+                state['counts'] = dict(state['counts'])
+            return state
+
+    @property
+    def running(self):
+        return self.state()['status'] == 'running'
+
+    def _progress(self, stage, **counts):
+        with self._lock:
+            now = time.time()
+            seconds, self._last_at = now - self._last_at, now
+            self._state['stages'].append((stage, seconds))
+            self._state['counts'].update(counts)
+        monitor.record('etl', stage, seconds)
+
+    def _run(self):
+        from etl_fast import run_fast_etl
+
+        try:
+            run_fast_etl(self.url, progress=self._progress)
+            if self.on_success:
+                self.on_success()   # Before 'done', so pollers that rerun see fresh caches
+            status, error = 'done', None
+        except Exception as e:
+            status, error = 'failed', str(e)
+        with self._lock:
+            self._state.update(status=status, error=error, finished_at=time.time())
@@ -0,0 +1,232 @@
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import text
+
+# The ETL stage only needs numpy, so the slim ETL (etl_fast.py) can run it
+# without pandas; read_forecasts() imports pandas for the dashboard.
+
+# ============================================================================
+# MODEL
+# ============================================================================
+# Additive exponential smoothing with an hour-of-day seasonal profile,
+# ETS(A,N,A). Seasonal slots are indexed by the clock hour, so gaps in the
+# series never shift the phase. All series (station × variable) advance
+# together as columns of one matrix, one vectorized step per hour.
+FORECAST_VARIABLES = ('pm10', 'dust')
+HORIZON_H = 72
+SEASON = 24
+ALPHA = 0.2         # level smoothing
+GAMMA = 0.1         # seasonal smoothing
+BETA = 0.05         # smoothing of the squared one-step errors (band width)
+Z_95 = 1.96
+
+def init_state(n_series):
+    """Empty model state for `n_series` series"""
+    return {
+        'level': np.full(n_series, np.nan),
+        'season': np.zeros((SEASON, n_series)),
+        'sigma2': np.zeros(n_series),
+        'n': np.zeros(n_series, dtype=np.int64)
+    }
+
+def update_state(state, hours, values):
+    """Advance the state over an (hours × series) matrix of observations.
+
+    `hours` is the clock hour (0-23) of each row; NaN observations leave
+    their series untouched. `state` is updated in place.
+    """
+    level, season, sigma2, n = state['level'], state['season'], state['sigma2'], state['n']
+    for hour, y in zip(hours, values):
+        valid = ~np.isnan(y)
+        first = valid & (n == 0)
+        level[first] = y[first]
+
+        update = valid & ~first
+        error = np.where(update, y - level - season[hour], 0.0)
+        level += ALPHA * error
+        season[hour] += GAMMA * error
+        sigma2[update] = (1 - BETA) * sigma2[update] + BETA * error[update] ** 2
+        n += valid
+    return state
+
+def forecast(state, origins, horizon=HORIZON_H):
+    """Point forecasts and 95% bands for `horizon` hours after each series' origin.
+
+    `origins` are datetime64[h]. Returns (fechas, yhat, lower, upper), all
+    (horizon × series); the band uses the ETS(A,N,A) h-step variance and is
+    clipped at zero.
+    """
+    steps = np.arange(1, horizon + 1)
+    origins = np.asarray(origins, dtype='datetime64[h]')
+    fechas = origins[None, :] + steps[:, None].astype('timedelta64[h]')
+    slots = fechas.astype(np.int64) % SEASON
+    columns = np.arange(len(origins))[None, :]
+
+    yhat = state['level'][None, :] + state['season'][slots, columns]
+    seasons_ahead = (steps - 1) // SEASON
+    variance = state['sigma2'][None, :] * (
+        1 + (steps[:, None] - 1) * ALPHA ** 2 + seasons_ahead[:, None] * GAMMA * (2 * ALPHA + GAMMA)
+    )
+    spread = Z_95 * np.sqrt(variance)
+    return fechas, np.clip(yhat, 0, None), np.clip(yhat - spread, 0, None), yhat + spread
+
+# ============================================================================
+# SCHEMA
+# ============================================================================
+# estado_pronostico keeps the fitted state per (station, variable) so each
+# ETL run only feeds the new hours; pronosticos holds the latest issued
+# forecast of every series, overlaid by the dashboard.
+FORECAST_DDL = """
+    CREATE TABLE IF NOT EXISTS estado_pronostico (
+        station_id INTEGER NOT NULL REFERENCES estaciones(id),
+        variable VARCHAR(16) NOT NULL,
+        last_fecha TIMESTAMP NOT NULL,
+        level FLOAT NOT NULL,
+        season FLOAT[] NOT NULL,
+        sigma2 FLOAT NOT NULL,
+        n BIGINT NOT NULL,
+        PRIMARY KEY (station_id, variable)
+    );
+    CREATE TABLE IF NOT EXISTS pronosticos (
+        station_id INTEGER NOT NULL REFERENCES estaciones(id),
+        variable VARCHAR(16) NOT NULL,
+        fecha TIMESTAMP NOT NULL,
+        horizon_h SMALLINT NOT NULL,
+        yhat FLOAT NOT NULL,
+        lower FLOAT NOT NULL,
+        upper FLOAT NOT NULL,
+        issued_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (station_id, variable, fecha)
+    );
+"""
+
+def ensure_forecasts(conn):
+    """Create the forecast tables (idempotent). The caller commits."""
+    conn.execute(text(FORECAST_DDL))
+
+# ============================================================================
+# ETL STAGE
+# ============================================================================
+def _load_states(conn, series):
+    rows = {
+        (row['station_id'], row['variable']): row
+        for row in conn.execute(text("""
+            SELECT station_id, variable, last_fecha, level, season, sigma2, n
+            FROM estado_pronostico
+        """)).mappings()
+    }
+    state = init_state(len(series))
+    last_fecha = [None] * len(series)
+    for i, key in enumerate(series):
+        if key in rows:
+            row = rows[key]
+            state['level'][i] = row['level']
+            state['season'][:, i] = row['season']
+            state['sigma2'][i] = row['sigma2']
+            state['n'][i] = row['n']
+            last_fecha[i] = row['last_fecha']
+    return state, last_fecha
+
+def refresh_forecasts(conn, station_ids, variables=FORECAST_VARIABLES, horizon=HORIZON_H):
+    """Feed the hours loaded since the last run into every model and reissue the forecasts.
+
+    Reads only rows newer than the oldest stored `last_fecha` (the first run
+    fits the whole history), then rewrites pronosticos for the series that
+    received data. Returns the number of series updated. The caller commits.
+    """
+    ensure_forecasts(conn)
+    series = [(station_id, variable) for station_id in station_ids for variable in variables]
+    state, last_fecha = _load_states(conn, series)
+    since = None if None in last_fecha else min(last_fecha)
+
+    rows = conn.execute(text(f"""
+        SELECT station_id, fecha, {', '.join(variables)}
+        FROM mediciones_aire
+        WHERE station_id = ANY(:station_ids) {'' if since is None else 'AND fecha > :since'}
+    """), {'station_ids': list(station_ids), 'since': since}).all()
+    if not rows:
+        return 0
+
+    # Hourly grid (datetime64[h] floors the timestamps) × series; readings that
+    # fall in the same hour are averaged, hours a series has already seen are masked
+    row_station, row_fecha, *row_values = zip(*rows)
+    row_hour = np.array(row_fecha, dtype='datetime64[h]')
+    grid_start = row_hour.min()
+    grid = np.arange(grid_start, row_hour.max() + 1)
+    row_slot = (row_hour - grid_start).astype(np.int64)
+    column = {key: i for i, key in enumerate(series)}
+
+    sums = np.zeros((len(grid), len(series)))
+    counts = np.zeros((len(grid), len(series)))
+    for variable, observations in zip(variables, row_values):
+        observations = np.array(observations, dtype=float)
+        cols = np.array([column[(station_id, variable)] for station_id in row_station])
+        valid = ~np.isnan(observations)
+        np.add.at(sums, (row_slot[valid], cols[valid]), observations[valid])
+        np.add.at(counts, (row_slot[valid], cols[valid]), 1)
+    with np.errstate(invalid='ignore'):
+        values = sums / counts
+    for i, seen in enumerate(last_fecha):
+        if seen is not None:
+            values[grid <= np.datetime64(seen, 'h'), i] = np.nan
+
+    update_state(state, grid.astype(np.int64) % SEASON, values)
+
+    observed = ~np.isnan(values)
+    updated = np.flatnonzero(observed.any(axis=0))
+    if len(updated) == 0:
+        return 0
+    origins = np.array([grid[np.flatnonzero(observed[:, i])[-1]] for i in updated])
+    fechas, yhat, lower, upper = forecast(
+        {k: (v[:, updated] if k == 'season' else v[updated]) for k, v in state.items()}, origins, horizon
+    )
+
+    issued_at = datetime.now()
+    conn.execute(text("""
+        INSERT INTO estado_pronostico (station_id, variable, last_fecha, level, season, sigma2, n)
+        VALUES (:station_id, :variable, :last_fecha, :level, :season, :sigma2, :n)
+        ON CONFLICT (station_id, variable) DO UPDATE SET
+            last_fecha = EXCLUDED.last_fecha, level = EXCLUDED.level, season = EXCLUDED.season,
+            sigma2 = EXCLUDED.sigma2, n = EXCLUDED.n
+    """), [{
+        'station_id': series[i][0], 'variable': series[i][1], 'last_fecha': origins[j].item(),
+        'level': float(state['level'][i]), 'season': state['season'][:, i].tolist(),
+        'sigma2': float(state['sigma2'][i]), 'n': int(state['n'][i])
+    } for j, i in enumerate(updated)])
+
+    conn.execute(text("DELETE FROM pronosticos WHERE station_id = :station_id AND variable = :variable"),
+                 [{'station_id': series[i][0], 'variable': series[i][1]} for i in updated])
+    fechas = fechas.astype('datetime64[s]').tolist()
+    conn.execute(text("""
+        INSERT INTO pronosticos (station_id, variable, fecha, horizon_h, yhat, lower, upper, issued_at)
+        VALUES (:station_id, :variable, :fecha, :horizon_h, :yhat, :lower, :upper, :issued_at)
+    """), [{
+        'station_id': series[i][0], 'variable': series[i][1],
+        'fecha': fechas[h][j], 'horizon_h': h + 1,
+        'yhat': float(yhat[h, j]), 'lower': float(lower[h, j]), 'upper': float(upper[h, j]),
+        'issued_at': issued_at
+    } for j, i in enumerate(updated) for h in range(horizon)])
+    return len(updated)
+
+# ============================================================================
+# READS (dashboard)
+# ============================================================================
+def read_forecasts(conn, station_ids=None, horizon=HORIZON_H):
+    """Latest forecasts averaged over `station_ids` per (variable, hour).
+
+    Averaging the per-station bands matches the dashboard's hourly mean of
+    several stations; it is slightly wider than the band of the mean.
+    """
+    import pandas as pd
+
+    if conn.execute(text("SELECT to_regclass('pronosticos')")).scalar() is None:
+        return pd.DataFrame(columns=['variable', 'fecha', 'yhat', 'lower', 'upper'])
+    where = "" if station_ids is None else "AND station_id = ANY(:station_ids)"
+    return pd.read_sql_query(text(f"""
+        SELECT variable, fecha, AVG(yhat) AS yhat, AVG(lower) AS lower, AVG(upper) AS upper
+        FROM pronosticos
+        WHERE horizon_h <= :horizon {where}
+        GROUP BY variable, fecha
+        ORDER BY variable, fecha
+    """), conn, params={'horizon': int(horizon), 'station_ids': list(station_ids or [])})
@@ -0,0 +1,82 @@
+import numpy as np
+
+# ============================================================================
+# GRID
+# ============================================================================
+EARTH_KM_PER_DEG = 111.32
+
+def make_grid(bbox, cells=100):
+    """Regular lon/lat grid over (lon_min, lat_min, lon_max, lat_max).
+
+    `cells` cells along the longer side; returns flattened cell corners
+    (lon, lat) and the cell size in metres for the map layer.
+    """
+    lon_min, lat_min, lon_max, lat_max = bbox
+    step = max(lon_max - lon_min, lat_max - lat_min) / cells
+    lons = np.arange(lon_min, lon_max, step)
+    lats = np.arange(lat_min, lat_max, step)
+    grid_lon, grid_lat = np.meshgrid(lons, lats)
+    cell_size_m = step * EARTH_KM_PER_DEG * np.cos(np.radians((lat_min + lat_max) / 2)) * 1000
+    return grid_lon.ravel(), grid_lat.ravel(), cell_size_m
+
+def _planar(lon, lat, ref_lat):
+    """Approximate km coordinates so KD-tree distances are isotropic at these latitudes"""
+    return np.column_stack([
+        np.asarray(lon) * EARTH_KM_PER_DEG * np.cos(np.radians(ref_lat)),
+        np.asarray(lat) * EARTH_KM_PER_DEG
+    ])
+
+# ============================================================================
+# INVERSE DISTANCE WEIGHTING
+# ============================================================================
+def idw_weights(station_lon, station_lat, grid_lon, grid_lat, k=6, power=2, max_distance_km=None):
+    """Neighbour indices and IDW weights of every grid cell, from one KD-tree query.
+
+    Stations don't move, so this is computed once and reused for every hour.
+    Returns (idx, weights, inside): (cells, k) arrays and a mask of the cells
+    within `max_distance_km` of their nearest station.
+    """
+    from scipy.spatial import cKDTree  # deferred: only the map tab needs scipy
+
+    ref_lat = float(np.mean(station_lat))
+    tree = cKDTree(_planar(station_lon, station_lat, ref_lat))
+    k = min(k, len(station_lon))
+    dist, idx = tree.query(_planar(grid_lon, grid_lat, ref_lat), k=k)
+    if k == 1:
+        dist, idx = dist[:, None], idx[:, None]
+
+    weights = 1.0 / np.maximum(dist, 1e-6) ** power
+    inside = np.ones(len(grid_lon), dtype=bool) if max_distance_km is None else dist[:, 0] <= max_distance_km
+    return idx, weights, inside
+
+def idw_interpolate(values, idx, weights):
+    """Interpolate a (hours, stations) matrix onto the grid: (hours, cells).
+
+    Missing readings are skipped per hour by renormalising the remaining
+    weights; cells with no valid neighbour are NaN.
+    """
+    values = np.asarray(values, dtype=np.float32)
+    neighbours = values[:, idx]                              # (hours, cells, k)
+    valid = ~np.isnan(neighbours)
+    w = weights.astype(np.float32)[None, :, :] * valid
+    numerator = (np.where(valid, neighbours, 0.0) * w).sum(axis=-1)
+    denominator = w.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denominator > 0, numerator / denominator, np.nan).astype(np.float32)
+
+def interpolate_surfaces(station_lon, station_lat, values, bbox, cells=100, k=6, power=2,
+                         max_distance_km=60):
+    """IDW surfaces of every hour in `values` (hours × stations) over `bbox`.
+
+    Returns a dict with the grid corners inside the station coverage
+    ('lon', 'lat'), 'cell_size_m' and 'surfaces' (hours × cells, float32).
+    """
+    grid_lon, grid_lat, cell_size_m = make_grid(bbox, cells)
+    idx, weights, inside = idw_weights(station_lon, station_lat, grid_lon, grid_lat,
+                                       k, power, max_distance_km)
+    return {
+        'lon': grid_lon[inside],
+        'lat': grid_lat[inside],
+        'cell_size_m': cell_size_m,
+        'surfaces': idw_interpolate(values, idx[inside], weights[inside])
+    }
@@ -0,0 +1,384 @@
+"""Headless load test: N concurrent sessions clicking through the dashboard.
+
+Each simulated session speaks Streamlit's websocket protocol like a browser tab:
+it reruns the app, switches analysis tabs (fragment reruns) and changes the
+Time Range / Data Points Limit selectors (full reruns). Reported: p50/p95/p99
+rerun latency per action, database connections in use and server memory.
+
+    # spawn `streamlit run app.py` on a local Postgres seeded with 1 year of synthetic data
+    python load_test.py --db-url postgresql+psycopg2://user@localhost:5433/canaryair --seed-scale 1y --sessions 20
+
+    # embedded throwaway Postgres (pip install pgserver)
+    python load_test.py --embedded /tmp/canaryair-pg --seed-scale 1y --sessions 20
+
+    # an already running server (pass its pid to sample memory)
+    python load_test.py --url http://localhost:8501 --server-pid 12345 --db-url ... --sessions 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime
+
+import numpy as np
+import websockets
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+CONTROL_LABELS = {'time_range': "Time Range", 'limit': "Data Points Limit"}
+
+# ============================================================================
+# SIMULATED SESSION
+# ============================================================================
+class SimulatedSession:
+    """One browser tab: keeps its widget values and replays them on every rerun"""
+
+    def __init__(self, ws_url, rng, timeout=120):
+        self.ws_url = ws_url
+        self.rng = rng
+        self.timeout = timeout
+        self.ws = None
+        self.widgets = {}        # label -> {'id', 'options', 'fragment_id'}
+        self.tabs = None         # {'id', 'labels', 'fragment_id'}
+        self.states = {}         # widget id -> selected option / tab label
+        self.samples = []        # (action, seconds, ok)
+
+    async def __aenter__(self):
+        self.ws = await websockets.connect(self.ws_url, subprotocols=["streamlit"],
+                                           max_size=None, open_timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.ws.close()
+
+    async def rerun(self, action, fragment_id=""):
+        """Send a rerun with the current widget values and wait for the script to finish"""
+        msg = BackMsg()
+        client_state = msg.rerun_script
+        client_state.fragment_id = fragment_id
+        for widget_id, value in self.states.items():
+            state = client_state.widget_states.widgets.add()
+            state.id = widget_id
+            state.string_value = value
+
+        start = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        ok = await asyncio.wait_for(self._read_until_finished(), self.timeout)
+        self.samples.append((action, time.perf_counter() - start, ok))
+
+    async def _read_until_finished(self):
+        ok = True
+        tab_labels = []
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(await self.ws.recv())
+            kind = fwd.WhichOneof('type')
+            if kind == 'script_finished':
+                if tab_labels and self.tabs is not None:
+                    self.tabs['labels'] = tab_labels
+                return ok and fwd.script_finished != ForwardMsg.FINISHED_WITH_COMPILE_ERROR
+            if kind != 'delta':
+                continue
+
+            delta = fwd.delta
+            if delta.WhichOneof('type') == 'new_element':
+                element_kind = delta.new_element.WhichOneof('type')
+                element = getattr(delta.new_element, element_kind)
+                if element_kind == 'exception':
+                    ok = False
+                elif element_kind == 'selectbox':
+                    self.widgets[element.label] = {'id': element.id, 'options': list(element.options),
+                                                   'fragment_id': delta.fragment_id}
+            elif delta.WhichOneof('type') == 'add_block':
+                block = delta.add_block
+                if block.WhichOneof('type') == 'tab_container':
+                    self.tabs = {'id': block.tab_container.id, 'labels': [],
+                                 'fragment_id': delta.fragment_id}
+                elif block.WhichOneof('type') == 'tab':
+                    tab_labels.append(block.tab.label)
+
+    async def act(self):
+        """Perform one random click: switch tab or change a data control"""
+        choices = ['tab', 'tab', 'time_range', 'limit'] if self.tabs else ['time_range', 'limit']
+        action = self.rng.choice(choices)
+
+        if action == 'tab':
+            current = self.states.get(self.tabs['id'], self.tabs['labels'][0])
+            label = self.rng.choice([l for l in self.tabs['labels'] if l != current] or [current])
+            self.states[self.tabs['id']] = label
+            await self.rerun('tab', self.tabs['fragment_id'])
+            return
+
+        widget = self.widgets.get(CONTROL_LABELS[action])
+        if widget is None:
+            await self.rerun('initial')
+            return
+        self.states[widget['id']] = self.rng.choice(widget['options'])
+        await self.rerun(action, widget['fragment_id'])
+
+async def run_session(index, args, ws_url, stop_at):
+    rng = random.Random(args.seed + index)
+    await asyncio.sleep(args.ramp_up * index / max(args.sessions, 1))
+    try:
+        async with SimulatedSession(ws_url, rng, args.timeout) as session:
+            await session.rerun('initial')
+            for _ in range(args.actions):
+                if time.monotonic() > stop_at:
+                    break
+                await asyncio.sleep(rng.uniform(0, args.think))
+                await session.act()
+            return session.samples
+    except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+        print(f"  session {index}: {type(e).__name__}: {e}")
+        return [('session_error', 0.0, False)]
+
+# ============================================================================
+# RESOURCE SAMPLING
+# ============================================================================
+def process_rss_mb(pid):
+    """Resident memory of `pid` and its children in MB (psutil, or /proc on Linux)"""
+    try:
+        import psutil
+    except ImportError:
+        try:
+            with open(f"/proc/{pid}/status") as fh:
+                for line in fh:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            return None
+        return None
+    try:
+        proc = psutil.Process(pid)
+        procs = [proc] + proc.children(recursive=True)
+        return sum(p.memory_info().rss for p in procs) / 1024 / 1024
+    except psutil.Error:
+        return None
+
+class ResourceSampler:
+    """Polls database connections and server memory while the load runs"""
+
+    def __init__(self, db_url=None, server_pid=None, interval=0.25):
+        self.engine = create_engine(db_url, poolclass=NullPool) if db_url else None
+        self.server_pid = server_pid
+        self.interval = interval
+        self.connections = []
+        self.memory = []
+
+    def sample(self):
+        if self.engine is not None:
+            with self.engine.connect() as conn:
+                self.connections.append(conn.execute(text("""
+                    SELECT COUNT(*) FROM pg_stat_activity
+                    WHERE datname = current_database() AND pid <> pg_backend_pid()
+                """)).scalar())
+        if self.server_pid:
+            rss = process_rss_mb(self.server_pid)
+            if rss is not None:
+                self.memory.append(rss)
+
+    async def run(self, stop):
+        while not stop.is_set():
+            await asyncio.to_thread(self.sample)
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def summary(self):
+        result = {}
+        if self.connections:
+            result['db_connections'] = {'peak': int(max(self.connections)),
+                                        'mean': float(np.mean(self.connections))}
+        if self.memory:
+            result['server_memory_mb'] = {'start': self.memory[0], 'peak': max(self.memory),
+                                          'end': self.memory[-1]}
+        return result
+
+# ============================================================================
+# BACKEND & SERVER
+# ============================================================================
+def embedded_database_url(pgdata):
+    """Throwaway Postgres from the optional `pgserver` package"""
+    try:
+        import pgserver
+    except ImportError:
+        sys.exit("--embedded needs the pgserver package (pip install pgserver)")
+    server = pgserver.get_server(pgdata)
+    url = make_url(server.get_uri()).set(drivername='postgresql+psycopg2')
+    return url.render_as_string(hide_password=False)
+
+def seed_database(db_url, scale, n_stations=1, seed=0):
+    """Load `scale` of synthetic history into the load-test schema and refresh the snapshot"""
+    import etl_job
+    from benchmark import seed_table
+    from database import connect, get_shared_engine
+    from metrics import refresh_snapshot
+    from synthetic_data import generate_measurements
+
+    engine = get_shared_engine(db_url)
+    etl_job.ensure_schema(engine)
+    df = generate_measurements(scale, n_stations=n_stations, seed=seed)
+    with connect(engine) as conn:
+        conn.execute(text("TRUNCATE mediciones_aire RESTART IDENTITY"))
+        conn.commit()
+    seed_table(engine, df)
+    with connect(engine) as conn:
+        refresh_snapshot(conn)
+        conn.commit()
+    engine.dispose()
+    return len(df)
+
+def spawn_server(port, db_url):
+    """`streamlit run app.py` in a child process, returned once it answers health checks"""
+    env = dict(os.environ, DATABASE_URL_CLOUD=db_url)
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', APP_PATH,
+         '--server.headless', 'true', '--server.port', str(port),
+         '--browser.gatherUsageStats', 'false'],
+        env=env, cwd=os.path.dirname(APP_PATH),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    health = f"http://localhost:{port}/_stcore/health"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"streamlit exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(health, timeout=2) as resp:
+                if resp.status == 200:
+                    return proc
+        except OSError:
+            time.sleep(0.5)
+    proc.terminate()
+    sys.exit("streamlit did not become healthy within 60s")
+
+# ============================================================================
+# REPORT
+# ============================================================================
+def latency_table(samples):
+    """p50/p95/p99/max rerun latency (ms) per action and overall"""
+    by_action = {}
+    for action, seconds, ok in samples:
+        by_action.setdefault(action, []).append((seconds, ok))
+    by_action['all'] = [(s, ok) for _, s, ok in samples]
+
+    rows = {}
+    for action, values in by_action.items():
+        ok_times = np.array([s for s, ok in values if ok]) * 1000
+        row = {'count': len(values), 'errors': sum(1 for _, ok in values if not ok)}
+        if len(ok_times):
+            p50, p95, p99 = np.percentile(ok_times, [50, 95, 99])
+            row.update(p50_ms=float(p50), p95_ms=float(p95), p99_ms=float(p99),
+                       max_ms=float(ok_times.max()))
+        rows[action] = row
+    return rows
+
+def print_report(report):
+    print(f"\nSessions: {report['sessions']}  reruns: {report['latency']['all']['count']}  "
+          f"duration: {report['duration_s']:.1f}s  throughput: {report['reruns_per_s']:.1f} reruns/s")
+    print(f"  {'action':<12} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for action, row in report['latency'].items():
+        print(f"  {action:<12} {row['count']:>6} {row['errors']:>6} {row.get('p50_ms', float('nan')):>9.1f} "
+              f"{row.get('p95_ms', float('nan')):>9.1f} {row.get('p99_ms', float('nan')):>9.1f} "
+              f"{row.get('max_ms', float('nan')):>9.1f}")
+    if 'db_connections' in report:
+        print(f"  DB connections: peak {report['db_connections']['peak']}, "
+              f"mean {report['db_connections']['mean']:.1f}")
+    if 'server_memory_mb' in report:
+        mem = report['server_memory_mb']
+        print(f"  Server memory: {mem['start']:.0f} MB -> peak {mem['peak']:.0f} MB (end {mem['end']:.0f} MB)")
+
+# ============================================================================
+# CLI
+# ============================================================================
+async def run_load(args, ws_url, db_url, server_pid):
+    sampler = ResourceSampler(db_url, server_pid)
+    stop = asyncio.Event()
+    sampler_task = asyncio.create_task(sampler.run(stop))
+
+    start = time.monotonic()
+    stop_at = start + args.duration if args.duration else float('inf')
+    results = await asyncio.gather(*(run_session(i, args, ws_url, stop_at) for i in range(args.sessions)))
+    duration = time.monotonic() - start
+
+    stop.set()
+    await sampler_task
+    samples = [sample for session in results for sample in session]
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'sessions': args.sessions,
+        'actions_per_session': args.actions,
+        'duration_s': duration,
+        'reruns_per_s': len(samples) / duration if duration else 0.0,
+        'latency': latency_table(samples),
+        **sampler.summary()
+    }
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CanaryAir dashboard load test")
+    parser.add_argument('--sessions', type=int, default=10, help="Concurrent simulated sessions")
+    parser.add_argument('--actions', type=int, default=20, help="Clicks per session after the first load")
+    parser.add_argument('--think', type=float, default=0.5, help="Max random pause between clicks (s)")
+    parser.add_argument('--ramp-up', type=float, default=5.0, help="Seconds over which sessions connect")
+    parser.add_argument('--duration', type=float, default=None, help="Stop clicking after this many seconds")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Max seconds per rerun")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', help="Running dashboard (default: spawn one)")
+    parser.add_argument('--port', type=int, default=8599, help="Port for the spawned dashboard")
+    parser.add_argument('--server-pid', type=int, help="Pid of the --url server, for memory sampling")
+    parser.add_argument('--db-url', default=os.getenv('LOADTEST_DATABASE_URL'),
+                        help="Postgres backing the dashboard (connections are sampled from it)")
+    parser.add_argument('--embedded', metavar='PGDATA', help="Use an embedded Postgres (pgserver) instead")
+    parser.add_argument('--schema', default='canaryair_load', help="Schema used when seeding")
+    parser.add_argument('--seed-scale', help="Seed synthetic history first, e.g. 30d, 1y, 10y")
+    parser.add_argument('--stations', type=int, default=1, help="Synthetic stations when seeding")
+    parser.add_argument('--output', help="Write the report as JSON")
+    args = parser.parse_args(argv)
+
+    db_url = embedded_database_url(args.embedded) if args.embedded else args.db_url
+    if args.seed_scale:
+        if db_url is None:
+            sys.exit("--seed-scale needs --db-url or --embedded")
+        from benchmark import bench_url
+        db_url = bench_url(db_url, args.schema)
+        rows = seed_database(db_url, args.seed_scale, args.stations, args.seed)
+        print(f"🌱 Seeded {rows:,} synthetic rows ({args.seed_scale}) into schema '{args.schema}'")
+
+    server = None
+    if args.url:
+        base_url, server_pid = args.url.rstrip('/'), args.server_pid
+    else:
+        if db_url is None:
+            sys.exit("Spawning the dashboard needs --db-url or --embedded")
+        server = spawn_server(args.port, db_url)
+        base_url, server_pid = f"http://localhost:{args.port}", server.pid
+        print(f"🚀 Dashboard started on {base_url} (pid {server_pid})")
+    ws_url = base_url.replace('http', 'ws', 1) + "/_stcore/stream"
+
+    try:
+        report = asyncio.run(run_load(args, ws_url, db_url, server_pid))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nReport saved to {args.output}")
+
+if __name__ == "__main__":
+    sys.exit(main())
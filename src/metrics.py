@@ -0,0 +1,204 @@
+from datetime import datetime
+
+from sqlalchemy import text
+
+from alerts import status_bands
+from coordination import JOB_ROWS
+
+# ============================================================================
+# AIR QUALITY INDEX & STATUS LEVELS
+# ============================================================================
+# (warning, critical) limits in µg/m³, the entry thresholds of the alert rules
+STATUS_BANDS = status_bands()
+
+def calculate_air_quality_index(pm10, pm25):
+    """Calculate professional AQI based on EPA standards"""
+    try:
+        pm10 = float(pm10)
+        pm25 = float(pm25)
+    except:
+        return 0
+
+    def calculate_component(concentration, breakpoints):
+        for i in range(len(breakpoints) - 1):
+            if breakpoints[i][0] <= concentration <= breakpoints[i][1]:
+                return i + (concentration - breakpoints[i][0]) / (breakpoints[i][1] - breakpoints[i][0])
+        return 0
+
+    pm10_breakpoints = [(0, 54), (55, 154), (155, 254), (255, 354), (355, 424), (425, 504)]
+    pm25_breakpoints = [(0, 12), (12.1, 35.4), (35.5, 55.4), (55.5, 150.4), (150.5, 250.4), (250.5, 350.4)]
+
+    aqi_pm10 = calculate_component(pm10, pm10_breakpoints) * 50
+    aqi_pm25 = calculate_component(pm25, pm25_breakpoints) * 50
+
+    return max(aqi_pm10, aqi_pm25)
+
+def status_level(variable, value):
+    """Normal / Warning / Critical band of `value` for the status panel"""
+    warning, critical = STATUS_BANDS[variable]
+    if value is None or value < warning:
+        return "Normal"
+    return "Warning" if value < critical else "Critical"
+
+# ============================================================================
+# HEADLINE SNAPSHOT
+# ============================================================================
+# Single-row table refreshed by the ETL after every load, so the top of the
+# dashboard renders from one primary-key lookup instead of the loaded frame.
+# The row and non-null counts are kept incrementally (n_*): each load adds
+# the rows its queue jobs inserted and the retention subtracts what it
+# deletes, so no refresh counts the whole history again.
+SNAPSHOT_DDL = """
+    CREATE TABLE IF NOT EXISTS metricas_snapshot (
+        id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        fecha TIMESTAMP,
+        pm10 FLOAT,
+        pm2_5 FLOAT,
+        dust FLOAT,
+        delta_pm10 FLOAT,
+        delta_pm2_5 FLOAT,
+        delta_dust FLOAT,
+        aqi FLOAT,
+        pm10_status VARCHAR(10),
+        pm2_5_status VARCHAR(10),
+        completeness_pm10 FLOAT,
+        completeness_pm2_5 FLOAT,
+        completeness_dust FLOAT,
+        completeness FLOAT,
+        total_rows BIGINT,
+        fecha_min TIMESTAMP,
+        fecha_max TIMESTAMP,
+        data_version VARCHAR(64),
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    ALTER TABLE metricas_snapshot ADD COLUMN IF NOT EXISTS n_pm10 BIGINT;
+    ALTER TABLE metricas_snapshot ADD COLUMN IF NOT EXISTS n_pm2_5 BIGINT;
+    ALTER TABLE metricas_snapshot ADD COLUMN IF NOT EXISTS n_dust BIGINT;
+"""
+
+SNAPSHOT_COLUMNS = (
+    'fecha', 'pm10', 'pm2_5', 'dust', 'delta_pm10', 'delta_pm2_5', 'delta_dust',
+    'aqi', 'pm10_status', 'pm2_5_status', 'completeness_pm10', 'completeness_pm2_5',
+    'completeness_dust', 'completeness', 'total_rows', 'fecha_min', 'fecha_max',
+    'data_version', 'updated_at'
+)
+COUNTED = ('pm10', 'pm2_5', 'dust')
+COUNT_COLUMNS = ('total_rows', *(f"n_{v}" for v in COUNTED))   # Stored, but not read by the dashboard
+
+def count_sql(prefix=""):
+    """SELECT list of the counts in COUNT_COLUMNS over rows aliased `prefix`"""
+    return ", ".join(["COUNT(*) AS total_rows", *(f"COUNT({prefix}{v}) AS n_{v}" for v in COUNTED)])
+
+def job_counts(conn, job_ids):
+    """Counts (COUNT_COLUMNS) of the rows the queue jobs `job_ids` inserted"""
+    if not job_ids:
+        return {}
+    return dict(conn.execute(text(f"SELECT {count_sql('m.')} {JOB_ROWS}"),
+                             {'job_ids': list(job_ids)}).mappings().one())
+
+def _delta(latest, previous):
+    if latest is None or previous is None:
+        return 0.0
+    return latest - previous
+
+def build_snapshot(conn, counts=None):
+    """Compute the headline metrics from mediciones_aire (index lookups).
+
+    Readings are averaged over the stations reporting each hour, so the
+    headline is the network-wide level of the two most recent hours.
+    `counts` (COUNT_COLUMNS) are the maintained totals; without them the
+    whole table is counted.
+    """
+    rows = conn.execute(text("""
+        SELECT fecha, AVG(pm10) AS pm10, AVG(pm2_5) AS pm2_5, AVG(dust) AS dust
+        FROM mediciones_aire
+        GROUP BY fecha
+        ORDER BY fecha DESC
+        LIMIT 2
+    """)).mappings().all()
+
+    if not rows:
+        return None
+
+    if counts is None:
+        counts = conn.execute(text(f"SELECT {count_sql()} FROM mediciones_aire")).mappings().one()
+    # Each bound on its own is one end of an index (fecha, and the id primary key)
+    totals = {**counts, **conn.execute(text("""
+        SELECT (SELECT MIN(fecha) FROM mediciones_aire) AS fecha_min,
+               (SELECT MAX(fecha) FROM mediciones_aire) AS fecha_max,
+               (SELECT MAX(id) FROM mediciones_aire) AS max_id
+    """)).mappings().one()}
+
+    latest = rows[0]
+    previous = rows[1] if len(rows) > 1 else latest
+    total = totals['total_rows']
+
+    snapshot = {
+        'fecha': latest['fecha'],
+        'pm10': latest['pm10'],
+        'pm2_5': latest['pm2_5'],
+        'dust': latest['dust'],
+        'delta_pm10': _delta(latest['pm10'], previous['pm10']),
+        'delta_pm2_5': _delta(latest['pm2_5'], previous['pm2_5']),
+        'delta_dust': _delta(latest['dust'], previous['dust']),
+        'aqi': calculate_air_quality_index(latest['pm10'], latest['pm2_5']),
+        'pm10_status': status_level('pm10', latest['pm10']),
+        'pm2_5_status': status_level('pm2_5', latest['pm2_5']),
+        'completeness_pm10': totals['n_pm10'] / total * 100,
+        'completeness_pm2_5': totals['n_pm2_5'] / total * 100,
+        'completeness_dust': totals['n_dust'] / total * 100,
+        'total_rows': total,
+        'fecha_min': totals['fecha_min'],
+        'fecha_max': totals['fecha_max'],
+        'data_version': f"{totals['max_id']}-{total}",
+        'updated_at': datetime.now(),
+        **{f"n_{v}": totals[f"n_{v}"] for v in COUNTED}
+    }
+    snapshot['completeness'] = min(snapshot['completeness_pm10'],
+                                   snapshot['completeness_pm2_5'],
+                                   snapshot['completeness_dust'])
+    return snapshot
+
+def refresh_snapshot(conn, job_ids=None, removed=None):
+    """Recompute the snapshot and upsert it; the caller commits.
+
+    `job_ids` are the queue jobs this refresh folds in (the ones about to be
+    mark_processed) and `removed` the counts (COUNT_COLUMNS) of rows just
+    deleted: the stored totals move by those. Without either, or before the
+    totals were stored, the whole table is counted once.
+    """
+    conn.execute(text(SNAPSHOT_DDL))
+    counts = None
+    if job_ids is not None or removed is not None:
+        stored = conn.execute(text(f"""
+            SELECT {', '.join(COUNT_COLUMNS)} FROM metricas_snapshot WHERE id = 1
+        """)).mappings().first()
+        if stored is not None and None not in stored.values():
+            added = job_counts(conn, job_ids)
+            counts = {col: stored[col] + added.get(col, 0) - (removed or {}).get(col, 0) for col in COUNT_COLUMNS}
+    snapshot = build_snapshot(conn, counts)
+    if snapshot is None:
+        conn.execute(text("DELETE FROM metricas_snapshot"))  # No rows left: the next refresh counts afresh
+        return None
+
+    stored_columns = SNAPSHOT_COLUMNS + COUNT_COLUMNS[1:]
+    columns = ", ".join(stored_columns)
+    values = ", ".join(f":{col}" for col in stored_columns)
+    updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in stored_columns)
+    conn.execute(text(f"""
+        INSERT INTO metricas_snapshot (id, {columns})
+        VALUES (1, {values})
+        ON CONFLICT (id) DO UPDATE SET {updates};
+    """), snapshot)
+    return snapshot
+
+def read_snapshot(conn):
+    """Snapshot row written by the ETL, computed live if the ETL hasn't created it yet"""
+    exists = conn.execute(text("SELECT to_regclass('metricas_snapshot') IS NOT NULL")).scalar()
+    if exists:
+        row = conn.execute(text(
+            f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM metricas_snapshot WHERE id = 1"
+        )).mappings().first()
+        if row is not None:
+            return dict(row)
+    return build_snapshot(conn)
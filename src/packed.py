@@ -0,0 +1,201 @@
+"""Almacenamiento compacto por estación y día para los análisis de histórico largo.
+
+mediciones_dia guarda cada día de una estación en una sola fila, con un
+real[24] por variable (posición = hora del día, NULL = hora sin dato). Un
+año de una estación son 365 filas en lugar de 8.760, sin el id ni el
+created_at de cada hora. Las consultas de varios años leen unas 24 veces
+menos tuplas y una fracción de los bytes.
+
+Lo lee get_station_readings() para rangos de PACKED_MIN_DAYS o más, que hoy
+solo pide el endpoint /range de query_service.py: las vistas horarias del
+dashboard leen como mucho 168 horas.
+
+Es opcional: con PACKED_STORAGE=true el ETL empaqueta los días que toca cada
+carga. El histórico previo se empaqueta una vez (con sus resúmenes diarios,
+que el dashboard usa para comprobar qué días de cada estación están
+empaquetados) con:
+
+    python src/packed.py --since 2024-01-01
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+import numpy as np
+from sqlalchemy import text
+
+from variables import NAMES, ensure_columns, stored_variables
+
+PACKED_STORAGE = os.getenv('PACKED_STORAGE', 'false').lower() in ('1', 'true', 'yes')
+PACKED_MIN_DAYS = int(os.getenv('PACKED_MIN_DAYS', '31'))   # shorter ranges keep reading the hourly table
+HOURS = 24
+
+# ============================================================================
+# SCHEMA
+# ============================================================================
+PACKED_DDL = """
+    CREATE TABLE IF NOT EXISTS mediciones_dia (
+        station_id INTEGER NOT NULL REFERENCES estaciones(id),
+        dia DATE NOT NULL,
+        n_horas SMALLINT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (station_id, dia)
+    );
+    CREATE INDEX IF NOT EXISTS idx_mediciones_dia_dia ON mediciones_dia (dia);
+"""
+
+def ensure_packed(conn, names=NAMES):
+    """Create mediciones_dia with a real[] column per variable (idempotent). The caller commits."""
+    conn.execute(text(PACKED_DDL))
+    ensure_columns(conn, 'mediciones_dia', names, sql_type='REAL[]')
+
+# ============================================================================
+# PACK (ETL)
+# ============================================================================
+def refresh_packed(conn, since=None, until=None, variables=NAMES):
+    """Re-pack the station-days in [since, until) from the hourly rows; returns the days upserted.
+
+    Readings are bucketed by clock hour (several in the same hour are
+    averaged) and every array gets its 24 slots, NULL where the hour is
+    missing. Days with no hourly rows left are never overwritten, so packed
+    days outlive the retention of mediciones_aire. The caller commits.
+    """
+    conditions, params = [], {}
+    if since is not None:
+        conditions.append("fecha >= :since")
+        params['since'] = since
+    if until is not None:
+        conditions.append("fecha < :until")
+        params['until'] = until
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return conn.execute(text(f"""
+        WITH horas AS (
+            SELECT station_id, fecha::date AS dia, EXTRACT(HOUR FROM fecha)::int AS hora,
+                   {', '.join(f'AVG({v}) AS {v}' for v in variables)}
+            FROM mediciones_aire
+            {where}
+            GROUP BY 1, 2, 3
+        ), dias AS (
+            SELECT DISTINCT station_id, dia FROM horas
+        )
+        INSERT INTO mediciones_dia (station_id, dia, n_horas, {', '.join(variables)})
+        SELECT d.station_id, d.dia, COUNT(h.hora),
+               {', '.join(f'ARRAY_AGG(h.{v} ORDER BY g.hora)::real[]' for v in variables)}
+        FROM dias d
+        CROSS JOIN generate_series(0, {HOURS - 1}) AS g(hora)
+        LEFT JOIN horas h ON h.station_id = d.station_id AND h.dia = d.dia AND h.hora = g.hora
+        GROUP BY d.station_id, d.dia
+        ON CONFLICT (station_id, dia) DO UPDATE SET
+            n_horas = EXCLUDED.n_horas, {', '.join(f"{v} = EXCLUDED.{v}" for v in variables)},
+            updated_at = CURRENT_TIMESTAMP
+    """), params).rowcount
+
+# ============================================================================
+# UNPACK (dashboard)
+# ============================================================================
+def unpack(station_ids, days, values):
+    """Expand day rows back to hourly columns: (station_ids int32, fechas datetime64[s], values float32).
+
+    `values` is (days × variables × 24), NaN for missing slots; hours missing
+    in every variable are dropped, as they have no row in mediciones_aire.
+    """
+    n_days, n_vars, _ = values.shape
+    fechas = (np.asarray(days, dtype='datetime64[D]')[:, None]
+              + np.arange(HOURS).astype('timedelta64[h]')[None, :]).astype('datetime64[s]').ravel()
+    hourly = values.transpose(0, 2, 1).reshape(n_days * HOURS, n_vars)
+    keep = ~np.isnan(hourly).all(axis=1)
+    stations = np.repeat(np.asarray(station_ids, dtype=np.int32), HOURS)
+    return stations[keep], fechas[keep], hourly[keep]
+
+def missing_days(conn, station_ids, first, last):
+    """Station-days in [first, last] (dates, inclusive) with hourly data that mediciones_dia lacks or has fewer hours of.
+
+    The daily rollups (retention.py), refreshed by every load, list each
+    station's days with data and their hours, so days without readings (an
+    outage) are not gaps and a day re-loaded after it was packed is one.
+    None if either table is missing.
+    """
+    if None in conn.execute(text("SELECT to_regclass('mediciones_dia'), to_regclass('mediciones_diarias')")).one():
+        return None
+    return conn.execute(text("""
+        SELECT COUNT(*)
+        FROM mediciones_diarias r
+        LEFT JOIN mediciones_dia p ON p.station_id = r.station_id AND p.dia = r.dia
+        WHERE r.station_id = ANY(:station_ids) AND r.dia BETWEEN :first AND :last
+          AND (p.dia IS NULL OR p.n_horas < r.n_horas)
+    """), {'station_ids': [int(i) for i in station_ids], 'first': first, 'last': last}).scalar()
+
+def read_packed(conn, station_ids, start, end=None, variables=None):
+    """Hourly columns of `station_ids` in [start, end) read from the day rows.
+
+    Returns a dict like etl_fast.parse(): station_id, fecha, variables and a
+    float32 values matrix, in (fecha, station_id) order.
+    """
+    variables = [v for v in (variables or NAMES) if v in stored_variables(conn, 'mediciones_dia')]
+    params = {'station_ids': [int(i) for i in station_ids], 'start': start.date() if hasattr(start, 'date') else start}
+    where = ["station_id = ANY(:station_ids)", "dia >= :start"]
+    if end is not None:
+        where.append("dia <= :end")
+        params['end'] = end.date() if hasattr(end, 'date') else end
+    rows = conn.execute(text(f"""
+        SELECT station_id, dia, {', '.join(variables)}
+        FROM mediciones_dia
+        WHERE {' AND '.join(where)}
+        ORDER BY dia, station_id
+    """), params).all()
+    if not rows:
+        return {'station_id': np.empty(0, np.int32), 'fecha': np.empty(0, 'datetime64[s]'),
+                'variables': tuple(variables), 'values': np.empty((0, len(variables)), np.float32)}
+
+    station_col, day_col, *arrays = zip(*rows)
+    values = np.array([[a if a is not None else [None] * HOURS for a in col] for col in arrays],
+                      dtype=np.float32).transpose(1, 0, 2)
+    stations, fechas, hourly = unpack(station_col, day_col, values)
+
+    # Day granularity on disk: trim to the exact [start, end) and put hours before stations
+    keep = fechas >= np.datetime64(start, 's')
+    if end is not None:
+        keep &= fechas < np.datetime64(end, 's')
+    order = np.lexsort((stations[keep], fechas[keep]))
+    return {'station_id': stations[keep][order], 'fecha': fechas[keep][order],
+            'variables': tuple(variables), 'values': hourly[keep][order]}
+
+# ============================================================================
+# CLI
+# ============================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Empaquetado por días de mediciones_aire")
+    parser.add_argument('--since', type=date.fromisoformat, help="Primer día a empaquetar (por defecto: todo)")
+    parser.add_argument('--until', type=date.fromisoformat, help="Día siguiente al último (por defecto: hoy incluido)")
+    args = parser.parse_args(argv)
+
+    from database import get_shared_engine, connect, etl_database_url
+    from retention import ensure_rollups, refresh_rollups
+
+    url, modo = etl_database_url()
+    print(f"🔌 Destino: {modo}")
+    inicio = time.perf_counter()
+    with connect(get_shared_engine(url), timeout_ms=0) as conn:
+        ensure_packed(conn)
+        ensure_rollups(conn)
+        dias = refresh_packed(conn, args.since, args.until)
+        refresh_rollups(conn, args.since, args.until)  # Referencia de cobertura (missing_days)
+        conn.commit()
+        filas, bytes_horas, bytes_dias = conn.execute(text("""
+            SELECT (SELECT COUNT(*) FROM mediciones_aire), pg_total_relation_size('mediciones_aire'),
+                   pg_total_relation_size('mediciones_dia')
+        """)).one()
+    print(f"📦 {dias} estación-días empaquetados en {time.perf_counter() - inicio:.2f}s")
+    print(f"💽 mediciones_aire: {filas} filas, {bytes_horas / 2**20:.1f} MB | "
+          f"mediciones_dia: {bytes_dias / 2**20:.1f} MB")
+    return 0
+
+if __name__ == "__main__":
+    try:
+        from dotenv import load_dotenv  # Opcional: solo para desarrollo local
+        load_dotenv()
+    except ImportError:
+        pass
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import contextvars
+import cProfile
+import functools
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# ============================================================================
+# ROLLING TIMINGS
+# ============================================================================
+class RollingWindow:
+    """Last N samples of a measurement, for rolling percentiles"""
+
+    def __init__(self, maxlen=500):
+        self.samples = deque(maxlen=maxlen)
+        self.count = 0
+        self.last = None
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.last = value
+
+    def percentiles(self, qs=(50, 95, 99)):
+        if not self.samples:
+            return {q: None for q in qs}
+        values = np.percentile(np.fromiter(self.samples, dtype=float), qs)
+        return dict(zip(qs, values))
+
+
+class PerformanceMonitor:
+    """Process-wide store of query, cache, figure and rerun measurements"""
+
+    def __init__(self, window=500):
+        self._lock = threading.Lock()
+        self._window = window
+        self._timings = defaultdict(lambda: RollingWindow(self._window))
+        self._volume = defaultdict(lambda: {'rows': 0, 'bytes': 0})
+        self._cache = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    def record(self, category, name, seconds, rows=None, nbytes=None):
+        """Record one timed operation, optionally with the rows/bytes it moved"""
+        with self._lock:
+            self._timings[(category, name)].add(seconds)
+            if rows is not None:
+                self._volume[(category, name)]['rows'] += rows
+            if nbytes is not None:
+                self._volume[(category, name)]['bytes'] += nbytes
+
+    def record_once(self, category, name, seconds):
+        """Record a measurement only the first time, e.g. cold-start timings of the process"""
+        with self._lock:
+            if (category, name) in self._timings:
+                return False
+            self._timings[(category, name)].add(seconds)
+            return True
+
+    def record_cache(self, name, hit):
+        with self._lock:
+            self._cache[name]['hits' if hit else 'misses'] += 1
+
+    @contextmanager
+    def timer(self, category, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(category, name, time.perf_counter() - start)
+
+    def timed(self, category, name=None):
+        """Decorator form of timer(), labelled with the function name by default"""
+        def decorator(func):
+            label = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(category, label):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def last(self, category, name):
+        """Duration in seconds of the latest sample, or None if never recorded"""
+        with self._lock:
+            window = self._timings.get((category, name))
+            return window.last if window else None
+
+    def timings(self):
+        """One row per (category, name) with rolling p50/p95/p99 in milliseconds"""
+        with self._lock:
+            rows = []
+            for (category, name), window in sorted(self._timings.items()):
+                pct = window.percentiles()
+                volume = self._volume.get((category, name), {})
+                rows.append({
+                    'category': category,
+                    'name': name,
+                    'count': window.count,
+                    'last_ms': window.last * 1000,
+                    'p50_ms': pct[50] * 1000,
+                    'p95_ms': pct[95] * 1000,
+                    'p99_ms': pct[99] * 1000,
+                    'rows': volume.get('rows'),
+                    'mb': volume['bytes'] / 1024 / 1024 if 'bytes' in volume else None
+                })
+            return rows
+
+    def cache_stats(self):
+        """Hit/miss counters per tracked cached function"""
+        with self._lock:
+            rows = []
+            for name, counts in sorted(self._cache.items()):
+                total = counts['hits'] + counts['misses']
+                rows.append({
+                    'function': name,
+                    'hits': counts['hits'],
+                    'misses': counts['misses'],
+                    'hit_rate': counts['hits'] / total * 100 if total else 0.0
+                })
+            return rows
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._volume.clear()
+            self._cache.clear()
+
+
+monitor = PerformanceMonitor()
+
+# ============================================================================
+# CACHE HIT/MISS TRACKING
+# ============================================================================
+_cache_miss = contextvars.ContextVar('cache_miss', default=False)
+
+def tracked_cache(cache_decorator, name=None):
+    """Apply a caching decorator (e.g. st.cache_data(...)) and count its hits and misses.
+
+    The wrapped body only runs on a miss, so it flags the miss for the outer
+    call to report; every other call was served from the cache.
+    """
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def body(*args, **kwargs):
+            _cache_miss.set(True)
+            return func(*args, **kwargs)
+
+        cached = cache_decorator(body)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _cache_miss.set(False)
+            try:
+                return cached(*args, **kwargs)
+            finally:
+                monitor.record_cache(label, hit=not _cache_miss.get())
+                _cache_miss.reset(token)
+
+        wrapper.clear = cached.clear
+        return wrapper
+    return decorator
+
+# ============================================================================
+# ONE-SHOT PROFILE CAPTURE
+# ============================================================================
+@contextmanager
+def capture(mode, top=30):
+    """Profile the enclosed block with 'cprofile' or 'tracemalloc'.
+
+    Yields a dict whose 'report' key holds the text report once the block exits.
+    """
+    result = {'mode': mode, 'report': None}
+
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield result
+        finally:
+            profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(top)
+            result['report'] = out.getvalue()
+
+    elif mode == 'tracemalloc':
+        already_tracing = tracemalloc.is_tracing()
+        if not already_tracing:
+            tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        try:
+            yield result
+        finally:
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if not already_tracing:
+                tracemalloc.stop()
+            lines = [f"Traced memory: current {current / 1024 / 1024:.2f} MB, peak {peak / 1024 / 1024:.2f} MB", ""]
+            for stat in after.compare_to(before, 'lineno')[:top]:
+                lines.append(str(stat))
+            result['report'] = "\n".join(lines)
+
+    else:
+        raise ValueError(f"Unknown capture mode '{mode}'")
@@ -0,0 +1,306 @@
+"""Read-only HTTP query service in front of the measurements database.
+
+Dashboards, notebooks and BI tools share one warm cache and one small
+connection pool instead of each opening its own to Postgres:
+
+    python src/query_service.py --port 8502
+
+Endpoints (GET or HEAD; JSON by default, Arrow IPC with ?format=arrow or
+Accept: application/vnd.apache.arrow.stream):
+
+    /version                                   ETL data version
+    /latest?stations=1,2                       headline snapshot and open alerts
+    /range?stations=1,2&start=...&end=...      hourly readings per station (default: last 24 h)
+    /aggregate?stations=1,2&limit=5000         latest hours of one station, or their hourly mean
+    /quality?stations=1,2&limit=5000           completeness, validity and outliers of that window
+
+Every response carries an ETag derived from the ETL data version and the
+request, so clients revalidate with If-None-Match and get a 304 until the
+next load; identical requests in flight at the same time run once. A
+failed database query answers 503 and is never cached, so the next request
+retries it.
+"""
+import argparse
+import hashlib
+import io
+import json
+import math
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+import pandas as pd
+
+from database import etl_database_url, pin_psycopg2
+from data_pipeline import AirQualityDataPipeline, QueryError
+from data_quality import calculate_data_quality, detect_outliers
+from profiling import monitor
+
+ARROW_TYPE = 'application/vnd.apache.arrow.stream'
+MAX_AGE = 60            # seconds; the snapshot (and so the data version) is re-read every minute
+MAX_LIMIT = 50000
+CACHE_ENTRIES = int(os.getenv('QUERY_SERVICE_CACHE_ENTRIES', '256'))
+
+# ============================================================================
+# REQUEST COALESCING & RESPONSE CACHE
+# ============================================================================
+class SingleFlight:
+    """Run `fn` once per key among concurrent callers; the others wait for its result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            future.set_result(fn())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+
+class ResponseCache:
+    """Bounded LRU of encoded responses; keys include the data version, so a load retires them"""
+
+    def __init__(self, max_entries=CACHE_ENTRIES):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.max_entries = max_entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+# ============================================================================
+# ENCODING
+# ============================================================================
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if hasattr(value, 'item'):              # numpy scalars
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return value.isoformat()
+    return value
+
+def encode(payload, fmt):
+    """(body, content type) of a DataFrame or dict payload"""
+    if fmt == 'arrow':
+        import pyarrow as pa   # Installed with streamlit; only Arrow responses need it
+
+        table = pa.Table.from_pandas(payload, preserve_index=False)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue(), ARROW_TYPE
+    if isinstance(payload, pd.DataFrame):
+        body = payload.to_json(orient='records', date_format='iso', date_unit='s')
+    else:
+        body = json.dumps(_jsonable(payload))
+    return body.encode(), 'application/json'
+
+# ============================================================================
+# SERVICE
+# ============================================================================
+class QueryService:
+    """Endpoint logic on top of AirQualityDataPipeline, independent of the HTTP server"""
+
+    ENDPOINTS = ('version', 'latest', 'range', 'aggregate', 'quality')
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.cache = ResponseCache()
+        self.flight = SingleFlight()
+
+    def data_version(self):
+        snapshot = self.pipeline.get_snapshot()
+        return (snapshot or {}).get('data_version') or "none"
+
+    def handle(self, path, query, accept="", if_none_match=None):
+        """(status, headers, body) for one GET request; 503 (uncached) if the database query fails"""
+        endpoint = path.strip('/')
+        if endpoint not in self.ENDPOINTS:
+            return self._error(404, f"Unknown endpoint /{endpoint}; try {', '.join(self.ENDPOINTS)}")
+        params = dict(parse_qsl(query))
+        fmt = params.pop('format', 'arrow' if ARROW_TYPE in accept else 'json')
+        if fmt not in ('json', 'arrow') or (fmt == 'arrow' and endpoint in ('version', 'latest', 'quality')):
+            return self._error(406, f"Format '{fmt}' is not available for /{endpoint}")
+
+        try:
+            version = self.data_version()
+        except QueryError as e:
+            return self._error(503, str(e))
+        canonical = "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+        etag = '"' + hashlib.sha1(f"{version}|{endpoint}?{canonical}|{fmt}".encode()).hexdigest()[:24] + '"'
+        headers = {'ETag': etag, 'Cache-Control': f"public, max-age={MAX_AGE}", 'X-Data-Version': version}
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+            monitor.record_cache('service_response', hit=True)
+            return 304, headers, b""
+
+        entry = self.cache.get(etag)
+        monitor.record_cache('service_response', hit=entry is not None)
+        if entry is None:
+            try:
+                entry = self.flight.do(etag, lambda: self._render(endpoint, params, fmt, version))
+            except ValueError as e:
+                return self._error(400, str(e))
+            except QueryError as e:
+                return self._error(503, str(e))
+            self.cache.put(etag, entry)
+        body, content_type = entry
+        return 200, {**headers, 'Content-Type': content_type}, body
+
+    def _render(self, endpoint, params, fmt, version):
+        with monitor.timer('service', endpoint):
+            return encode(getattr(self, f"_{endpoint}")(params, version), fmt)
+
+    @staticmethod
+    def _error(status, message):
+        return status, {'Content-Type': 'application/json', 'Cache-Control': 'no-store'}, \
+            json.dumps({'error': message}).encode()
+
+    # --- parameters -------------------------------------------------------
+    @staticmethod
+    def _stations(params):
+        if not params.get('stations'):
+            return None
+        try:
+            return tuple(int(i) for i in params['stations'].split(','))
+        except ValueError:
+            raise ValueError("stations must be a comma-separated list of station ids")
+
+    @staticmethod
+    def _limit(params):
+        try:
+            return max(1, min(int(params.get('limit', 5000)), MAX_LIMIT))
+        except ValueError:
+            raise ValueError("limit must be an integer")
+
+    @staticmethod
+    def _datetime(params, name):
+        if not params.get(name):
+            return None
+        try:
+            return datetime.fromisoformat(params[name])
+        except ValueError:
+            raise ValueError(f"{name} must be an ISO 8601 date or datetime")
+
+    # --- endpoints --------------------------------------------------------
+    def _version(self, params, version):
+        return {'data_version': version}
+
+    def _latest(self, params, version):
+        alerts = self.pipeline.get_alerts(self._stations(params))
+        return {'snapshot': self.pipeline.get_snapshot(), 'alerts': alerts['active'] if alerts else []}
+
+    def _range(self, params, version):
+        station_ids = self._stations(params)
+        if station_ids is None:
+            station_ids = tuple(int(i) for i in self.pipeline.get_stations()['id'])
+        start = self._datetime(params, 'start')
+        if start is None:
+            snapshot = self.pipeline.get_snapshot()
+            start = ((snapshot or {}).get('fecha_max') or datetime.now()) - timedelta(hours=23)
+        return self.pipeline.get_station_readings(station_ids, start, self._datetime(params, 'end'))
+
+    def _aggregate(self, params, version):
+        return self.pipeline.get_dataset(version, self._limit(params), self._stations(params))
+
+    def _quality(self, params, version):
+        df = self.pipeline.get_dataset(version, self._limit(params), self._stations(params))
+        variables = [col for col in self.pipeline.get_variables() if col in df.columns]
+        return {
+            'rows': len(df),
+            **calculate_data_quality(df),
+            'outliers': {col: int(detect_outliers(df[col].dropna())) for col in variables}
+        }
+
+# ============================================================================
+# HTTP SERVER
+# ============================================================================
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self._respond(send_body=True)
+
+        def do_HEAD(self):
+            self._respond(send_body=False)  # Same status and headers, Content-Length included
+
+        def _respond(self, send_body):
+            url = urlsplit(self.path)
+            try:
+                status, headers, body = service.handle(url.path, url.query, self.headers.get('Accept', ''),
+                                                       self.headers.get('If-None-Match'))
+            except Exception as e:
+                status, headers, body = service._error(500, str(e))
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if send_body:
+                self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Timings go to the performance monitor instead
+
+    return Handler
+
+def serve(url, host='127.0.0.1', port=8502):
+    """Block serving the API for the database at `url`"""
+    service = QueryService(AirQualityDataPipeline(url, raise_errors=True))
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    print(f"Query service on http://{host}:{port} ({', '.join('/' + e for e in QueryService.ENDPOINTS)})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CanaryAir read-only query service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--db-url', default=None, help="Postgres URL (default: same resolution as the ETL)")
+    args = parser.parse_args(argv)
+    serve(pin_psycopg2(args.db_url) if args.db_url else etl_database_url()[0], args.host, args.port)
+    return 0
+
+if __name__ == "__main__":
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    sys.exit(main())
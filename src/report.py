@@ -0,0 +1,207 @@
+"""Informe estático de los últimos días, generado por el worker tras cada carga.
+
+La mayoría de visitantes solo mira la misma vista general de la última
+semana: en lugar de abrirles una sesión de Streamlit a cada uno (con sus
+consultas y sus figuras), el ETL renderiza esa vista una vez por carga en un
+index.html (y PNG opcionales) que cualquier servidor de ficheros estáticos
+sirve sin coste. El dashboard en vivo queda para el análisis interactivo.
+
+- Las figuras son las de EngineeringVisualizations, sobre la media horaria
+  de la red agrupada en como mucho REPORT_MAX_POINTS intervalos.
+- plotly.js va en un fichero aparte con la versión en el nombre, así que el
+  navegador lo descarga una vez y el HTML de cada carga pesa unos KB.
+- Cada fichero se escribe en un temporal y se renombra: un lector nunca ve
+  un informe a medias.
+- Los PNG necesitan kaleido (pip install kaleido); sin él se omiten.
+
+    REPORT_DIR=reports python src/etl_fast.py
+    python src/report.py --out reports --days 7 --png
+"""
+import argparse
+import html
+import importlib.util
+import math
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import text
+
+from alerts import active_alerts
+from metrics import read_snapshot
+from variables import label, stored_variables
+
+REPORT_DIR = os.getenv('REPORT_DIR')                          # unset: the ETL renders no report
+REPORT_DAYS = int(os.getenv('REPORT_DAYS', '7'))
+REPORT_PNG = os.getenv('REPORT_PNG', 'false').lower() in ('1', 'true', 'yes')
+REPORT_MAX_POINTS = int(os.getenv('REPORT_MAX_POINTS', '500'))  # time buckets per trace
+
+# ============================================================================
+# DATA
+# ============================================================================
+def read_overview(conn, days=REPORT_DAYS, max_points=REPORT_MAX_POINTS):
+    """Network-wide mean of the last `days` days, in at most `max_points` equal time buckets.
+
+    Buckets are whole hours (date_bin), so the default week stays hourly and
+    longer windows are averaged down in SQL instead of shipping every row.
+    """
+    variables = stored_variables(conn)
+    end = conn.execute(text("SELECT MAX(fecha) FROM mediciones_aire")).scalar()
+    if end is None:
+        return pd.DataFrame(columns=['fecha', *variables])
+    start = end - timedelta(days=days)
+    df = pd.read_sql_query(text(f"""
+        SELECT date_bin(make_interval(hours => :bucket), fecha, :start) AS fecha,
+               {', '.join(f'AVG({v}) AS {v}' for v in variables)}
+        FROM mediciones_aire
+        WHERE fecha > :start
+        GROUP BY 1
+        ORDER BY 1
+    """), conn, params={'bucket': max(1, math.ceil(days * 24 / max_points)), 'start': start})
+    return df.astype({v: 'float32' for v in variables})
+
+# ============================================================================
+# OUTPUT
+# ============================================================================
+def write_atomic(path, data):
+    """Write `data` (str or bytes) through a temp file in the same directory and os.replace() it"""
+    fd, partial = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.report-', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data.encode('utf-8') if isinstance(data, str) else data)
+        os.chmod(partial, 0o644)
+        os.replace(partial, path)
+    except BaseException:
+        os.unlink(partial)
+        raise
+    return path
+
+def plotly_bundle(out_dir):
+    """File name of the versioned plotly.js next to the report, written once per plotly version"""
+    import plotly
+    from plotly.offline import get_plotlyjs
+
+    name = f"plotly-{plotly.__version__}.min.js"
+    if not os.path.exists(os.path.join(out_dir, name)):
+        write_atomic(os.path.join(out_dir, name), get_plotlyjs())
+    return name
+
+def render_html(snapshot, alerts, figures, days, bundle):
+    """index.html body: headline metrics, open alerts and the figures (plotly.js loaded from `bundle`)"""
+    rows = "".join(
+        f"<tr><td>{html.escape(label(v))}</td><td>{snapshot[v] or 0:.1f}</td>"
+        f"<td>{snapshot['delta_' + v]:+.1f}</td></tr>"
+        for v in ('pm10', 'pm2_5', 'dust')
+    ) if snapshot else ""
+    headline = (
+        f"<p>Latest hour {snapshot['fecha']:%Y-%m-%d %H:%M} | AQI {snapshot['aqi']:.0f} | "
+        f"{snapshot['total_rows']:,} records | completeness {snapshot['completeness']:.1f}%</p>"
+        f"<table><tr><th>Pollutant</th><th>Network mean</th><th>Δ 1 h</th></tr>{rows}</table>"
+    ) if snapshot else "<p>No data loaded yet.</p>"
+    alert_rows = "".join(
+        f"<tr class='{a['level'].lower()}'><td>{html.escape(a['nombre'])}</td><td>{html.escape(a['rule'])}</td>"
+        f"<td>{a['level']}</td><td>{a['started_at']:%Y-%m-%d %H:%M}</td><td>{a['peak']:.1f}</td></tr>"
+        for a in alerts
+    )
+    alert_table = (
+        "<table><tr><th>Station</th><th>Rule</th><th>Level</th><th>Since</th><th>Peak (µg/m³)</th></tr>"
+        f"{alert_rows}</table>"
+    ) if alerts else "<p>No open alerts.</p>"
+    plots = "".join(fig.to_html(full_html=False, include_plotlyjs=False) for fig in figures)
+    version = html.escape(str(snapshot['data_version'])) if snapshot else ""
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="data-version" content="{version}">
+<title>Air Quality | Last {days} Days</title>
+<script src="{bundle}"></script>
+<style>
+    body {{ background: #0a0e17; color: #ffffff; font-family: sans-serif; margin: 2rem; }}
+    h1 {{ font-size: 1.6rem; }} h2 {{ font-size: 1.2rem; color: #a0aec0; }}
+    table {{ border-collapse: collapse; margin-bottom: 1rem; }}
+    th, td {{ border-bottom: 1px solid #2d3748; padding: 0.3rem 1rem; text-align: left; }}
+    tr.warning td {{ color: #d69e2e; }} tr.critical td {{ color: #e53e3e; }}
+    footer {{ color: #718096; font-size: 0.8rem; }}
+</style>
+</head>
+<body>
+<h1>AIR QUALITY ENGINEERING REPORT | LAST {days} DAYS</h1>
+{headline}
+<h2>Active Alerts ({len(alerts)})</h2>
+{alert_table}
+{plots}
+<footer>Generated {datetime.now():%Y-%m-%d %H:%M:%S} after the ETL load (data version {version}).
+Static snapshot: use the live dashboard for interactive analysis.</footer>
+</body>
+</html>
+"""
+
+def render_report(engine, out_dir=REPORT_DIR, days=REPORT_DAYS, png=REPORT_PNG):
+    """Render the overview into `out_dir`; returns the paths written (none if there is no data).
+
+    index.html is replaced last, so it never points at a plotly.js that is
+    not there yet. Without kaleido the PNGs are skipped.
+    """
+    from database import connect
+    from visualizations import EngineeringVisualizations
+
+    with connect(engine) as conn:
+        snapshot = read_snapshot(conn)
+        df = read_overview(conn, days)
+        alerts = active_alerts(conn)
+    if df.empty:
+        return []
+
+    os.makedirs(out_dir, exist_ok=True)
+    figures = {
+        'timeseries': EngineeringVisualizations.create_timeseries_engineering(
+            df, title=f"Network Mean | Last {days} Days"),
+        'distribution': EngineeringVisualizations.create_distribution_analysis(df),
+    }
+    paths = []
+    if png and importlib.util.find_spec('kaleido') is None:
+        print("⚠️ PNG omitidos: falta kaleido (pip install kaleido)")
+    elif png:
+        for name, fig in figures.items():
+            paths.append(write_atomic(os.path.join(out_dir, f"{name}.png"),
+                                      fig.to_image(format='png', width=1400, height=fig.layout.height or 700)))
+    bundle = plotly_bundle(out_dir)
+    paths.append(write_atomic(os.path.join(out_dir, 'index.html'),
+                              render_html(snapshot, alerts, figures.values(), days, bundle)))
+    return paths
+
+# ============================================================================
+# CLI
+# ============================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Informe estático de CanaryAir (HTML y PNG)")
+    parser.add_argument('--out', default=REPORT_DIR or 'reports', help="Carpeta de salida (REPORT_DIR)")
+    parser.add_argument('--days', type=int, default=REPORT_DAYS, help="Días que cubre el informe")
+    parser.add_argument('--png', action='store_true', default=REPORT_PNG, help="Exportar también PNG (kaleido)")
+    args = parser.parse_args(argv)
+
+    from database import get_shared_engine, etl_database_url
+
+    url, modo = etl_database_url()
+    print(f"🔌 Destino: {modo}")
+    inicio = time.perf_counter()
+    paths = render_report(get_shared_engine(url), args.out, args.days, args.png)
+    if not paths:
+        print("💤 Sin datos: no se genera el informe")
+        return 0
+    print(f"🖼️ Informe de {args.days} días en {time.perf_counter() - inicio:.2f}s:")
+    for path in paths:
+        print(f"   · {path} ({os.path.getsize(path) / 1024:.0f} KB)")
+    return 0
+
+if __name__ == "__main__":
+    try:
+        from dotenv import load_dotenv  # Opcional: solo para desarrollo local
+        load_dotenv()
+    except ImportError:
+        pass
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""Política de retención de mediciones_aire.
+
+Las filas horarias más antiguas que RETENTION_DAYS se borran (o se archivan
+en CSV comprimido y se borran) por meses completos, solo después de
+comprobar que su resumen diario en mediciones_diarias está completo. Cada
+ejecución queda registrada en retencion_ejecuciones con su efecto sobre el
+tamaño de la tabla y el tiempo de la consulta principal del dashboard.
+
+    python src/retention.py [--days 730] [--archive-dir archivo/] [--dry-run]
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from database import get_shared_engine, connect, etl_database_url
+from metrics import COUNTED, count_sql, refresh_snapshot
+from variables import NAMES, ensure_columns, stored_variables
+from climatology import ensure_climatology
+
+RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', '730'))
+
+# ============================================================================
+# DAILY ROLLUPS
+# ============================================================================
+# One row per (station, day), kept by the ETL for the days each load touches.
+# n_horas is the number of raw rows summarized, which is what the retention
+# check compares before any raw hour is dropped. Every catalog variable gets a
+# <name>_avg / <name>_max pair (added on demand, like mediciones_aire's columns).
+ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS mediciones_diarias (
+        station_id INTEGER NOT NULL REFERENCES estaciones(id),
+        dia DATE NOT NULL,
+        n_horas SMALLINT NOT NULL,
+        pm10_avg FLOAT,
+        pm10_max FLOAT,
+        pm2_5_avg FLOAT,
+        pm2_5_max FLOAT,
+        dust_avg FLOAT,
+        dust_max FLOAT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (station_id, dia)
+    );
+    CREATE TABLE IF NOT EXISTS retencion_ejecuciones (
+        id SERIAL PRIMARY KEY,
+        ran_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        cutoff DATE NOT NULL,
+        mode VARCHAR(10) NOT NULL,
+        rollups_repaired INTEGER NOT NULL,
+        rows_deleted BIGINT NOT NULL,
+        archive_files INTEGER NOT NULL,
+        bytes_before BIGINT,
+        bytes_after BIGINT,
+        probe_ms_before FLOAT,
+        probe_ms_after FLOAT,
+        seconds FLOAT
+    );
+"""
+
+def ensure_rollups(conn):
+    """Create the rollup and retention-log tables (idempotent). The caller commits."""
+    conn.execute(text(ROLLUP_DDL))
+    ensure_columns(conn, 'mediciones_diarias', [f"{name}_{stat}" for name in NAMES for stat in ('avg', 'max')])
+
+def refresh_rollups(conn, since=None, until=None):
+    """Recompute the daily rollups of the days in [since, until) from the raw rows.
+
+    Days whose raw rows were already dropped produce no group, so their
+    rollups are never overwritten. Returns the rows upserted. The caller commits.
+    """
+    conditions, params = [], {}
+    if since is not None:
+        conditions.append("fecha >= :since")
+        params['since'] = since
+    if until is not None:
+        conditions.append("fecha < :until")
+        params['until'] = until
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    targets = [f"{name}_{stat}" for name in NAMES for stat in ('avg', 'max')]
+    aggregates = [f"{stat.upper()}({name})" for name in NAMES for stat in ('avg', 'max')]
+    return conn.execute(text(f"""
+        INSERT INTO mediciones_diarias (station_id, dia, n_horas, {', '.join(targets)})
+        SELECT station_id, fecha::date, COUNT(*), {', '.join(aggregates)}
+        FROM mediciones_aire
+        {where}
+        GROUP BY station_id, fecha::date
+        ON CONFLICT (station_id, dia) DO UPDATE SET
+            n_horas = EXCLUDED.n_horas, {', '.join(f"{t} = EXCLUDED.{t}" for t in targets)},
+            updated_at = CURRENT_TIMESTAMP
+    """), params).rowcount
+
+def stale_rollups(conn, cutoff):
+    """(count, first day) of the days before `cutoff` whose rollup is missing or out of date"""
+    return tuple(conn.execute(text("""
+        SELECT COUNT(*), MIN(r.dia)
+        FROM (
+            SELECT station_id, fecha::date AS dia, COUNT(*) AS n
+            FROM mediciones_aire
+            WHERE fecha < :cutoff
+            GROUP BY station_id, fecha::date
+        ) r
+        LEFT JOIN mediciones_diarias d USING (station_id, dia)
+        WHERE d.n_horas IS DISTINCT FROM r.n
+    """), {'cutoff': cutoff}).one())
+
+# ============================================================================
+# MEASUREMENTS (storage and query time)
+# ============================================================================
+# The dashboard's default view: hourly mean of every station, newest first
+PROBE_QUERY = """
+    SELECT fecha, AVG(pm10), AVG(pm2_5), AVG(dust)
+    FROM mediciones_aire
+    GROUP BY fecha
+    ORDER BY fecha DESC
+    LIMIT 5000
+"""
+
+def table_bytes(conn):
+    """Heap + indexes + TOAST of mediciones_aire"""
+    return conn.execute(text("SELECT pg_total_relation_size('mediciones_aire')")).scalar()
+
+def probe_ms(conn, repeat=3):
+    """Best of `repeat` runs of PROBE_QUERY, in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(text(PROBE_QUERY)).all()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+# ============================================================================
+# EXPIRY
+# ============================================================================
+def expired_chunks(conn, cutoff):
+    """Calendar-month [start, end) ranges holding raw rows older than `cutoff`, oldest first"""
+    oldest = conn.execute(text("SELECT MIN(fecha) FROM mediciones_aire")).scalar()
+    chunks = []
+    if oldest is None or oldest.date() >= cutoff:
+        return chunks
+    start = date(oldest.year, oldest.month, 1)
+    while start < cutoff:
+        following = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        chunks.append((start, min(following, cutoff)))
+        start = following
+    return chunks
+
+def archive_chunk(conn, start, end, directory):
+    """COPY the raw rows of [start, end) to a gzip CSV in `directory`, written atomically"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"mediciones_aire_{start:%Y%m%d}_{end:%Y%m%d}.csv.gz")
+    partial = path + ".part"
+    # Both bounds are dates generated here, so formatting them into the COPY is safe
+    query = f"""
+        COPY (
+            SELECT station_id, fecha, {', '.join(stored_variables(conn))} FROM mediciones_aire
+            WHERE fecha >= '{start.isoformat()}' AND fecha < '{end.isoformat()}'
+            ORDER BY station_id, fecha
+        ) TO STDOUT WITH (FORMAT csv, HEADER)
+    """
+    with gzip.open(partial, 'wt', encoding='utf-8', newline='') as f:
+        conn.connection.driver_connection.cursor().copy_expert(query, f)
+    os.replace(partial, path)
+    return path
+
+def apply_retention(engine, days=RETENTION_DAYS, archive_dir=None, dry_run=False):
+    """Expire the raw rows older than `days` whole days and return a report dict.
+
+    Rollups of the expired range are verified (and rebuilt where stale) before
+    anything is removed. mediciones_aire is a plain table (its primary key is
+    the serial id, not fecha), so instead of dropping partitions each calendar
+    month goes in one range DELETE on the fecha index, committed on its own
+    so locks and WAL stay bounded. A VACUUM ANALYZE then makes the freed pages
+    reusable by the next loads instead of growing the file.
+    """
+    inicio = time.perf_counter()
+    cutoff = date.today() - timedelta(days=days)
+    report = {'cutoff': cutoff, 'mode': 'archive' if archive_dir else 'drop', 'rollups_stale': 0,
+              'rollups_repaired': 0, 'rows_deleted': 0, 'archive_files': 0}
+
+    with connect(engine, timeout_ms=0) as conn:
+        ensure_rollups(conn)
+        ensure_climatology(conn)
+        report['bytes_before'] = table_bytes(conn)
+        report['probe_ms_before'] = probe_ms(conn)
+
+        report['chunks'] = chunks = expired_chunks(conn, cutoff)
+        report['rollups_stale'], first_stale = stale_rollups(conn, cutoff)
+        if dry_run:
+            return report
+        if report['rollups_stale']:
+            report['rollups_repaired'] = refresh_rollups(conn, since=first_stale, until=cutoff)
+            stale, _ = stale_rollups(conn, cutoff)
+            if stale:
+                raise RuntimeError(f"{stale} daily rollups before {cutoff} are still incomplete")
+        conn.commit()
+
+        for start, end in chunks:
+            if archive_dir:
+                archive_chunk(conn, start, end, archive_dir)
+                report['archive_files'] += 1
+            borradas = conn.execute(text(f"""
+                WITH borradas AS (
+                    DELETE FROM mediciones_aire WHERE fecha >= :start AND fecha < :end
+                    RETURNING {', '.join(COUNTED)}
+                )
+                SELECT {count_sql()} FROM borradas
+            """), {'start': start, 'end': end}).mappings().one()
+            report['rows_deleted'] += borradas['total_rows']
+            # The z-scores go with their rows; the climatology keeps their contribution
+            conn.execute(text("DELETE FROM anomalias WHERE fecha >= :start AND fecha < :end"),
+                         {'start': start, 'end': end})
+            # total_rows / fecha_min and so data_version change, in the same transaction as the DELETE
+            refresh_snapshot(conn, removed=borradas)
+            conn.commit()
+
+    if chunks:
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text("VACUUM (ANALYZE) mediciones_aire"))
+
+    with connect(engine, timeout_ms=0) as conn:
+        report['bytes_after'] = table_bytes(conn)
+        report['probe_ms_after'] = probe_ms(conn)
+        report['seconds'] = time.perf_counter() - inicio
+        conn.execute(text("""
+            INSERT INTO retencion_ejecuciones (cutoff, mode, rollups_repaired, rows_deleted, archive_files,
+                                               bytes_before, bytes_after, probe_ms_before, probe_ms_after, seconds)
+            VALUES (:cutoff, :mode, :rollups_repaired, :rows_deleted, :archive_files,
+                    :bytes_before, :bytes_after, :probe_ms_before, :probe_ms_after, :seconds)
+        """), {k: v for k, v in report.items() if k not in ('chunks', 'rollups_stale')})
+        conn.commit()
+    return report
+
+# ============================================================================
+# CLI
+# ============================================================================
+def _mb(n):
+    return f"{n / 2**20:.1f} MB"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Retención de datos horarios de CanaryAir")
+    parser.add_argument('--days', type=int, default=RETENTION_DAYS, help="Días de datos horarios a conservar")
+    parser.add_argument('--archive-dir', default=os.getenv('RETENTION_ARCHIVE_DIR'),
+                        help="Archivar en CSV comprimido antes de borrar (por defecto: solo borrar)")
+    parser.add_argument('--dry-run', action='store_true', help="Solo comprobar resúmenes y listar meses")
+    args = parser.parse_args(argv)
+
+    url, modo = etl_database_url()
+    print(f"🔌 Destino: {modo}")
+    engine = get_shared_engine(url)
+    report = apply_retention(engine, args.days, args.archive_dir, args.dry_run)
+
+    print(f"🗓️ Corte: {report['cutoff']} ({args.days} días), {len(report['chunks'])} meses a expirar")
+    if args.dry_run:
+        print(f"🔧 {report['rollups_stale']} resúmenes diarios por reconstruir antes de borrar")
+        for start, end in report['chunks']:
+            print(f"   · {start} -> {end}")
+        return 0
+    if report['rollups_repaired']:
+        print(f"🔧 {report['rollups_repaired']} resúmenes diarios reconstruidos antes de borrar")
+    print(f"🗑️ {report['rows_deleted']} filas borradas"
+          + (f", {report['archive_files']} ficheros en {args.archive_dir}" if report['archive_files'] else ""))
+    print(f"💽 mediciones_aire: {_mb(report['bytes_before'])} -> {_mb(report['bytes_after'])}")
+    print(f"⏱️ Consulta del dashboard: {report['probe_ms_before']:.1f} ms -> {report['probe_ms_after']:.1f} ms")
+    print(f"🏁 Retención completada en {report['seconds']:.2f}s")
+    return 0
+
+if __name__ == "__main__":
+    try:
+        from dotenv import load_dotenv  # Opcional: solo para desarrollo local
+        load_dotenv()
+    except ImportError:
+        pass
+    try:
+        sys.exit(main())
+    except Exception as e:
+        print(f"❌ ERROR EN RETENCIÓN: {e}")
+        sys.exit(1)
@@ -0,0 +1,78 @@
+from sqlalchemy import text
+
+from database import connect
+from stations import DEFAULT_STATION, ensure_stations
+from alerts import ensure_alerts
+from forecasting import ensure_forecasts
+from retention import ensure_rollups
+from climatology import ensure_climatology
+from coordination import SCHEMA_LOCK, xact_lock, ensure_queue
+from packed import ensure_packed
+from variables import ensure_columns
+
+# ============================================================================
+# ESQUEMA (compartido por etl_job.py y etl_fast.py)
+# ============================================================================
+def ensure_schema(engine):
+    """Auto-creación de tablas e índices (idempotente).
+
+    Un advisory lock serializa a los workers que arrancan a la vez: CREATE ...
+    IF NOT EXISTS concurrentes pueden chocar en el catálogo de Postgres.
+    """
+    with connect(engine) as conn:
+        xact_lock(conn, SCHEMA_LOCK)
+        ensure_stations(conn)
+        # UNIQUE (station_id, fecha) es también el índice de las consultas por estación
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS mediciones_aire (
+                id SERIAL PRIMARY KEY,
+                station_id INTEGER NOT NULL REFERENCES estaciones(id),
+                fecha TIMESTAMP NOT NULL,
+                pm10 FLOAT,
+                pm2_5 FLOAT,
+                dust FLOAT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                CONSTRAINT unique_estacion_fecha UNIQUE (station_id, fecha)
+            );
+        """))
+        migrate_single_station(conn)
+        # Una columna por variable del catálogo activada (VARIABLES_FILE)
+        ensure_columns(conn)
+        # Trozo de la cola que insertó cada fila (coordination.py); NULL en las cargas fuera de la cola
+        conn.execute(text("ALTER TABLE mediciones_aire ADD COLUMN IF NOT EXISTS carga BIGINT"))
+        # Índice para la paginación por cursor (fecha, id) del dashboard
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_mediciones_fecha_id
+            ON mediciones_aire (fecha DESC, id DESC);
+        """))
+        ensure_alerts(conn)
+        ensure_forecasts(conn)
+        ensure_rollups(conn)
+        ensure_climatology(conn)
+        ensure_queue(conn)
+        ensure_packed(conn)
+        conn.commit()
+        # print("✅ Tabla verificada.") # Comentado para no ensuciar logs
+
+def migrate_single_station(conn):
+    """Migra el esquema antiguo (una sola estación, UNIQUE (fecha)) a (station_id, fecha)"""
+    tiene_estacion = conn.execute(text("""
+        SELECT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'mediciones_aire' AND column_name = 'station_id'
+        )
+    """)).scalar()
+    if tiene_estacion:
+        return
+    
+    print(f"🔧 Migrando mediciones_aire a multi-estación (histórico -> {DEFAULT_STATION})...")
+    conn.execute(text("ALTER TABLE mediciones_aire ADD COLUMN station_id INTEGER REFERENCES estaciones(id)"))
+    conn.execute(text("""
+        UPDATE mediciones_aire SET station_id = (SELECT id FROM estaciones WHERE codigo = :codigo)
+    """), {"codigo": DEFAULT_STATION})
+    conn.execute(text("ALTER TABLE mediciones_aire ALTER COLUMN station_id SET NOT NULL"))
+    conn.execute(text("ALTER TABLE mediciones_aire DROP CONSTRAINT IF EXISTS unique_fecha"))
+    conn.execute(text("""
+        ALTER TABLE mediciones_aire
+        ADD CONSTRAINT unique_estacion_fecha UNIQUE (station_id, fecha)
+    """))
@@ -0,0 +1,131 @@
+from sqlalchemy import text
+
+# ============================================================================
+# STATION CATALOG & REGIONS
+# ============================================================================
+# GC-CEN is the point the single-station ETL used to sample; its history is
+# attached to it when an existing database is migrated.
+DEFAULT_STATION = 'GC-CEN'
+
+DEFAULT_STATIONS = [
+    {'code': 'GC-CEN', 'name': 'Gran Canaria (centro)', 'island': 'Gran Canaria', 'lat': 27.9576, 'lon': -15.5995},
+    {'code': 'GC-LPA', 'name': 'Las Palmas de Gran Canaria', 'island': 'Gran Canaria', 'lat': 28.1235, 'lon': -15.4363},
+    {'code': 'TF-SCT', 'name': 'Santa Cruz de Tenerife', 'island': 'Tenerife', 'lat': 28.4636, 'lon': -16.2518},
+    {'code': 'TF-LAG', 'name': 'San Cristóbal de La Laguna', 'island': 'Tenerife', 'lat': 28.4853, 'lon': -16.3201},
+    {'code': 'LZ-ARR', 'name': 'Arrecife', 'island': 'Lanzarote', 'lat': 28.9630, 'lon': -13.5477},
+    {'code': 'FV-PRO', 'name': 'Puerto del Rosario', 'island': 'Fuerteventura', 'lat': 28.5004, 'lon': -13.8627},
+    {'code': 'LP-SCP', 'name': 'Santa Cruz de La Palma', 'island': 'La Palma', 'lat': 28.6835, 'lon': -17.7642},
+    {'code': 'LG-SSG', 'name': 'San Sebastián de La Gomera', 'island': 'La Gomera', 'lat': 28.0916, 'lon': -17.1133},
+    {'code': 'EH-VAL', 'name': 'Valverde', 'island': 'El Hierro', 'lat': 27.8063, 'lon': -17.9158},
+]
+
+# Bounding boxes (lon_min, lat_min, lon_max, lat_max) in WGS84
+REGIONS = {
+    'Canary Islands': (-18.20, 27.60, -13.30, 29.45),
+    'Gran Canaria': (-15.85, 27.72, -15.35, 28.19),
+    'Tenerife': (-16.93, 27.99, -16.11, 28.59),
+    'Lanzarote': (-13.88, 28.83, -13.40, 29.26),
+    'Fuerteventura': (-14.53, 28.03, -13.81, 28.76),
+    'La Palma': (-18.01, 28.45, -17.71, 28.86),
+    'La Gomera': (-17.36, 27.99, -17.09, 28.22),
+    'El Hierro': (-18.17, 27.63, -17.87, 27.86),
+}
+
+# ============================================================================
+# SCHEMA
+# ============================================================================
+STATIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS estaciones (
+        id SERIAL PRIMARY KEY,
+        codigo VARCHAR(32) NOT NULL UNIQUE,
+        nombre VARCHAR(128) NOT NULL,
+        isla VARCHAR(32),
+        lat DOUBLE PRECISION NOT NULL,
+        lon DOUBLE PRECISION NOT NULL,
+        activa BOOLEAN NOT NULL DEFAULT TRUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+def postgis_available(conn):
+    """True if the PostGIS extension is installed or can be installed here"""
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'postgis')"
+    )).scalar()
+
+def has_geometry(conn):
+    """True if estaciones carries the PostGIS `geom` column"""
+    return conn.execute(text("""
+        SELECT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'estaciones' AND column_name = 'geom'
+        )
+    """)).scalar()
+
+def ensure_stations(conn):
+    """Create estaciones (with a GiST-indexed point when PostGIS exists) and seed the catalog.
+
+    Without PostGIS the table keeps only lat/lon with a B-tree index, and
+    bounding-box lookups fall back to range predicates. The caller commits.
+    """
+    conn.execute(text(STATIONS_DDL))
+    if postgis_available(conn):
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        conn.execute(text("""
+            ALTER TABLE estaciones ADD COLUMN IF NOT EXISTS geom geometry(Point, 4326)
+            GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint(lon, lat), 4326)) STORED
+        """))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_estaciones_geom ON estaciones USING GIST (geom)"))
+    else:
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_estaciones_lon_lat ON estaciones (lon, lat)"))
+    upsert_stations(conn, DEFAULT_STATIONS, update=False)
+
+def upsert_stations(conn, stations, update=True):
+    """Insert stations by code (updating name/position unless update=False); returns {code: id}"""
+    on_conflict = ("DO UPDATE SET nombre = EXCLUDED.nombre, isla = EXCLUDED.isla, "
+                   "lat = EXCLUDED.lat, lon = EXCLUDED.lon") if update else "DO NOTHING"
+    conn.execute(text(f"""
+        INSERT INTO estaciones (codigo, nombre, isla, lat, lon)
+        VALUES (:code, :name, :island, :lat, :lon)
+        ON CONFLICT (codigo) {on_conflict}
+    """), [{'island': None, **s} for s in stations])
+    return station_ids(conn, [s['code'] for s in stations])
+
+def station_ids(conn, codes=None):
+    """{code: id} for `codes` (all stations if None)"""
+    if codes is None:
+        rows = conn.execute(text("SELECT codigo, id FROM estaciones"))
+    else:
+        rows = conn.execute(text("SELECT codigo, id FROM estaciones WHERE codigo = ANY(:codes)"),
+                            {'codes': list(codes)})
+    return dict(rows.all())
+
+# ============================================================================
+# LOOKUPS
+# ============================================================================
+STATION_COLUMNS = "id, codigo, nombre, isla, lat, lon"
+
+def active_stations(conn):
+    """Stations the ETL should sample, as dicts"""
+    return [dict(row) for row in conn.execute(text(
+        f"SELECT {STATION_COLUMNS} FROM estaciones WHERE activa ORDER BY id"
+    )).mappings()]
+
+def stations_in_bbox(conn, bbox):
+    """Active stations inside (lon_min, lat_min, lon_max, lat_max).
+
+    Uses the GiST index through `&&` when PostGIS is present, otherwise the
+    (lon, lat) B-tree with range predicates.
+    """
+    lon_min, lat_min, lon_max, lat_max = bbox
+    params = {'xmin': lon_min, 'ymin': lat_min, 'xmax': lon_max, 'ymax': lat_max}
+    if has_geometry(conn):
+        where = "geom && ST_MakeEnvelope(:xmin, :ymin, :xmax, :ymax, 4326)"
+    else:
+        where = "lon BETWEEN :xmin AND :xmax AND lat BETWEEN :ymin AND :ymax"
+    return [dict(row) for row in conn.execute(text(f"""
+        SELECT {STATION_COLUMNS}
+        FROM estaciones
+        WHERE activa AND {where}
+        ORDER BY isla, nombre
+    """), params).mappings()]
@@ -0,0 +1,162 @@
+import re
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+from stations import DEFAULT_STATIONS
+
+# ============================================================================
+# STATIONS
+# ============================================================================
+# calima_exposure scales the regional Saharan dust signal (eastern islands get more),
+# calima_lag_h delays it as the plume moves west across the archipelago.
+CALIMA_PROFILE = {
+    'GC-CEN': (1.0, 3), 'GC-LPA': (1.0, 3), 'TF-SCT': (0.85, 6), 'TF-LAG': (0.8, 6),
+    'LZ-ARR': (1.3, 0), 'FV-PRO': (1.35, 0), 'LP-SCP': (0.7, 9), 'LG-SSG': (0.75, 8),
+    'EH-VAL': (0.7, 10),
+}
+
+STATIONS = [
+    dict(station, calima_exposure=CALIMA_PROFILE[station['code']][0],
+         calima_lag_h=CALIMA_PROFILE[station['code']][1])
+    for station in DEFAULT_STATIONS
+]
+
+def make_stations(n_stations, seed=0):
+    """First `n_stations` real station sites, padded with jittered virtual ones"""
+    stations = [dict(s) for s in STATIONS[:n_stations]]
+    rng = np.random.default_rng(seed)
+    for i in range(len(stations), n_stations):
+        base = STATIONS[i % len(STATIONS)]
+        stations.append({
+            'code': f"{base['code']}-{i:03d}",
+            'name': f"{base['name']} #{i}",
+            'island': base['island'],
+            'lat': base['lat'] + rng.normal(0, 0.05),
+            'lon': base['lon'] + rng.normal(0, 0.05),
+            'calima_exposure': base['calima_exposure'] * rng.uniform(0.9, 1.1),
+            'calima_lag_h': base['calima_lag_h']
+        })
+    return stations
+
+# ============================================================================
+# SCALES
+# ============================================================================
+_SCALE_UNITS = {'h': 1, 'd': 24, 'w': 24 * 7, 'm': 24 * 30, 'y': 24 * 365}
+
+def parse_scale(scale):
+    """'48h', '7d', '6m', '1y', '30y' -> number of hourly samples"""
+    match = re.fullmatch(r"\s*(\d+)\s*([hdwmy])\s*", str(scale).lower())
+    if not match:
+        raise ValueError(f"Invalid scale '{scale}' (use e.g. 48h, 7d, 1y)")
+    return int(match.group(1)) * _SCALE_UNITS[match.group(2)]
+
+# ============================================================================
+# GENERATOR
+# ============================================================================
+def _calima_episodes(rng, hours, start, per_year):
+    """Regional dust episodes as (start_hour, duration_h, peak_µg/m³).
+
+    Starts follow a Poisson process, seasonally weighted towards the winter
+    (Dec-Mar) and midsummer (Jul-Aug) calima seasons.
+    """
+    months = (pd.date_range(start, periods=hours, freq='h').month.to_numpy())
+    season = np.where(np.isin(months, [12, 1, 2, 3]), 1.6,
+                      np.where(np.isin(months, [7, 8]), 1.3, 0.5))
+    rate = per_year / (24 * 365) * season / season.mean()
+    starts = np.flatnonzero(rng.random(hours) < rate)
+    durations = rng.integers(24, 121, size=len(starts))
+    peaks = rng.lognormal(mean=np.log(150), sigma=0.6, size=len(starts))
+    return list(zip(starts, durations, peaks))
+
+def _ar1(rng, n, phi=0.9):
+    """Unit-variance AR(1) noise, vectorized with a linear filter"""
+    return lfilter([np.sqrt(1 - phi ** 2)], [1, -phi], rng.standard_normal(n))
+
+def generate_measurements(scale='7d', n_stations=1, start=None, seed=0,
+                          calima_per_year=10, gap_rate=0.005, outages_per_year=6,
+                          outlier_rate=0.001):
+    """Realistic hourly PM10 / PM2.5 / dust series for `n_stations` stations.
+
+    Background levels follow daily (traffic) and seasonal cycles with AR(1)
+    noise; shared calima episodes add dust scaled by each station's exposure.
+    Gaps are modelled as isolated nulls plus multi-hour outages (rows dropped),
+    and outliers as sensor spikes and negative glitches. The regional episodes
+    are returned in ``df.attrs['calima_episodes']`` as (start, end) timestamps,
+    the station metadata in ``df.attrs['stations']``.
+    """
+    hours = parse_scale(scale) if isinstance(scale, str) else int(scale)
+    rng = np.random.default_rng(seed)
+    if start is None:
+        start = (datetime.now() - timedelta(hours=hours)).replace(minute=0, second=0, microsecond=0)
+    fechas = pd.date_range(start, periods=hours, freq='h')
+    hour_of_day = fechas.hour.to_numpy()
+    day_of_year = fechas.dayofyear.to_numpy()
+
+    episodes = _calima_episodes(rng, hours, start, calima_per_year)
+    calima = np.zeros(hours + 24)
+    for ep_start, duration, peak in episodes:
+        phase = np.arange(duration) / duration
+        end = min(ep_start + duration, hours)
+        calima[ep_start:end] += (peak * np.sin(np.pi * phase) ** 2)[:end - ep_start]
+
+    # Two traffic peaks (08h, 20h) and a mild winter maximum
+    diurnal = np.exp(-((hour_of_day - 8) ** 2) / 8) + 0.8 * np.exp(-((hour_of_day - 20) ** 2) / 8)
+    seasonal = 1 + 0.15 * np.cos(2 * np.pi * (day_of_year - 15) / 365)
+
+    stations = make_stations(n_stations, seed)
+    frames = []
+    for station in stations:
+        lag = station['calima_lag_h']
+        dust_event = np.roll(calima, lag)[:hours] * station['calima_exposure']
+        dust = (rng.lognormal(np.log(6), 0.5, hours)
+                + dust_event * rng.lognormal(0, 0.15, hours))
+        base = (14 + 6 * diurnal) * seasonal + 4 * _ar1(rng, hours)
+        pm10 = np.clip(base + 0.85 * dust, 0, None)
+        pm2_5 = np.clip(0.45 * base + 0.2 * dust + 1.5 * _ar1(rng, hours), 0, None)
+
+        values = np.column_stack([pm10, pm2_5, dust])
+
+        # Outliers: spikes ×5-20 and negative glitches
+        spikes = rng.random(values.shape) < outlier_rate
+        values[spikes] *= rng.uniform(5, 20, spikes.sum())
+        glitches = rng.random(values.shape) < outlier_rate / 4
+        values[glitches] = -rng.uniform(1, 10, glitches.sum())
+
+        # Isolated missing values
+        values[rng.random(values.shape) < gap_rate] = np.nan
+
+        # Outages: whole hours missing (rows never reach the database)
+        keep = np.ones(hours, dtype=bool)
+        n_outages = rng.poisson(outages_per_year * hours / (24 * 365))
+        for out_start, out_len in zip(rng.integers(0, hours, n_outages), rng.integers(2, 49, n_outages)):
+            keep[out_start:out_start + out_len] = False
+
+        frames.append(pd.DataFrame({
+            'station_code': station['code'],
+            'fecha': fechas[keep],
+            'pm10': values[keep, 0],
+            'pm2_5': values[keep, 1],
+            'dust': values[keep, 2]
+        }))
+
+    df = pd.concat(frames, ignore_index=True)
+    df['station_code'] = df['station_code'].astype('category')
+    df.attrs['stations'] = stations
+    df.attrs['calima_episodes'] = [
+        (fechas[s], fechas[min(s + d, hours) - 1]) for s, d, _ in episodes
+    ]
+    return df
+
+def to_api_payload(df):
+    """Open-Meteo air-quality style JSON for one station's rows"""
+    return {
+        'hourly': {
+            'time': df['fecha'].dt.strftime('%Y-%m-%dT%H:%M').tolist(),
+            'pm10': [None if np.isnan(v) else v for v in df['pm10'].to_numpy()],
+            'pm2_5': [None if np.isnan(v) else v for v in df['pm2_5'].to_numpy()],
+            'dust': [None if np.isnan(v) else v for v in df['dust'].to_numpy()]
+        }
+    }
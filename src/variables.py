@@ -0,0 +1,104 @@
+import json
+import os
+import re
+
+from sqlalchemy import text
+
+# ============================================================================
+# CATALOG
+# ============================================================================
+# Every hourly variable of the Open-Meteo air-quality API that the pipeline
+# knows how to store. `name` is both the API variable and the column of
+# mediciones_aire; `scale_max` is the upper end of the map colour scale.
+CATALOG = {
+    'pm10': {'label': 'PM10', 'unit': 'µg/m³', 'scale_max': 150},
+    'pm2_5': {'label': 'PM2.5', 'unit': 'µg/m³', 'scale_max': 75},
+    'dust': {'label': 'Dust', 'unit': 'µg/m³', 'scale_max': 300},
+    'ozone': {'label': 'O₃', 'unit': 'µg/m³', 'scale_max': 180},
+    'nitrogen_dioxide': {'label': 'NO₂', 'unit': 'µg/m³', 'scale_max': 200},
+    'sulphur_dioxide': {'label': 'SO₂', 'unit': 'µg/m³', 'scale_max': 350},
+    'carbon_monoxide': {'label': 'CO', 'unit': 'µg/m³', 'scale_max': 10000},
+    'ammonia': {'label': 'NH₃', 'unit': 'µg/m³', 'scale_max': 100},
+    'aerosol_optical_depth': {'label': 'AOD', 'unit': '', 'scale_max': 1},
+    'uv_index': {'label': 'UV Index', 'unit': '', 'scale_max': 11},
+    'european_aqi': {'label': 'European AQI', 'unit': '', 'scale_max': 100},
+}
+
+# Headline metrics, alerts, forecasts and the time series layout are built on these
+CORE_VARIABLES = ('pm10', 'pm2_5', 'dust')
+VARIABLE_KEYS = ('name', 'label', 'unit')
+_IDENTIFIER = re.compile(r'^[a-z][a-z0-9_]{0,62}$')
+
+def load_variables(path=None):
+    """Ingested variables from the JSON list at `path` / $VARIABLES_FILE, or CORE_VARIABLES.
+
+    Items are catalog names ("ozone") or full entries ({"name", "label",
+    "unit"[, "scale_max"]}) for variables the catalog doesn't list yet.
+    """
+    path = path or os.getenv('VARIABLES_FILE')
+    items = list(CORE_VARIABLES)
+    if path:
+        with open(path) as f:
+            items = json.load(f)
+
+    variables = []
+    for item in items:
+        if isinstance(item, str):
+            if item not in CATALOG:
+                raise ValueError(f"Unknown variable '{item}': add its label and unit to the entry")
+            item = {'name': item, **CATALOG[item]}
+        missing = [key for key in VARIABLE_KEYS if key not in item]
+        if missing:
+            raise ValueError(f"Variable {item.get('name', '?')} is missing {missing}")
+        if not _IDENTIFIER.match(item['name']):
+            raise ValueError(f"Variable name '{item['name']}' is not a valid column name")
+        variables.append({'scale_max': 100, **item})
+
+    names = [v['name'] for v in variables]
+    missing = [name for name in CORE_VARIABLES if name not in names]
+    if missing:
+        raise ValueError(f"The variable list must include {missing}")
+    if len(set(names)) != len(names):
+        raise ValueError("Duplicate variable names")
+    return variables
+
+VARIABLES = load_variables()
+NAMES = tuple(v['name'] for v in VARIABLES)
+BY_NAME = {v['name']: v for v in VARIABLES}
+# Every column name a variable can have (configured here or in the catalog)
+KNOWN = NAMES + tuple(name for name in CATALOG if name not in NAMES)
+
+def label(name):
+    """Display label with unit, e.g. 'PM10 (µg/m³)'"""
+    variable = BY_NAME.get(name) or CATALOG.get(name) or {'label': name.upper(), 'unit': ''}
+    return f"{variable['label']} ({variable['unit']})" if variable['unit'] else variable['label']
+
+# ============================================================================
+# SCHEMA EVOLUTION
+# ============================================================================
+def ensure_columns(conn, table='mediciones_aire', names=NAMES, sql_type='FLOAT'):
+    """Add a `sql_type` column per variable missing from `table` (idempotent). The caller commits.
+
+    Only missing columns are altered (the ALTER lock is skipped on every
+    other run), and ADD COLUMN without a default is a catalog-only change in
+    Postgres, so enabling a variable never rewrites the table.
+    """
+    existing = _columns(conn, table)
+    for name in names:
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {name} {sql_type}"))
+
+def _columns(conn, table):
+    return {row[0] for row in conn.execute(text("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = :table
+    """), {'table': table})}
+
+def stored_variables(conn, table='mediciones_aire'):
+    """Known variables (catalog or configured) that exist as columns of `table`.
+
+    This is how the dashboard discovers what the ETL has been ingesting,
+    whatever its own VARIABLES_FILE says.
+    """
+    columns = _columns(conn, table)
+    return tuple(name for name in KNOWN if name in columns)
@@ -0,0 +1,456 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from alerts import thresholds as alert_thresholds
+from analytics import rolling_mean
+from variables import CATALOG, KNOWN, BY_NAME, label
+
+# scipy.stats, plotly.express, plotly.subplots and pydeck are imported inside
+# the builders that use them: together they are most of the dashboard's import
+# time, and none is needed to paint the header and headline metrics.
+
+# ============================================================================
+# ENGINEERING VISUALIZATION COMPONENTS
+# ============================================================================
+class EngineeringVisualizations:
+    """Professional Engineering Visualizations"""
+    
+    # Above this many points per trace, SVG rendering stalls the browser: switch to WebGL
+    WEBGL_THRESHOLD = 2000
+    
+    @staticmethod
+    def scatter_trace(n_points):
+        """Pick the Scatter trace type for the number of points to draw"""
+        if n_points > EngineeringVisualizations.WEBGL_THRESHOLD:
+            return go.Scattergl
+        return go.Scatter
+    
+    @staticmethod
+    def variable_columns(df):
+        """Catalog variables present in `df` that hold any data, core ones first"""
+        return [col for col in KNOWN if col in df.columns and df[col].notna().any()]
+    
+    @staticmethod
+    def ascending(df):
+        """`df` in time order: a reversed view for the newest-first dashboard frame, no sort copy"""
+        if df['fecha'].is_monotonic_increasing:
+            return df
+        if df['fecha'].is_monotonic_decreasing:
+            return df.iloc[::-1]
+        return df.sort_values('fecha')
+    
+    @staticmethod
+    def create_timeseries_engineering(df, title="Time Series Analysis", thresholds=None, forecast=None, normal=None):
+        """Create professional time series plot with engineering annotations.
+        
+        `thresholds` ({variable: µg/m³}) defaults to the alert rules' entry levels;
+        `forecast` (variable, fecha, yhat, lower, upper rows) is overlaid with its band;
+        `normal` (variable, mes, hora, mean, std rows, the ETL climatology) draws
+        each hour's usual level ± 1 std behind the readings.
+        """
+        from plotly.subplots import make_subplots
+        
+        thresholds = thresholds or alert_thresholds()
+        df = EngineeringVisualizations.ascending(df)
+        Scatter = EngineeringVisualizations.scatter_trace(len(df))
+        
+        fig = make_subplots(
+            rows=3, cols=1,
+            shared_xaxes=True,
+            vertical_spacing=0.08,
+            subplot_titles=("PM10 Concentration", "PM2.5 Concentration", "Dust Particles"),
+            row_heights=[0.4, 0.3, 0.3]
+        )
+        
+        # PM10 (the moving average is a separate array: the input frame is never modified)
+        window = min(12, len(df))
+        pm10_ma = rolling_mean(df['pm10'].to_numpy(), window) if window > 1 else None
+        
+        fig.add_trace(
+            Scatter(x=df['fecha'], y=df['pm10'], 
+                      name='PM10', line=dict(color='#4299e1', width=2),
+                      mode='lines', fill='tozeroy',
+                      fillcolor='rgba(66, 153, 225, 0.1)'),
+            row=1, col=1
+        )
+        
+        if pm10_ma is not None:
+            fig.add_trace(
+                Scatter(x=df['fecha'], y=pm10_ma,
+                          name=f'MA{window}', line=dict(color='#ecc94b', width=1.5, dash='dash')),
+                row=1, col=1
+            )
+        
+        # PM2.5
+        fig.add_trace(
+            Scatter(x=df['fecha'], y=df['pm2_5'],
+                      name='PM2.5', line=dict(color='#38b2ac', width=2)),
+            row=2, col=1
+        )
+        
+        # Dust
+        fig.add_trace(
+            Scatter(x=df['fecha'], y=df['dust'],
+                      name='Dust', line=dict(color='#ed8936', width=2)),
+            row=3, col=1
+        )
+        
+        # Normal overlay: the climatology cell of each plotted hour, looked up by (month, hour)
+        if normal is not None and not normal.empty:
+            cells = pd.MultiIndex.from_arrays([df['fecha'].dt.month, df['fecha'].dt.hour])
+            for row, variable in enumerate(('pm10', 'pm2_5', 'dust'), start=1):
+                cell = normal[normal['variable'] == variable].set_index(['mes', 'hora']).reindex(cells)
+                if cell['mean'].isna().all():
+                    continue
+                mean, std = cell['mean'].to_numpy(), cell['std'].fillna(0).to_numpy()
+                fig.add_trace(
+                    Scatter(x=df['fecha'], y=mean + std, mode='lines', line=dict(width=0),
+                            showlegend=False, hoverinfo='skip'),
+                    row=row, col=1
+                )
+                fig.add_trace(
+                    Scatter(x=df['fecha'], y=np.clip(mean - std, 0, None), mode='lines', line=dict(width=0),
+                            fill='tonexty', fillcolor='rgba(160, 174, 192, 0.12)',
+                            name=f"{CATALOG[variable]['label']} normal ±1σ", hoverinfo='skip'),
+                    row=row, col=1
+                )
+                fig.add_trace(
+                    Scatter(x=df['fecha'], y=mean, mode='lines',
+                            name=f"{CATALOG[variable]['label']} normal", line=dict(color='#a0aec0', width=1, dash='dot')),
+                    row=row, col=1
+                )
+        
+        # Forecast overlay: band (upper, then lower filled up to it) and dashed mean
+        if forecast is not None and not forecast.empty:
+            for row, variable, color in ((1, 'pm10', '66, 153, 225'), (3, 'dust', '237, 137, 54')):
+                fc = forecast[forecast['variable'] == variable]
+                if fc.empty:
+                    continue
+                fig.add_trace(
+                    go.Scatter(x=fc['fecha'], y=fc['upper'], mode='lines', line=dict(width=0),
+                               showlegend=False, hoverinfo='skip'),
+                    row=row, col=1
+                )
+                fig.add_trace(
+                    go.Scatter(x=fc['fecha'], y=fc['lower'], mode='lines', line=dict(width=0),
+                               fill='tonexty', fillcolor=f'rgba({color}, 0.15)',
+                               name=f'{variable.upper()} 95% band', hoverinfo='skip'),
+                    row=row, col=1
+                )
+                fig.add_trace(
+                    go.Scatter(x=fc['fecha'], y=fc['yhat'], mode='lines',
+                               name=f'{variable.upper()} forecast', line=dict(color=f'rgb({color})', width=2, dash='dash')),
+                    row=row, col=1
+                )
+        
+        # Add threshold lines
+        for row, variable in enumerate(('pm10', 'pm2_5', 'dust'), start=1):
+            if variable in thresholds:
+                fig.add_hline(y=thresholds[variable], line_dash="dot",
+                             line_color="rgba(239, 68, 68, 0.7)", row=row, col=1,
+                             annotation_text=f"Threshold: {thresholds[variable]} µg/m³",
+                             annotation_position="top right",
+                             annotation_font_color="#ffffff")
+        
+        fig.update_layout(
+            height=800,
+            title=dict(text=title, font=dict(size=20, color='#ffffff')),
+            paper_bgcolor='#0a0e17',
+            plot_bgcolor='#0a0e17',
+            font=dict(color='#ffffff'),
+            margin=dict(l=50, r=30, t=80, b=50),
+            showlegend=True,
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1,
+                bgcolor="rgba(26, 31, 53, 0.9)",
+                bordercolor="#2d3748",
+                font=dict(color="#ffffff")
+            )
+        )
+        
+        # Update axis labels color
+        fig.update_xaxes(color='#ffffff', gridcolor='#2d3748', zerolinecolor='#2d3748')
+        fig.update_yaxes(color='#ffffff', gridcolor='#2d3748', zerolinecolor='#2d3748')
+        
+        return fig
+    
+    @staticmethod
+    def create_correlation_matrix(df):
+        """Create engineering correlation matrix with statistical significance"""
+        from scipy import stats
+        
+        available_cols = EngineeringVisualizations.variable_columns(df)
+        
+        if len(available_cols) < 2:
+            fig = go.Figure()
+            fig.add_annotation(text="Insufficient data for correlation matrix", 
+                             font=dict(color="#ffffff", size=16))
+            fig.update_layout(paper_bgcolor='#0a0e17', plot_bgcolor='#0a0e17')
+            return fig
+        
+        corr_matrix = df[available_cols].corr(method='pearson')
+        
+        n = len(df)
+        p_values = pd.DataFrame(index=corr_matrix.index, columns=corr_matrix.columns)
+        
+        for i in corr_matrix.index:
+            for j in corr_matrix.columns:
+                if i == j:
+                    p_values.loc[i, j] = 0
+                else:
+                    corr = corr_matrix.loc[i, j]
+                    if np.isnan(corr):
+                        p_values.loc[i, j] = np.nan
+                    else:
+                        t_stat = corr * np.sqrt((n-2)/(1-corr**2))
+                        p_val = 2 * (1 - stats.t.cdf(abs(t_stat), n-2))
+                        p_values.loc[i, j] = p_val
+        
+        # CORRECCIÓN: Eliminado el parámetro inválido titlefont
+        fig = go.Figure(data=go.Heatmap(
+            z=corr_matrix.values,
+            x=corr_matrix.columns,
+            y=corr_matrix.index,
+            colorscale='RdBu',
+            zmin=-1, zmax=1,
+            text=corr_matrix.round(3).astype(str) + "<br>p=" + p_values.round(4).astype(str),
+            texttemplate='%{text}',
+            textfont=dict(size=12, color="#000000"),
+            hoverongaps=False,
+            colorbar=dict(
+                title="Correlation",
+                tickfont=dict(color='#ffffff')
+            )
+        ))
+        
+        fig.update_layout(
+            title=dict(
+                text="Correlation Matrix with Statistical Significance",
+                font=dict(color='#ffffff', size=16)
+            ),
+            height=500,
+            paper_bgcolor='#0a0e17',
+            plot_bgcolor='#0a0e17',
+            font=dict(color='#ffffff'),
+            xaxis=dict(tickangle=45, tickfont=dict(color="#ffffff")),
+            yaxis=dict(tickfont=dict(color="#ffffff")),
+            margin=dict(l=50, r=50, t=80, b=50)
+        )
+        
+        return fig
+    
+    @staticmethod
+    def create_distribution_analysis(df):
+        """Create comprehensive distribution analysis"""
+        from plotly.subplots import make_subplots
+        from scipy import stats
+        
+        variables = EngineeringVisualizations.variable_columns(df) or ['pm10', 'pm2_5', 'dust']
+        names = [BY_NAME.get(var, CATALOG.get(var, {'label': var.upper()}))['label'] for var in variables]
+        fig = make_subplots(
+            rows=2, cols=len(variables),
+            subplot_titles=[f"{name} Distribution" for name in names] + [f"{name} Q-Q Plot" for name in names],
+            vertical_spacing=0.12,
+            horizontal_spacing=0.24 / len(variables)
+        )
+        
+        palette = ['#4299e1', '#38b2ac', '#ed8936', '#9f7aea', '#f56565', '#ecc94b', '#48bb78', '#ed64a6']
+        colors = [palette[i % len(palette)] for i in range(len(variables))]
+        Scatter = EngineeringVisualizations.scatter_trace(len(df))
+        
+        for i, (var, color) in enumerate(zip(variables, colors), 1):
+            if var not in df.columns or df[var].isna().all():
+                continue
+                
+            # Histogram
+            fig.add_trace(
+                go.Histogram(
+                    x=df[var].dropna(), 
+                    name=var.upper(),
+                    marker_color=color,
+                    opacity=0.7,
+                    nbinsx=30,
+                    histnorm='probability density'
+                ),
+                row=1, col=i
+            )
+            
+            # Add KDE curve
+            try:
+                kde = stats.gaussian_kde(df[var].dropna())
+                x_range = np.linspace(df[var].min(), df[var].max(), 100)
+                fig.add_trace(
+                    go.Scatter(
+                        x=x_range, 
+                        y=kde(x_range),
+                        mode='lines',
+                        line=dict(color='white', width=2),
+                        showlegend=False
+                    ),
+                    row=1, col=i
+                )
+            except:
+                pass
+        
+        # Q-Q Plots
+        for i, (var, color) in enumerate(zip(variables, colors), 1):
+            if var not in df.columns or df[var].isna().all():
+                continue
+                
+            data = df[var].dropna()
+            if len(data) > 0:
+                try:
+                    (osm, osr), (slope, intercept, r) = stats.probplot(data, dist="norm")
+                    
+                    fig.add_trace(
+                        Scatter(
+                            x=osm, y=osr,
+                            mode='markers',
+                            marker=dict(color=color, size=6),
+                            name=f'{var.upper()} Q-Q'
+                        ),
+                        row=2, col=i
+                    )
+                    
+                    # Add theoretical line (straight, so its two endpoints are enough)
+                    line_x = np.array([osm[0], osm[-1]])
+                    fig.add_trace(
+                        go.Scatter(
+                            x=line_x, y=slope*line_x + intercept,
+                            mode='lines',
+                            line=dict(color='white', dash='dash', width=2),
+                            showlegend=False
+                        ),
+                        row=2, col=i
+                    )
+                except:
+                    pass
+        
+        fig.update_layout(
+            height=800,
+            paper_bgcolor='#0a0e17',
+            plot_bgcolor='#0a0e17',
+            font=dict(color='#ffffff'),
+            showlegend=False,
+            margin=dict(l=50, r=50, t=80, b=50)
+        )
+        
+        # Update all axis colors
+        for i in range(1, 3):
+            for j in range(1, len(variables) + 1):
+                fig.update_xaxes(row=i, col=j, color='#ffffff', gridcolor='#2d3748', zerolinecolor='#2d3748')
+                fig.update_yaxes(row=i, col=j, color='#ffffff', gridcolor='#2d3748', zerolinecolor='#2d3748')
+        
+        return fig
+    
+    @staticmethod
+    def create_scatter_matrix(df):
+        """Create professional scatter matrix with regression lines"""
+        import plotly.express as px
+        
+        available_vars = EngineeringVisualizations.variable_columns(df)
+        
+        if len(available_vars) < 2:
+            fig = go.Figure()
+            fig.add_annotation(text="Insufficient data for scatter matrix",
+                             font=dict(color="#ffffff", size=16))
+            fig.update_layout(paper_bgcolor='#0a0e17', plot_bgcolor='#0a0e17')
+            return fig
+            
+        fig = px.scatter_matrix(
+            df,
+            dimensions=available_vars,
+            color='pm10' if 'pm10' in df.columns else available_vars[0],
+            color_continuous_scale='Viridis',
+            title="Scatter Matrix with Density Estimates",
+            labels={col: label(col) for col in available_vars}
+        )
+        
+        # CORRECCIÓN: Usar dict correcto para colorbar
+        fig.update_layout(
+            height=800,
+            paper_bgcolor='#0a0e17',
+            plot_bgcolor='#0a0e17',
+            font=dict(color='#ffffff'),
+            margin=dict(l=50, r=50, t=80, b=50)
+        )
+        
+        # Actualizar colorbar correctamente
+        fig.update_coloraxes(
+            colorbar=dict(
+                title="PM10 Value",
+                tickfont=dict(color='#ffffff')
+            )
+        )
+        
+        # Update axis colors
+        for annotation in fig.layout.annotations:
+            annotation.font.color = "#ffffff"
+        
+        return fig
+    
+    # Upper end of the map colour scale per variable (from the catalog) and its colour stops
+    MAP_SCALE_MAX = {**{name: v['scale_max'] for name, v in CATALOG.items()},
+                     **{name: v['scale_max'] for name, v in BY_NAME.items()}}
+    MAP_COLOR_STOPS = np.array([
+        [56, 161, 105],     # green
+        [214, 158, 46],     # yellow
+        [237, 137, 54],     # orange
+        [229, 62, 62],      # red
+        [128, 90, 213]      # purple
+    ])
+    
+    @staticmethod
+    def value_colors(values, vmax):
+        """RGB (n, 3) uint8 colours of `values` on the green-to-purple scale [0, vmax]"""
+        stops = EngineeringVisualizations.MAP_COLOR_STOPS
+        positions = np.linspace(0, 1, len(stops))
+        scaled = np.clip(np.nan_to_num(values, nan=0.0) / vmax, 0, 1)
+        return np.column_stack([
+            np.interp(scaled, positions, stops[:, channel]) for channel in range(3)
+        ]).astype(np.uint8)
+    
+    @staticmethod
+    def create_surface_map(lon, lat, surface, cell_size_m, stations, variable):
+        """pydeck map of one interpolated surface with the station readings on top"""
+        import pydeck as pdk
+        
+        vmax = EngineeringVisualizations.MAP_SCALE_MAX.get(variable, 100)
+        keep = ~np.isnan(surface)
+        cells = pd.DataFrame({'lon': lon[keep], 'lat': lat[keep], 'value': np.round(surface[keep], 1)})
+        cells[['r', 'g', 'b']] = EngineeringVisualizations.value_colors(cells['value'].to_numpy(), vmax)
+        
+        stations = stations.assign(value=stations['value'].round(1))
+        stations[['r', 'g', 'b']] = EngineeringVisualizations.value_colors(stations['value'].to_numpy(), vmax)
+        
+        layers = [
+            pdk.Layer(
+                'GridCellLayer', data=cells,
+                get_position='[lon, lat]', cell_size=cell_size_m,
+                get_fill_color='[r, g, b, 150]', extruded=False, pickable=True
+            ),
+            pdk.Layer(
+                'ScatterplotLayer', data=stations,
+                get_position='[lon, lat]', get_radius=2500, radius_min_pixels=5,
+                get_fill_color='[r, g, b, 255]', get_line_color=[255, 255, 255],
+                stroked=True, line_width_min_pixels=2, pickable=True
+            )
+        ]
+        span = float(lon.max() - lon.min()) if len(lon) else 0.0
+        view = pdk.ViewState(
+            longitude=float(stations['lon'].mean()),
+            latitude=float(stations['lat'].mean()),
+            zoom=7 if span > 2 else 9
+        )
+        return pdk.Deck(
+            layers=layers,
+            initial_view_state=view,
+            map_provider='carto',
+            map_style='dark',
+            tooltip={'text': f"{variable.upper()}: {{value}} µg/m³"}
+        )
@@ -0,0 +1,98 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from alerts import evaluate_alerts, new_state, step_rule
+
+RULE = {'name': 'test_calima', 'variable': 'dust', 'level': 'Warning', 'on': 100, 'off': 60, 'min_hours': 3}
+T0 = datetime(2099, 1, 1)
+DATABASE_URL = os.getenv('TEST_DATABASE_URL')  # A scratch Postgres; everything is rolled back
+
+
+def hours(*offsets):
+    return [T0 + timedelta(hours=h) for h in offsets]
+
+
+def run(fechas, values, state=None):
+    """{started_at: (ended_at, peak)} of the episodes, with the state carried as the ETL stores it"""
+    state = state if state is not None else new_state()
+    episodes, current = step_rule(RULE, state, fechas, values)
+    if current is not None:
+        state['event_id'] = current['event_id'] or -1  # _save_episodes gives it an id
+    return {e['started_at']: (e['ended_at'], e['peak']) for e in episodes}, state
+
+
+def test_split_batches_match_a_single_batch():
+    values = [50, 120, 130, 150, 90, None, 110, 55, 120, 120, None, 120, 120, 120, 70, 40]
+    fechas = hours(*range(len(values)))
+    whole, whole_state = run(fechas, values)
+    assert whole == {hours(1)[0]: (hours(7)[0], 150), hours(11)[0]: (hours(15)[0], 120)}
+
+    for split in range(1, len(values)):
+        episodes, state = run(fechas[:split], values[:split])
+        later, state = run(fechas[split:], values[split:], state)
+        episodes.update(later)
+        assert episodes == whole, split
+        assert {k: v for k, v in state.items() if k != 'event_id'} == \
+               {k: v for k, v in whole_state.items() if k != 'event_id'}, split
+
+
+def test_missing_or_skipped_hour_resets_the_candidate():
+    assert run(hours(0, 1, 2, 3, 4), [120, 120, None, 120, 120])[0] == {}
+    assert run(hours(0, 1, 3, 4), [120, 120, 120, 120])[0] == {}
+    assert run(hours(0, 1, 2, 3, 4), [120, None, 120, 120, 120])[0] == {hours(2)[0]: (None, 120)}
+
+    # Across batches too: the stored candidate does not survive a missing reading
+    _, state = run(hours(0, 1), [120, 120])
+    assert state['candidate_since'] == hours(0)[0]
+    assert run(hours(2, 3), [None, 120], state)[0] == {}
+    assert state['candidate_since'] == hours(3)[0]
+
+
+def test_missing_hours_keep_an_open_episode():
+    episodes, state = run(hours(0, 1, 2, 3, 6), [120, 120, 120, None, 80])
+    assert episodes == {hours(0)[0]: (None, 120)}
+    assert run(hours(7), [50], state)[0] == {hours(0)[0]: (hours(7)[0], 120)}
+
+
+@pytest.mark.skipif(not DATABASE_URL, reason="set TEST_DATABASE_URL to a scratch Postgres")
+def test_late_chunk_rewinds_an_open_episode():
+    from sqlalchemy import create_engine, text
+    from coordination import complete, record_load
+    from schema import ensure_schema
+
+    engine = create_engine(DATABASE_URL)
+    ensure_schema(engine)
+    with engine.connect() as conn:
+        try:
+            station_id = conn.execute(text("""
+                INSERT INTO estaciones (codigo, nombre, lat, lon) VALUES ('TEST-ALERTS', 'Test', 0, 0) RETURNING id
+            """)).scalar()
+
+            def load(readings):
+                fechas = sorted(readings)
+                job_ids, carga = record_load(conn, {station_id: (fechas[0].date(), fechas[-1].date())})
+                conn.execute(text("""
+                    INSERT INTO mediciones_aire (station_id, fecha, dust, carga) VALUES (:station_id, :fecha, :dust, :carga)
+                """), [{'station_id': station_id, 'fecha': f, 'dust': v, 'carga': carga} for f, v in readings.items()])
+                complete(conn, job_ids, len(readings), carga)
+                return job_ids
+
+            def episodes():
+                return conn.execute(text("""
+                    SELECT started_at, ended_at FROM eventos_alerta
+                    WHERE rule = :rule AND station_id = :station_id ORDER BY started_at
+                """), {'rule': RULE['name'], 'station_id': station_id}).all()
+
+            # Hours 3-5 are still missing: the episode opened at 0 stays open through them
+            evaluate_alerts(conn, [RULE], [station_id], load(dict(zip(hours(0, 1, 2, 6, 7, 8), [120] * 6))))
+            assert episodes() == [(hours(0)[0], None)]
+
+            # They arrive late and below `off`: the rule rewinds and replays from before hour 0
+            changes = evaluate_alerts(conn, [RULE], [station_id], load(dict(zip(hours(3, 4, 5), [30] * 3))))
+            assert episodes() == [(hours(0)[0], hours(3)[0]), (hours(6)[0], None)]
+            assert sorted((c['started_at'], c['ended_at']) for c in changes) == episodes()
+        finally:
+            conn.rollback()
+    engine.dispose()
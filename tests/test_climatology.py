@@ -0,0 +1,54 @@
+import numpy as np
+
+from climatology import MIN_SAMPLES, batch_stats, merge_stats, z_scores
+
+
+def summary(cells, values, n_cells):
+    return batch_stats(np.asarray(cells, dtype=np.int64), np.asarray(values, dtype=float), n_cells)
+
+
+def test_merged_batches_match_the_concatenated_data():
+    rng = np.random.default_rng(0)
+    cells = rng.integers(0, 4, size=500)
+    values = rng.normal(50, 12, size=(500, 2))
+    values[rng.random(values.shape) < 0.1] = np.nan
+
+    merged = summary(cells[:0], values[:0], 4)
+    for part in np.array_split(np.arange(500), [37, 38, 210, 499]):
+        merged = merge_stats(merged, summary(cells[part], values[part], 4))
+    n, mean, m2 = merged
+
+    for cell in range(4):
+        for j in range(2):
+            sample = values[cells == cell, j]
+            sample = sample[~np.isnan(sample)]
+            assert n[cell, j] == len(sample)
+            np.testing.assert_allclose(mean[cell, j], np.mean(sample))
+            np.testing.assert_allclose(m2[cell, j] / (n[cell, j] - 1), np.var(sample, ddof=1))
+
+
+def test_missing_values_and_empty_cells():
+    cells = [0, 0, 0, 2]
+    values = [[1.0, np.nan], [3.0, np.nan], [np.nan, np.nan], [5.0, 7.0]]
+    n, mean, m2 = summary(cells, values, 3)
+
+    np.testing.assert_array_equal(n, [[2, 0], [0, 0], [1, 1]])
+    np.testing.assert_array_equal(mean, [[2.0, 0.0], [0.0, 0.0], [5.0, 7.0]])
+    np.testing.assert_array_equal(m2, [[2.0, 0.0], [0.0, 0.0], [0.0, 0.0]])
+
+    # An empty summary on either side leaves the other unchanged, without NaN
+    empty = summary([], np.empty((0, 2)), 3)
+    for merged in (merge_stats(empty, (n, mean, m2)), merge_stats((n, mean, m2), empty)):
+        for got, expected in zip(merged, (n, mean, m2)):
+            np.testing.assert_array_equal(got, expected)
+
+
+def test_z_scores_skip_young_and_constant_cells():
+    n = np.array([MIN_SAMPLES, MIN_SAMPLES - 1, MIN_SAMPLES])
+    mean = np.array([10.0, 10.0, 10.0])
+    m2 = np.array([4.0 * (MIN_SAMPLES - 1), 4.0 * (MIN_SAMPLES - 2), 0.0])
+
+    z = z_scores(np.array([14.0, 14.0, 14.0]), n, mean, m2)
+
+    np.testing.assert_allclose(z[0], 2.0)
+    assert np.isnan(z[1]) and np.isnan(z[2])